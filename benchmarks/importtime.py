@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+""" Measure the import cost of modules for short-lived command line tools.
+
+Each statement is run in a fresh interpreter with "-X importtime" a number of
+times, and the best cumulative import time of the package and of the whole
+statement is reported along with the number of modules imported.
+
+Usage:
+    python benchmarks/importtime.py [-n RUNS] [STATEMENT ...]
+"""
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+DEFAULT_STATEMENTS = [
+    "import mrbaviirc.common",
+    "import mrbaviirc.common.app",
+    "import mrbaviirc.common.path",
+    "from mrbaviirc.common.app import App\n"
+    "class Tool(App):\n"
+    "    appname = 'tool'\n"
+    "    def main(self): pass\n"
+    "Tool()",
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importtime(statement):
+    """ Return a list of (module, self us, cumulative us) for a statement. """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        part for part in (ROOT, env.get("PYTHONPATH")) if part
+    )
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=env,
+        check=True,
+        universal_newlines=True
+    )
+
+    results = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            results.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+        except ValueError:
+            continue # header line
+
+    return results
+
+
+def measure(statement, runs):
+    """ Return the best (total us, package us, module count) of the runs. """
+    best = None
+    for _ in range(runs):
+        results = importtime(statement)
+        total = sum(selftime for (_, selftime, _) in results)
+        package = sum(
+            selftime for (name, selftime, _) in results
+            if name.startswith("mrbaviirc")
+        )
+        current = (total, package, len(results))
+        if best is None or current < best:
+            best = current
+
+    return best
+
+
+def main():
+    """ Run the benchmark. """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("statements", nargs="*", default=DEFAULT_STATEMENTS)
+    args = parser.parse_args()
+
+    print("{:>10} {:>10} {:>8}  statement".format("total us", "package us", "modules"))
+    for statement in args.statements:
+        (total, package, count) = measure(statement, args.runs)
+        print("{:>10} {:>10} {:>8}  {}".format(
+            total, package, count, statement.splitlines()[0]
+        ))
+
+
+if __name__ == "__main__":
+    main()
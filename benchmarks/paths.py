@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+""" Measure repeated AppPaths property access.
+
+Each property is read a number of times through a cached AppPaths object and
+through the uncached platform path function for comparison.
+
+Usage:
+    python benchmarks/paths.py [-n COUNT]
+"""
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mrbaviirc.common.path import AppPaths # pylint: disable=wrong-import-position
+from mrbaviirc.common import platform # pylint: disable=wrong-import-position
+
+
+PROPERTIES = [
+    ("user_data_dir", "get_user_data_dir", ()),
+    ("sys_data_dirs", "get_sys_data_dirs", (None,)),
+    ("user_config_dir", "get_user_config_dir", ()),
+    ("sys_config_dirs", "get_sys_config_dirs", ()),
+    ("cache_dir", "get_cache_dir", ()),
+]
+
+
+def main():
+    """ Run the benchmark. """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--count", type=int, default=1000000)
+    args = parser.parse_args()
+
+    paths = AppPaths("bench", "1.0", "vendor")
+
+    print("{:<16} {:>12} {:>12}".format("property", "cached s", "uncached s"))
+    for (prop, func_name, extra) in PROPERTIES:
+        func = getattr(platform.path, func_name)
+        cached = min(timeit.repeat(
+            lambda: getattr(paths, prop), number=args.count, repeat=3
+        ))
+        uncached = min(timeit.repeat(
+            lambda: func("bench", "1.0", "vendor", *extra), number=args.count, repeat=3
+        ))
+        print("{:<16} {:>12.3f} {:>12.3f}".format(prop, cached, uncached))
+
+
+if __name__ == "__main__":
+    main()
@@ -21,3 +21,25 @@ if _sys.version_info[0:2] < (3, 5):
 # import our fixups
 from . import _fixups # pylint: disable=wrong-import-position
 del _fixups
+
+
+# Submodules are imported when first accessed as attributes of the package
+_SUBMODULES = frozenset([
+    "app", "codebuilder", "compat", "config", "constants", "diskcache", "functools",
+    "hooks", "imp", "ipc", "logging", "mixin", "overlay", "path", "pattern", "phase",
+    "platform", "prefork", "registry", "sort", "tempdir", "text", "thread", "time",
+    "util", "watch"
+])
+
+
+def __getattr__(name):
+    """ Import a submodule when first accessed (PEP 562). """
+    if name in _SUBMODULES:
+        import importlib
+        return importlib.import_module("." + name, __name__)
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | _SUBMODULES)
@@ -9,17 +9,23 @@ __all__ = ["BaseApp", "App"]
 
 from typing import Optional
 import threading
-from argparse import ArgumentParser
 
-#from .constants import SENTINEL
-from .config import Config
-from .hooks import Hooks
-from .registry import ObjectRegistry
-from .path import AppPaths
+from .constants import SENTINEL
+from .functools import lazy_property
+from .mixin.service import ServiceContainerMixin
 
+# The components are imported when first used to keep short-lived tools fast
 
-class BaseApp:
-    """ The base application oject. """
+
+class BaseApp(ServiceContainerMixin):
+    """ The base application oject.
+
+    Components can add steps to the startup and shutdown phases.  After each
+    phase is run, the `HOOK_PHASE` hook is called with the application, the
+    phase name and a dictionary of the duration in seconds of each step.
+    """
+
+    HOOK_PHASE = "app.phase"
 
     # Initialization
 
@@ -29,19 +35,48 @@ class BaseApp:
             operations, it's really just a place to specify configurations.
         """
 
+        ServiceContainerMixin.__init__(self)
+
         # Create basic components
         self._lock = threading.RLock()
         self._local = threading.local()
         self._main_thread = threading.current_thread()
 
-        # Some common components
-        self.config = Config()
-        self.hooks = Hooks()
-        self.registry = ObjectRegistry()
-
         # Properties we keep access to
         self._paths = None
 
+    # Common components, created when first accessed
+
+    @lazy_property
+    def hooks(self):
+        """ Return the application hooks object. """
+        from .hooks import Hooks
+        return Hooks()
+
+    @lazy_property
+    def config(self):
+        """ Return the application configuration object. """
+        from .config import Config
+        return Config(self.hooks)
+
+    @lazy_property
+    def registry(self):
+        """ Return the application object registry. """
+        from .registry import ObjectRegistry
+        return ObjectRegistry()
+
+    @lazy_property
+    def startup_phase(self):
+        """ Return the startup phase. """
+        from .phase import Phase
+        return Phase("startup")
+
+    @lazy_property
+    def shutdown_phase(self):
+        """ Return the shutdown phase. """
+        from .phase import Phase
+        return Phase("shutdown")
+
     # Properties
 
     @property
@@ -126,7 +161,7 @@ class BaseApp:
         return self.displayname
 
     @property
-    def paths(self) -> AppPaths:
+    def paths(self) -> "AppPaths":
         """ Return the application path object.
 
         Returns
@@ -141,7 +176,7 @@ class BaseApp:
                     self._paths = self.create_paths()
         return self._paths
 
-    def create_paths(self) -> AppPaths:
+    def create_paths(self) -> "AppPaths":
         """ Create the application path object.
 
         Derived classes can override this to return a custom AppPath
@@ -151,19 +186,81 @@ class BaseApp:
         AppPaths
             An instance or derived class of AppPaths
         """
+        from .path import AppPaths
         return AppPaths(self.appname, self.appversion, self.appvendor)
 
     # Execution related methods. """
 
+    def add_startup_step(self, name, func, depends=()):
+        """ Add a step to the startup phase.
+
+        Steps without dependencies between them run concurrently, see `Phase`.
+        """
+        self.startup_phase.add_step(name, func, depends)
+
+    def add_shutdown_step(self, name, func, depends=()):
+        """ Add a step to the shutdown phase.
+
+        Steps without dependencies between them run concurrently, see `Phase`.
+        """
+        self.shutdown_phase.add_step(name, func, depends)
+
+    def run_phase(self, phase: "Phase"):
+        """ Run a phase and report the step durations.
+
+        Parameters
+        ----------
+        phase : Phase
+            The phase to run
+        """
+        try:
+            phase.run()
+        finally:
+            self.hooks.call(self.HOOK_PHASE, self, phase.name, phase.timings)
+
     def startup(self):
         """ Perform startup here. """
+        self.run_phase(self.startup_phase)
 
     def shutdown(self):
         """ Perform shutdown here. """
+        self.run_phase(self.shutdown_phase)
+
+
+_CO_COROUTINE = 0x80 # inspect.CO_COROUTINE, without importing inspect
+
+
+def _is_coroutine_function(func):
+    """ Determine if a function or method is a coroutine function. """
+    code = getattr(func, "__code__", None)
+    return code is not None and bool(code.co_flags & _CO_COROUTINE)
+
+
+async def _call_maybe_async(func):
+    """ Call a function, awaiting the result if it is a coroutine function. """
+    if _is_coroutine_function(func):
+        return await func()
+
+    return func()
 
 
 class App(BaseApp):
-    """ Represent a basic app with argument parsing, etc. """
+    """ Represent a basic app with argument parsing, etc.
+
+    An app may register subcommands, each implemented by a module which is
+    only imported when that command is selected on the command line.  The
+    module must provide a `main(app, args)` function and may provide an
+    `add_arguments(parser)` function to add the command's arguments.
+
+    The startup, main and shutdown methods may be coroutine functions, in
+    which case `execute` runs them on an event loop.
+    """
+
+    # Called to create the event loop if set, such as uvloop.new_event_loop
+    event_loop_factory = None
+
+    # The number of threads of the event loop's default executor if set
+    executor_workers = None
 
     def __init__(self):
         """ Initialize the app object. """
@@ -171,6 +268,59 @@ class App(BaseApp):
         BaseApp.__init__(self)
 
         self.args = None # result of command line argument parsing
+        self.command = None # name of the selected subcommand if any
+        self.worker_index = None # index of the worker process if pre-forked
+        self._main_task = None
+        self._commands = {}
+
+    # Subcommand related
+
+    def register_command(self, name, module, help=None, package=None):
+        # pylint: disable=redefined-builtin
+        """ Register a subcommand.
+
+        Parameters
+        ----------
+        name : str
+            The name of the command on the command line
+        module : str
+            The name of the module implementing the command
+        help : Optional[str], default=None
+            The help text shown in the command list.  This is used without
+            importing the module.
+        package : Optional[str], default=None
+            The package used to resolve a relative module name
+        """
+        self._commands[name] = [module, help, package, None]
+
+    def load_command(self, name):
+        """ Import and return the module of a subcommand. """
+        entry = self._commands[name]
+        if entry[3] is None:
+            import importlib
+            entry[3] = importlib.import_module(entry[0], entry[2])
+        return entry[3]
+
+    def _add_command_parsers(self, parser, selected=SENTINEL):
+        """ Add a parser for each command, with arguments for only the selected.
+
+        If selected is SENTINEL, the command parsers ignore help options so the
+        result can be used to find the selected command without importing any
+        command module.
+        """
+        subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+        for (name, (_, help_text, _, _)) in self._commands.items():
+            subparser = subparsers.add_parser(
+                name,
+                help=help_text,
+                description=help_text,
+                add_help=selected is not SENTINEL
+            )
+
+            if name == selected:
+                add_arguments = getattr(self.load_command(name), "add_arguments", None)
+                if add_arguments is not None:
+                    add_arguments(subparser)
 
     # Command line argument related
 
@@ -178,34 +328,216 @@ class App(BaseApp):
         """ Derived class can override this if needed to return a custom
             argument parser.
         """
+        from argparse import ArgumentParser
         return ArgumentParser(description=self.description)
 
-    def parse_args(self, parser):
-        # pylint: disable=no-self-use
+    def parse_args(self, parser, args=None):
         """ Parse the arguments of the command line parser.
 
         A derived class can call this method then handle/validate the results.
+        If subcommands are registered, the arguments are first parsed with a
+        second parser from `create_arg_parser` to find the selected command,
+        then only that command's arguments are added to the parser.
         """
-        return parser.parse_args()
+        if not self._commands:
+            return parser.parse_args(args)
+
+        if args is None:
+            import sys
+            args = sys.argv[1:]
+
+        probe = self.create_arg_parser()
+        self._add_command_parsers(probe)
+        selected = probe.parse_known_args(args)[0].command
+
+        if selected is None:
+            parser.print_usage()
+            parser.exit(2, "{}: error: a command is required\n".format(parser.prog))
+
+        self._add_command_parsers(parser, selected)
+        result = parser.parse_args(args)
+        self.command = result.command
+
+        return result
 
     # Execution related
 
     def execute(self):
         """ Execute an application by calling the startup, main, and shutdown
             methods
+
+        If any of them is a coroutine function, they are run on an event loop
+        instead, see `execute_async`.
         """
+        if any(_is_coroutine_function(func) for func in (self.startup, self.main, self.shutdown)):
+            self.execute_async()
+            return
+
         self.startup()
         self.main()
         self.shutdown()
 
+    def execute_async(self):
+        """ Execute an application on a new event loop.
+
+        The startup, main and shutdown methods may each be a coroutine function
+        or a normal method.  SIGINT and SIGTERM cancel the main method, after
+        which shutdown is still called and singletons are closed with
+        `aclose_singletons`.  The loop is created by `create_event_loop` and
+        its default executor uses `executor_workers` threads if set.
+        """
+        self._run_on_loop(self._execute_async)
+
+    def _run_on_loop(self, func):
+        """ Run the coroutine returned by func(loop) on a new event loop. """
+        import asyncio
+
+        loop = self.create_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            if self.executor_workers is not None:
+                from concurrent.futures import ThreadPoolExecutor
+                loop.set_default_executor(
+                    ThreadPoolExecutor(max_workers=self.executor_workers)
+                )
+
+            return loop.run_until_complete(func(loop))
+        finally:
+            try:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                if hasattr(loop, "shutdown_default_executor"):
+                    loop.run_until_complete(loop.shutdown_default_executor())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+
+    def create_event_loop(self):
+        """ Create the event loop used by `execute_async`.
+
+        By default this calls `event_loop_factory` if set, such as
+        uvloop.new_event_loop, otherwise asyncio.new_event_loop.
+        """
+        if self.event_loop_factory is not None:
+            return self.event_loop_factory()
+
+        import asyncio
+        return asyncio.new_event_loop()
+
+    def stop(self):
+        """ Cancel the main method when running on an event loop.
+
+        This may be called from any thread.
+        """
+        task = self._main_task
+        if task is not None:
+            task.get_loop().call_soon_threadsafe(task.cancel)
+
+    async def _execute_async(self, loop):
+        """ Run the startup, main and shutdown methods on the loop. """
+        import asyncio
+        import signal
+
+        await _call_maybe_async(self.startup)
+        try:
+            self._main_task = asyncio.ensure_future(_call_maybe_async(self.main))
+
+            signals = []
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(signum, self._main_task.cancel)
+                    signals.append(signum)
+                except (NotImplementedError, RuntimeError, ValueError):
+                    pass # not supported by the loop or not the main thread
+
+            try:
+                await self._main_task
+            except asyncio.CancelledError:
+                if not self._main_task.cancelled():
+                    raise # we were cancelled, not the main task
+            finally:
+                for signum in signals:
+                    loop.remove_signal_handler(signum)
+                self._main_task = None
+        finally:
+            try:
+                await _call_maybe_async(self.shutdown)
+            finally:
+                await self.aclose_singletons()
+
+    def execute_prefork(self, workers=None, respawn=True, **kwargs):
+        """ Execute an application with the main method in worker processes.
+
+        The startup and shutdown methods are called once in the parent
+        process.  In between, the workers are forked and each calls the main
+        method with `worker_index` set, sharing the memory loaded by startup.
+        See `PreforkSupervisor` for the supervision details and the extra
+        keyword arguments.
+
+        Any of the methods may be a coroutine function, which is run on a new
+        event loop in the process calling it, so each worker has its own.
+
+        Parameters
+        ----------
+        workers : Optional[int], default=None
+            The number of worker processes.  Defaults to the number of CPUs.
+        respawn : bool, default=True
+            Whether to restart workers that fail.
+
+        Returns
+        -------
+        int
+            0 if all workers exited successfully, otherwise the first non-zero
+            worker exit code.
+        """
+        import os
+        from .prefork import PreforkSupervisor
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        self._call_on_loop(self.startup)
+        try:
+            supervisor = PreforkSupervisor(
+                self._worker_main,
+                workers,
+                respawn=respawn,
+                **kwargs
+            )
+            result = supervisor.run()
+        finally:
+            self._call_on_loop(self.shutdown)
+
+        return result
+
+    def _call_on_loop(self, func):
+        """ Call a method, on a new event loop if it is a coroutine function. """
+        if _is_coroutine_function(func):
+            return self._run_on_loop(lambda loop: func())
+
+        return func()
+
+    def _worker_main(self, index):
+        """ Run the main method in a worker process. """
+        self.worker_index = index
+        return self._call_on_loop(self.main)
+
     def startup(self):
-        """ Handle applicatoin startup related actions. """
-        BaseApp.startup(self)
+        """ Handle applicatoin startup related actions.
 
+        The arguments are parsed before the startup phase so steps may use them.
+        """
         parser = self.create_arg_parser()
         if parser:
             self.args = self.parse_args(parser)
 
+        BaseApp.startup(self)
+
     def main(self):
-        """ Execute the main body of the application. """
+        """ Execute the main body of the application.
+
+        By default this runs the selected subcommand.
+        """
+        if self.command is not None:
+            return self.load_command(self.command).main(self, self.args)
+
         raise NotImplementedError()
@@ -4,13 +4,21 @@ __author__ = "Brian Allen Vanderburg II"
 __copyright__ = "Copyright (C) 2018-2019 Brian Allen Vanderburg II"
 __license__ = "Apache License 2.0"
 
-__all__ = ["Config"]
+__all__ = ["Config", "ConfigFiles", "ConfigSchema", "ConfigError"]
 
 
+from contextlib import contextmanager
 import threading
-from typing import Any, Union, Sequence, Dict
+import os
+from typing import Any, Union, Sequence, Dict, Optional, Callable, Iterable
 
+from .codebuilder import CodeBuilder
 from .constants import SENTINEL
+from .hooks import Hooks
+
+
+class ConfigError(Exception):
+    """ An exception for invalid configuration values. """
 
 
 class Config:
@@ -23,12 +31,68 @@ class Config:
     lists, tuples, dicts.  When getting a value, these types are parsed
     recursively and any callable will be substituted with the return value of
     the call.
+
+    Changes made by `set` and `update` are announced by calling the
+    `HOOK_CHANGED` hook on the hooks object with the configuration object and
+    a dictionary of changes.  The dictionary maps (section, name) tuples to
+    (old, new) tuples of the raw stored values, where a missing value is
+    represented by SENTINEL.  Changes made within a `batch` context are
+    coalesced and announced once when the outermost batch ends.
     """
 
-    def __init__(self):
-        """ Initialize the configuration. """
+    HOOK_CHANGED = "config.changed"
+
+    def __init__(self, hooks: Optional[Hooks] = None):
+        """ Initialize the configuration.
+
+        Parameters
+        ----------
+        hooks : Optional[Hooks], default=None
+            The hooks object used to announce changes.  If not specified, the
+            configuration creates its own hooks object.
+        """
         self._lock = threading.RLock()
         self._sections = {}
+        self._hooks = hooks if hooks is not None else Hooks()
+        self._batch_depth = 0
+        self._changes = {}
+
+    @property
+    def hooks(self) -> Hooks:
+        """ Return the hooks object used to announce changes.
+
+        Returns
+        -------
+        Hooks
+            The hooks object the `HOOK_CHANGED` hook is called on.
+        """
+        return self._hooks
+
+    @contextmanager
+    def batch(self):
+        """ Coalesce changes made within a with context.
+
+        The configuration lock is held for the duration of the context, so
+        other threads observe either none or all of the changes of the batch.
+        Batches may be nested, in which case the changes are announced when
+        the outermost batch ends.  If a value is changed and then changed back
+        within the batch, it is not included in the announced changes.
+        """
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    changes = self._changes
+                    self._changes = {}
+                else:
+                    changes = None
+
+        # Announce outside of the lock so callbacks may freely use the config
+        if changes:
+            self._hooks.call(self.HOOK_CHANGED, self, changes)
 
     def set(
             self,
@@ -47,8 +111,9 @@ class Config:
         section : str, default="config"
             The section name to store the configuration value in.
         """
-        with self._lock:
+        with self.batch():
             section_container = self._sections.setdefault(section, {})
+            self._record(section, name, section_container.get(name, SENTINEL), value)
             section_container[name] = value
 
     def update(
@@ -69,9 +134,50 @@ class Config:
         section : str, default="config"
             The section of the configuration to merge into
         """
-        with self._lock:
+        with self.batch():
             section_container = self._sections.setdefault(section, {})
-            section_container.update(config)
+            for name in config:
+                value = config[name]
+                self._record(
+                    section, name, section_container.get(name, SENTINEL), value
+                )
+                section_container[name] = value
+
+    def replace(
+            self,
+            config: Dict[str, Any],
+            section: str = "config"
+    ):
+        """ Replace the contents of a configuration section.
+
+        The section's values are swapped for the values in `config` at once, so
+        readers never observe a partially updated section.  Names no longer
+        present are reported as changed to SENTINEL.
+
+        Parameters
+        ----------
+        config : Dict[str, Any]
+            A mapping of key name to configuration values for the section.
+        section : str, default="config"
+            The section of the configuration to replace.
+        """
+        section_container = dict(config)
+
+        with self.batch():
+            old_container = self._sections.get(section, {})
+            for name in old_container:
+                if name not in section_container:
+                    self._record(section, name, old_container[name], SENTINEL)
+
+            for name in section_container:
+                self._record(
+                    section,
+                    name,
+                    old_container.get(name, SENTINEL),
+                    section_container[name]
+                )
+
+            self._sections[section] = section_container
 
     def get(
             self,
@@ -161,6 +267,18 @@ class Config:
 
         return results
 
+    def _record(self, section, name, old, new):
+        """ Record a change to be announced when the batch ends. """
+        key = (section, name)
+        previous = self._changes.get(key)
+        if previous is not None:
+            old = previous[0]
+
+        if old is new or (old is not SENTINEL and new is not SENTINEL and old == new):
+            self._changes.pop(key, None)
+        else:
+            self._changes[key] = (old, new)
+
     def _eval(self, value):
         """ Evaluate any config functions. """
         if isinstance(value, list):
@@ -176,3 +294,417 @@ class Config:
             return self._eval(value())
 
         return value
+
+
+def _load_json(filename):
+    """ Load a JSON configuration file. """
+    import json
+
+    with open(filename, "rt", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+class ConfigFiles:
+    """ Load configuration sections from files and reload them on changes.
+
+    Each section is built by merging the values of its files in the order the
+    files were added, so later files override earlier ones.  Missing files are
+    treated as empty.  When reloading, only the changed files are parsed again
+    and each affected section is swapped into the configuration with
+    `Config.replace`, so a section managed by this class should not also be
+    modified directly.  If a changed file fails to parse, its previous values
+    are kept and the `HOOK_ERROR` hook is called on the configuration's hooks
+    with the filename and the exception.  If applying the reloaded sections
+    raises an exception, such as from a change hook, the hook is called with
+    None as the filename.
+    """
+
+    HOOK_ERROR = "config.file_error"
+
+    def __init__(
+            self,
+            config: Config,
+            loader: Optional[Callable[[str], Dict[str, Any]]] = None
+    ):
+        """ Initialize the configuration file set.
+
+        Parameters
+        ----------
+        config : Config
+            The configuration to load the files into.
+        loader : Optional[Callable[[str], Dict[str, Any]]], default=None
+            Called with a filename to parse it into a dictionary. By default
+            files are parsed as JSON.
+        """
+        self._config = config
+        self._loader = loader if loader is not None else _load_json
+        self._lock = threading.RLock()
+        self._files = [] # (filename, section)
+        self._data = {} # filename: parsed values
+        self._watcher = None
+
+    @property
+    def filenames(self) -> Sequence[str]:
+        """ Return the filenames in the order they were added. """
+        with self._lock:
+            return tuple(filename for (filename, _) in self._files)
+
+    def add(self, filename: str, section: str = "config"):
+        """ Add a file to load into a section.
+
+        Parameters
+        ----------
+        filename : str
+            The file to load
+        section : str, default="config"
+            The section the file's values are merged into
+        """
+        with self._lock:
+            self._files.append((os.path.abspath(filename), section))
+
+    def add_app_paths(self, paths, filename: str, section: str = "config"):
+        """ Add a file from each of an application's configuration directories.
+
+        The system directories are added from lowest to highest precedence,
+        followed by the user configuration directory.
+
+        Parameters
+        ----------
+        paths : AppPathsBase
+            The application paths object
+        filename : str
+            The name of the file relative to the configuration directories
+        section : str, default="config"
+            The section the files' values are merged into
+        """
+        for dirname in reversed(tuple(paths.sys_config_dirs)):
+            self.add(os.path.join(dirname, filename), section)
+        self.add(os.path.join(paths.user_config_dir, filename), section)
+
+    def load(self):
+        """ Parse all files and replace their sections in the configuration.
+
+        Unlike `reload`, errors from parsing a file are raised.
+        """
+        with self._lock:
+            for (filename, _) in self._files:
+                self._data[filename] = self._parse(filename)
+
+            sections = {section for (_, section) in self._files}
+            self._apply(sections)
+
+    def reload(self, filenames: Optional[Iterable[str]] = None):
+        """ Parse changed files and replace their sections in the configuration.
+
+        Parameters
+        ----------
+        filenames : Optional[Iterable[str]], default=None
+            The files that changed.  If not specified, all files are parsed.
+        """
+        with self._lock:
+            if filenames is None:
+                changed = set(self._data) | set(self.filenames)
+            else:
+                changed = {os.path.abspath(filename) for filename in filenames}
+
+            sections = set()
+            for (filename, section) in self._files:
+                if filename not in changed:
+                    continue
+
+                try:
+                    self._data[filename] = self._parse(filename)
+                except Exception as ex: # pylint: disable=broad-except
+                    self._config.hooks.call(self.HOOK_ERROR, filename, ex)
+                    continue
+
+                sections.add(section)
+
+            try:
+                self._apply(sections)
+            except Exception as ex: # pylint: disable=broad-except
+                self._config.hooks.call(self.HOOK_ERROR, None, ex)
+
+    def watch(self, debounce: float = 0.25, interval: float = 1.0):
+        """ Start reloading the files automatically when they change.
+
+        Parameters
+        ----------
+        debounce : float, default=0.25
+            The time in seconds with no changes before reloading.
+        interval : float, default=1.0
+            The time in seconds between checks if inotify is not available.
+        """
+        from .watch import FileWatcher
+
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = FileWatcher(
+                    self.filenames,
+                    self.reload,
+                    debounce=debounce,
+                    interval=interval,
+                    error_callback=self._watch_error
+                )
+                self._watcher.start()
+
+    def unwatch(self):
+        """ Stop reloading the files automatically. """
+        with self._lock:
+            watcher = self._watcher
+            self._watcher = None
+
+        if watcher is not None:
+            watcher.stop()
+
+    def _watch_error(self, ex):
+        """ Report an exception raised while reloading from the watcher. """
+        self._config.hooks.call(self.HOOK_ERROR, None, ex)
+
+    def _parse(self, filename):
+        """ Parse a file, treating a missing file as empty. """
+        if not os.path.exists(filename):
+            return {}
+
+        data = self._loader(filename)
+        if not isinstance(data, dict):
+            raise ValueError("Configuration file is not a mapping: {}".format(filename))
+
+        return data
+
+    def _apply(self, sections):
+        """ Merge the parsed files and replace each section in one batch. """
+        with self._config.batch():
+            for section in sections:
+                merged = {}
+                for (filename, file_section) in self._files:
+                    if file_section == section:
+                        merged.update(self._data.get(filename, {}))
+
+                self._config.replace(merged, section)
+
+
+_BOOL_STRINGS = {
+    "1": True, "true": True, "yes": True, "on": True,
+    "0": False, "false": False, "no": False, "off": False
+}
+
+
+def _to_bool(value):
+    """ Convert a value to a bool, accepting common strings. """
+    if isinstance(value, str):
+        try:
+            return _BOOL_STRINGS[value.strip().lower()]
+        except KeyError:
+            raise ValueError("Invalid boolean value: {}".format(value))
+
+    return bool(value)
+
+
+class ConfigSchema:
+    """ A declaration of typed configuration values.
+
+    The schema is compiled once into an accessor class whose instances hold the
+    converted and validated values in slotted attributes.  An accessor bound to
+    a configuration reloads its values when any of the declared keys change, so
+    reading a value is a plain attribute access:
+
+        schema = ConfigSchema()
+        schema.add("worker_count", int, default=4, key="worker.count")
+
+        cfg = schema.bind(app.config)
+        count = cfg.worker_count
+    """
+
+    HOOK_ERROR = "config.schema_error"
+
+    def __init__(self):
+        """ Initialize the schema. """
+        self._lock = threading.Lock()
+        self._entries = []
+        self._compiled = None
+
+    def add(
+            self,
+            attr: str,
+            type_: Optional[Callable[[Any], Any]] = None,
+            default: Any = None,
+            validator: Optional[Callable[[Any], bool]] = None,
+            key: Optional[str] = None,
+            section: str = "config"
+    ):
+        """ Declare a configuration value.
+
+        Parameters
+        ----------
+        attr : str
+            The attribute name on the accessor
+        type_ : Optional[Callable[[Any], Any]], default=None
+            Called to convert the value.  If bool, common strings such as
+            "yes" and "off" are also accepted.  If not specified, the value is
+            not converted.
+        default : Any, default=None
+            The value used if the key is not set.  It is not converted.
+        validator : Optional[Callable[[Any], bool]], default=None
+            Called with the converted value and should return True if valid.
+        key : Optional[str], default=None
+            The configuration key name.  Defaults to the attribute name.
+        section : str, default="config"
+            The configuration section the key is in.
+        """
+        if not attr.isidentifier() or attr.startswith("_"):
+            raise ValueError("Invalid accessor attribute name: {}".format(attr))
+
+        if type_ is bool:
+            type_ = _to_bool
+
+        with self._lock:
+            if any(entry[0] == attr for entry in self._entries):
+                raise ValueError("Duplicate accessor attribute name: {}".format(attr))
+
+            self._entries.append((
+                attr,
+                attr if key is None else key,
+                section,
+                type_,
+                default,
+                validator
+            ))
+            self._compiled = None
+
+    def compile(self) -> type:
+        """ Compile the schema into an accessor class.
+
+        The result is cached until the schema is changed.
+
+        Returns
+        -------
+        type
+            A class constructed with a Config object.  If a change to the
+            configuration makes a value invalid, the accessor keeps its
+            previous values and the `HOOK_ERROR` hook is called on the
+            configuration's hooks with the accessor and the ConfigError.
+        """
+        with self._lock:
+            if self._compiled is None:
+                self._compiled = self._build(tuple(self._entries))
+            return self._compiled
+
+    def bind(self, config: Config):
+        """ Create an accessor for a configuration.
+
+        Parameters
+        ----------
+        config : Config
+            The configuration to read values from
+
+        Returns
+        -------
+        An instance of the compiled accessor class.
+
+        Raises
+        ------
+        ConfigError
+            If a value can not be converted or is not valid.
+        """
+        return self.compile()(config)
+
+    @staticmethod
+    def _build(entries):
+        """ Generate the accessor class code. """
+        code = CodeBuilder()
+        env = {
+            "SENTINEL": SENTINEL,
+            "ConfigError": ConfigError,
+            "Config": Config,
+            "HOOK_ERROR": ConfigSchema.HOOK_ERROR
+        }
+        keys = set()
+        attrs = [entry[0] for entry in entries]
+
+        code.add("class ConfigAccessor:")
+        with code.indenter():
+            code.add("__slots__ = {!r}".format(tuple(attrs + ["_config", "__weakref__"])))
+            code.add("_keys = KEYS")
+            code.add("")
+            code.add("def __init__(self, config):")
+            with code.indenter():
+                code.add("self._config = config")
+                code.add("self._load()")
+                code.add("config.hooks.register(Config.HOOK_CHANGED, self._changed)")
+            code.add("")
+            code.add("def _changed(self, config, changes):")
+            with code.indenter():
+                code.add("if config is self._config and not self._keys.isdisjoint(changes):")
+                with code.indenter():
+                    code.add("try:")
+                    with code.indenter():
+                        code.add("self._load()")
+                    code.add("except ConfigError as ex:")
+                    with code.indenter():
+                        code.add("config.hooks.call(HOOK_ERROR, self, ex)")
+            code.add("")
+            code.add("def _load(self):")
+            with code.indenter():
+                code.add("config = self._config")
+                code.add("get = config.get")
+                results = []
+                code.add("with config._lock:")
+                code.indent()
+                if not entries:
+                    code.add("pass")
+                for (index, (attr, key, section, type_, default, validator)) in enumerate(entries):
+                    keys.add((section, key))
+                    var = code.nextvar
+                    results.append((attr, var))
+                    env["d{}".format(index)] = default
+                    env["k{}".format(index)] = "{}:{}".format(section, key)
+
+                    code.add("{} = get({!r}, SENTINEL, {!r})".format(var, key, section))
+                    code.add("if {} is SENTINEL:".format(var))
+                    with code.indenter():
+                        code.add("{} = d{}".format(var, index))
+
+                    if type_ is None and validator is None:
+                        continue
+
+                    code.add("else:")
+                    with code.indenter():
+                        if type_ is not None:
+                            env["t{}".format(index)] = type_
+                            code.add("try:")
+                            with code.indenter():
+                                code.add("{0} = t{1}({0})".format(var, index))
+                            code.add("except (TypeError, ValueError) as ex:")
+                            with code.indenter():
+                                code.add(
+                                    "raise ConfigError('Invalid value for ' + k{} + ': ' + str(ex)) from ex".format(
+                                        index
+                                    )
+                                )
+                        if validator is not None:
+                            env["f{}".format(index)] = validator
+                            code.add("if not f{}({}):".format(index, var))
+                            with code.indenter():
+                                code.add(
+                                    "raise ConfigError('Invalid value for ' + k{} + ': ' + repr({}))".format(
+                                        index, var
+                                    )
+                                )
+                code.dedent()
+
+                # Assign only once all values are valid
+                for (attr, var) in results:
+                    code.add("self.{} = {}".format(attr, var))
+            code.add("")
+            code.add("def __repr__(self):")
+            with code.indenter():
+                code.add("return 'ConfigAccessor(' + ', '.join(")
+                with code.indenter():
+                    code.add("name + '=' + repr(getattr(self, name)) for name in {!r}".format(tuple(attrs)))
+                code.add(") + ')'")
+
+        env["KEYS"] = frozenset(keys)
+        exec(code.render(), env) # pylint: disable=exec-used
+        return env["ConfigAccessor"]
+
@@ -0,0 +1,496 @@
+""" A size-bounded on-disk cache shared between processes. """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+__all__ = ["DiskCache"]
+
+
+import fcntl
+import hashlib
+import os
+import struct
+import threading
+import time
+from typing import Optional, Union
+
+from .util import FileMover
+
+
+_MAGIC = b"MDC2"
+_HEADER = struct.Struct("<4s8s") # magic, generation
+_RECORD = struct.Struct("<20sqd") # key digest, file size, last access time
+_REMOVED = -1 # The file size of a removed value
+
+_RAW = b"\0"
+_ZLIB = b"\1"
+
+# fcntl locks are held by the process, so instances of the same directory
+# share a thread lock
+_directory_locks = {} # pylint: disable=invalid-name
+_directory_locks_lock = threading.Lock() # pylint: disable=invalid-name
+
+
+def _directory_lock(directory):
+    """ Return the thread lock shared by the caches of a directory. """
+    directory = os.path.realpath(directory)
+    with _directory_locks_lock:
+        lock = _directory_locks.get(directory)
+        if lock is None:
+            lock = _directory_locks[directory] = threading.RLock()
+
+        return lock
+
+
+class DiskCache:
+    """ Store values by key in files below a directory.
+
+    Each value is stored in its own file named by the SHA-1 digest of its key,
+    in one of 256 shard directories named by the first byte of the digest.
+    Values are written to a temporary file and moved into place, so readers
+    never see a partially written value and reading needs no locking.
+
+    A compact binary index file records the size and last access time of each
+    value.  When a value is stored and the total size exceeds max_size, the
+    least recently used values are removed.  Changes to the index are made
+    while holding an fcntl lock on a lock file, so multiple processes may use
+    the same cache directory, as may multiple instances in one process.  Accesses by `get` are collected in memory and
+    written to the index with the next change or `flush`.
+
+    Changes are appended to the index as records, and each process reads only
+    the records appended since it last looked.  Once the index holds more than
+    twice as many records as values plus COMPACT_MIN, it is rewritten from the
+    value files, which also removes temporary files older than TEMP_AGE
+    seconds left by crashed writers.  An index that is missing or can not be
+    read is rebuilt the same way.
+
+    Keys may be strings or bytes, and values must be bytes-like objects.
+    """
+
+    INDEX_NAME = "index"
+    LOCK_NAME = "lock"
+    COMPACT_MIN = 1024
+    TEMP_AGE = 3600
+
+    def __init__(
+            self,
+            directory: str,
+            max_size: int = 64 * 1024 * 1024,
+            compress: bool = False,
+            compress_level: int = 6
+    ):
+        """ Initialize the cache.
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the cache, which is created if needed.
+        max_size : int, default=64MiB
+            The maximum total size in bytes of the stored value files.
+        compress : bool, default=False
+            Whether to compress stored values with zlib.  Values which do not
+            get smaller are stored uncompressed.
+        compress_level : int, default=6
+            The zlib compression level.
+        """
+        self._directory = directory
+        self._max_size = max_size
+        self._compress = compress
+        self._compress_level = compress_level
+        self._index_file = os.path.join(directory, self.INDEX_NAME)
+        self._lock_file = os.path.join(directory, self.LOCK_NAME)
+        self._index = {} # digest: [size, atime]
+        self._index_stat = None # (generation, offset read to)
+        self._total = 0
+        self._records = 0
+        self._touched = {} # digest: atime
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock = _directory_lock(directory)
+
+    @classmethod
+    def from_app_paths(cls, paths, name: str, **kwargs) -> "DiskCache":
+        """ Create a cache in a subdirectory of an application's cache directory.
+
+        Parameters
+        ----------
+        paths : AppPathsBase
+            The application paths.
+        name : str
+            The name of the subdirectory.
+        **kwargs
+            Other arguments passed to the constructor.
+        """
+        return cls(os.path.join(paths.cache_dir, name), **kwargs)
+
+    @property
+    def directory(self) -> str:
+        """ Return the directory of the cache. """
+        return self._directory
+
+    @property
+    def size(self) -> int:
+        """ Return the total size of the stored values as last indexed. """
+        with self._lock:
+            with self._locked():
+                return self._total
+
+    @staticmethod
+    def _digest(key):
+        """ Return the digest of a key. """
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+
+        return hashlib.sha1(key).digest()
+
+    def _filename(self, digest):
+        """ Return the file storing the value of a digest. """
+        name = digest.hex()
+        return os.path.join(self._directory, name[:2], name[2:])
+
+    def _locked(self):
+        """ Return a context manager holding the lock file and current index. """
+        return _IndexLock(self)
+
+    def _load_index(self):
+        """ Read the records appended to the index file since last read.
+
+        The index is rebuilt from the value files if it is missing or can not
+        be read, such as after a crash while it was written.
+        """
+        try:
+            with open(self._index_file, "rb") as handle:
+                header = handle.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    self._rebuild_index()
+                    return
+
+                (magic, generation) = _HEADER.unpack(header)
+                if magic != _MAGIC:
+                    self._rebuild_index()
+                    return
+
+                if self._index_stat is not None and self._index_stat[0] == generation:
+                    offset = self._index_stat[1]
+                    handle.seek(offset)
+                else:
+                    # Compacted by another process, read it all again
+                    self._reset_index()
+                    offset = _HEADER.size
+
+                data = handle.read()
+        except FileNotFoundError:
+            self._rebuild_index()
+            return
+
+        count = len(data) // _RECORD.size
+        for record in _RECORD.iter_unpack(data[:count * _RECORD.size]):
+            self._apply_record(*record)
+
+        if len(data) % _RECORD.size:
+            self._compact() # A partial record from a crashed writer
+            return
+
+        self._records += count
+        self._index_stat = (generation, offset + len(data))
+
+    def _reset_index(self):
+        """ Forget the loaded index. """
+        self._index = {}
+        self._index_stat = None
+        self._total = 0
+        self._records = 0
+
+    def _rebuild_index(self):
+        """ Replace an unreadable index with one made from the value files. """
+        self._reset_index()
+        self._compact()
+
+    def _apply_record(self, digest, size, atime):
+        """ Apply a record of the index file to the loaded index. """
+        record = self._index.pop(digest, None)
+        if record is not None:
+            self._total -= record[0]
+
+        if size != _REMOVED:
+            self._index[digest] = [size, atime]
+            self._total += size
+
+    def _append(self, records):
+        """ Append records to the index file and apply them. """
+        self._flush_touched(records)
+        if not records:
+            return
+
+        data = b"".join(_RECORD.pack(*record) for record in records)
+        with open(self._index_file, "ab") as handle:
+            handle.write(data)
+
+        for record in records:
+            self._apply_record(*record)
+
+        (generation, offset) = self._index_stat
+        self._index_stat = (generation, offset + len(data))
+        self._records += len(records)
+
+        if self._records > 2 * len(self._index) + self.COMPACT_MIN:
+            self._compact()
+
+    def _flush_touched(self, records):
+        """ Add records for the accesses collected since the last change. """
+        for (digest, atime) in self._touched.items():
+            record = self._index.get(digest)
+            if record is not None and atime > record[1]:
+                records.insert(0, (digest, record[0], atime))
+
+        self._touched = {}
+
+    def _scan(self):
+        """ Return the size and modification time of each value file.
+
+        Temporary files older than TEMP_AGE, which were left by writers that
+        crashed, are removed.
+        """
+        found = {}
+        expired = time.time() - self.TEMP_AGE
+        index_temp = self.INDEX_NAME + "."
+
+        for shard in os.scandir(self._directory):
+            if shard.name.startswith(index_temp) and shard.name.endswith(".tmp"):
+                self._remove_expired(shard, expired)
+                continue
+
+            if len(shard.name) != 2 or not shard.is_dir(follow_symlinks=False):
+                continue
+
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".tmp"):
+                    self._remove_expired(entry, expired)
+                    continue
+
+                if len(entry.name) != 38:
+                    continue
+
+                try:
+                    digest = bytes.fromhex(shard.name + entry.name)
+                    stat = entry.stat(follow_symlinks=False)
+                except (ValueError, OSError):
+                    continue
+
+                found[digest] = [stat.st_size, stat.st_mtime]
+
+        return found
+
+    @staticmethod
+    def _remove_expired(entry, expired):
+        """ Remove a temporary file last modified before a time. """
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime < expired:
+                os.unlink(entry.path)
+        except OSError:
+            pass
+
+    def _compact(self):
+        """ Rewrite the index file with one record per value file. """
+        index = {}
+        for (digest, (size, mtime)) in self._scan().items():
+            record = self._index.get(digest)
+            index[digest] = [size, mtime if record is None else record[1]]
+
+        self._index = index
+        self._total = sum(record[0] for record in index.values())
+        self._write_index()
+
+    def _write_index(self):
+        """ Write the loaded index to a new index file atomically. """
+        generation = os.urandom(8)
+        data = bytearray(_HEADER.pack(_MAGIC, generation))
+        for (digest, (size, atime)) in self._index.items():
+            data += _RECORD.pack(digest, size, atime)
+
+        tempname = "{}.{}.tmp".format(self._index_file, os.getpid())
+        with FileMover(self._index_file, tempname) as mover:
+            with open(tempname, "wb") as handle:
+                handle.write(data)
+            mover.commit()
+
+        self._index_stat = (generation, len(data))
+        self._records = len(self._index)
+
+    def _remove_file(self, digest):
+        """ Remove the file of a value if it exists. """
+        try:
+            os.unlink(self._filename(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _evict(self):
+        """ Remove the least recently used values until within max_size. """
+        if self._total <= self._max_size:
+            return
+
+        index = self._index
+        total = self._total
+        removed = []
+        for digest in sorted(index, key=lambda digest: index[digest][1]):
+            total -= index[digest][0]
+            self._remove_file(digest)
+            removed.append((digest, _REMOVED, 0.0))
+            if total <= self._max_size:
+                break
+
+        self._append(removed)
+
+    def get(self, key: Union[str, bytes], default: Optional[bytes] = None) -> Optional[bytes]:
+        """ Return the value of a key.
+
+        Parameters
+        ----------
+        key : Union[str, bytes]
+            The key of the value
+        default : Optional[bytes], default=None
+            The value to return if the key is not in the cache.
+
+        Returns
+        -------
+        bytes
+            The stored value or the default.
+        """
+        digest = self._digest(key)
+        try:
+            with open(self._filename(digest), "rb") as handle:
+                data = handle.read()
+        except FileNotFoundError:
+            return default
+
+        with self._lock:
+            self._touched[digest] = time.time()
+
+        flag = data[:1]
+        if flag == _ZLIB:
+            import zlib
+            return zlib.decompress(data[1:])
+        if flag == _RAW:
+            return data[1:]
+
+        return default # Not a value file
+
+    def __contains__(self, key):
+        """ Determine if a key is in the cache. """
+        return os.path.exists(self._filename(self._digest(key)))
+
+    def set(self, key: Union[str, bytes], value: bytes):
+        """ Store the value of a key.
+
+        Parameters
+        ----------
+        key : Union[str, bytes]
+            The key of the value
+        value : bytes
+            The value to store
+        """
+        digest = self._digest(key)
+        value = bytes(value)
+
+        data = value
+        flag = _RAW
+        if self._compress:
+            import zlib
+            compressed = zlib.compress(value, self._compress_level)
+            if len(compressed) < len(value):
+                (data, flag) = (compressed, _ZLIB)
+
+        filename = self._filename(digest)
+        dirname = os.path.dirname(filename)
+        tempname = os.path.join(dirname, ".{}.{}.{}.tmp".format(
+            os.path.basename(filename), os.getpid(), threading.get_ident()
+        ))
+
+        os.makedirs(dirname, exist_ok=True)
+        with FileMover(filename, tempname) as mover:
+            with open(tempname, "wb") as handle:
+                handle.write(flag)
+                handle.write(data)
+
+            with self._lock:
+                with self._locked():
+                    # Indexed first so a crash can not leave an unindexed file
+                    self._append([(digest, len(data) + 1, time.time())])
+                    mover.commit()
+                    self._evict()
+
+    def delete(self, key: Union[str, bytes]) -> bool:
+        """ Remove the value of a key.
+
+        Parameters
+        ----------
+        key : Union[str, bytes]
+            The key of the value
+
+        Returns
+        -------
+        bool
+            True if the value was in the cache.
+        """
+        digest = self._digest(key)
+        with self._lock:
+            with self._locked():
+                found = self._remove_file(digest) or digest in self._index
+                self._append([(digest, _REMOVED, 0.0)] if found else [])
+                return found
+
+    def clear(self):
+        """ Remove all values from the cache. """
+        with self._lock:
+            with self._locked():
+                for digest in self._scan():
+                    self._remove_file(digest)
+
+                self._reset_index()
+                self._touched = {}
+                self._write_index()
+
+    def flush(self):
+        """ Write recorded accesses to the index. """
+        with self._lock:
+            if not self._touched:
+                return
+
+            with self._locked():
+                self._append([])
+
+
+class _IndexLock:
+    """ Hold the lock file of a cache with its index loaded. """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._handle = None
+
+    def __enter__(self):
+        cache = self._cache
+        handle = os.open(cache._lock_file, os.O_RDWR | os.O_CREAT, 0o644) # pylint: disable=protected-access
+        try:
+            fcntl.lockf(handle, fcntl.LOCK_EX)
+        except:
+            os.close(handle)
+            raise
+
+        self._handle = handle
+        try:
+            cache._load_index() # pylint: disable=protected-access
+        except:
+            self.__exit__()
+            raise
+
+        return self
+
+    def __exit__(self, *args):
+        handle = self._handle
+        self._handle = None
+        try:
+            fcntl.lockf(handle, fcntl.LOCK_UN)
+        finally:
+            os.close(handle)
@@ -4,7 +4,6 @@ __author__ = "Brian Allen Vanderburg II"
 __copyright__ = "Copyright (C) 2018-2019 Brian Allen Vanderburg II"
 __license__ = "Apache License 2.0"
 
-import pkgutil
 import importlib
 
 
@@ -87,6 +86,8 @@ def import_submodules(package, recursive=False, absolute=False):
     # iter_modules it will not have the full module path and doesn't seem
     # to load submodules of found packages correctly if at all.
 
+    import pkgutil
+
     if isinstance(package, str):
         package = importlib.import_module(package)
 
@@ -142,3 +143,20 @@ def import_submodules_symbolref(package_name, symbol, recursive=False):
                 results.append(item)
 
     return results
+
+
+@_export
+def import_object(reference, package=None):
+    """ Import and return an object from a "module:attribute" reference.
+
+    The attribute part may be a dotted path of nested attributes.  If there
+    is no attribute part, the module itself is returned.
+    """
+    (module_name, _, attr) = reference.partition(":")
+    obj = importlib.import_module(module_name, package)
+
+    if attr:
+        for part in attr.split("."):
+            obj = getattr(obj, part)
+
+    return obj
@@ -0,0 +1,627 @@
+""" Local inter-process communication. """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+__all__ = ["IpcServer", "IpcClient", "SharedRingBuffer", "get_socket_path"]
+
+
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Optional
+
+
+_FRAME = struct.Struct("<I")
+
+
+def get_socket_path(paths, name: str) -> str:
+    """ Return the path of a named socket in an application's runtime directory.
+
+    Parameters
+    ----------
+    paths : AppPathsBase
+        The application paths.  The runtime directory is created if needed.
+    name : str
+        The name of the socket.
+
+    Returns
+    -------
+    str
+        The path of the socket.
+    """
+    runtime_dir = paths.runtime_dir
+    os.makedirs(runtime_dir, mode=0o700, exist_ok=True)
+    return os.path.join(runtime_dir, name + ".sock")
+
+
+def _recv_exact(sock, size):
+    """ Receive exactly size bytes, or None if the connection closed first. """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            return None
+        received += count
+
+    return buffer
+
+
+def _recv_frame(sock, max_size):
+    """ Receive a length prefixed frame, or None if the connection closed.
+
+    A ConnectionError is raised if the frame is larger than max_size.
+    """
+    header = _recv_exact(sock, _FRAME.size)
+    if header is None:
+        return None
+
+    (size,) = _FRAME.unpack(header)
+    if size > max_size:
+        raise ConnectionError("Message of {} bytes exceeds {} bytes".format(size, max_size))
+    if size == 0:
+        return b""
+
+    return _recv_exact(sock, size)
+
+
+def _send_frame(sock, data):
+    """ Send a length prefixed frame without copying the data. """
+    view = memoryview(data).cast("B")
+    header = _FRAME.pack(len(view))
+    total = _FRAME.size + len(view)
+
+    offset = sock.sendmsg([header, view])
+    while offset < total:
+        # Partial send, continue with the remaining data
+        if offset < _FRAME.size:
+            offset += sock.sendmsg([header[offset:], view])
+        else:
+            offset += sock.send(view[offset - _FRAME.size:])
+
+
+class IpcServer:
+    """ A request/response server on a Unix domain socket.
+
+    Each message is sent as a frame of its length followed by its bytes.  The
+    handler is called with each request received and returns the response,
+    from a thread serving the connection, so it may be called concurrently
+    for different connections.  If the handler raises an exception or a
+    request is larger than max_message, the connection is closed.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            handler: Callable[[bytearray], bytes],
+            backlog: int = 16,
+            max_message: int = 16 * 1024 * 1024
+    ):
+        """ Initialize the server.
+
+        Parameters
+        ----------
+        path : str
+            The path of the socket.  An existing socket that no server is
+            listening on is replaced.
+        handler : Callable[[bytearray], bytes]
+            Called with each request and returns the response.
+        backlog : int, default=16
+            The number of pending connections to allow.
+        max_message : int, default=16MiB
+            The maximum size in bytes of a request.
+        """
+        self._path = path
+        self._handler = handler
+        self._backlog = backlog
+        self._max_message = max_message
+        self._lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+        self._connections = set()
+
+    @classmethod
+    def from_app_paths(cls, paths, name: str, handler, **kwargs) -> "IpcServer":
+        """ Create a server on a named socket in the runtime directory.
+
+        See `get_socket_path` and the constructor for the parameters.
+        """
+        return cls(get_socket_path(paths, name), handler, **kwargs)
+
+    @property
+    def path(self) -> str:
+        """ Return the path of the socket. """
+        return self._path
+
+    @property
+    def running(self) -> bool:
+        """ Return whether the server is accepting connections. """
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def _remove_stale(self):
+        """ Remove the socket file if no server is listening on it. """
+        if not os.path.exists(self._path):
+            return
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self._path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(self._path)
+        else:
+            raise OSError("A server is already listening on {}".format(self._path))
+        finally:
+            probe.close()
+
+    def start(self):
+        """ Start accepting connections. """
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._remove_stale()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.bind(self._path)
+                sock.listen(self._backlog)
+            except:
+                sock.close()
+                raise
+
+            self._sock = sock
+            self._thread = threading.Thread(
+                target=self._accept,
+                args=(sock,),
+                name="IpcServer",
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """ Stop the server and close all connections.
+
+        Parameters
+        ----------
+        timeout : Optional[float], default=None
+            The maximum time to wait for the accepting thread to finish.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+
+            sock = self._sock
+            connections = list(self._connections)
+            self._sock = None
+            self._thread = None
+
+        # Shutdown wakes threads blocked in accept and recv
+        for conn in [sock] + connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        if thread is not threading.current_thread():
+            thread.join(timeout)
+
+        sock.close()
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+    def _accept(self, sock):
+        """ Accept connections and serve each on its own thread. """
+        while True:
+            try:
+                (conn, _) = sock.accept()
+            except OSError:
+                break # Server stopped
+
+            with self._lock:
+                if self._sock is not sock:
+                    conn.close()
+                    break
+                self._connections.add(conn)
+
+            threading.Thread(
+                target=self._serve,
+                args=(conn,),
+                name="IpcServer-connection",
+                daemon=True
+            ).start()
+
+    def _serve(self, conn):
+        """ Answer the requests of a connection until it closes. """
+        try:
+            while True:
+                request = _recv_frame(conn, self._max_message)
+                if request is None:
+                    break
+
+                _send_frame(conn, self._handler(request))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class IpcClient:
+    """ A client of an IpcServer.
+
+    The connection is made on the first request and is reused for later
+    requests.  Requests from multiple threads are sent one at a time.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            timeout: Optional[float] = None,
+            max_message: int = 16 * 1024 * 1024
+    ):
+        """ Initialize the client.
+
+        Parameters
+        ----------
+        path : str
+            The path of the server's socket.
+        timeout : Optional[float], default=None
+            The timeout in seconds of socket operations.
+        max_message : int, default=16MiB
+            The maximum size in bytes of a response.  The connection is
+            closed and a ConnectionError raised for a larger response.
+        """
+        self._path = path
+        self._timeout = timeout
+        self._max_message = max_message
+        self._lock = threading.Lock()
+        self._sock = None
+
+    @classmethod
+    def from_app_paths(cls, paths, name: str, **kwargs) -> "IpcClient":
+        """ Create a client of a named socket in the runtime directory.
+
+        See `get_socket_path` and the constructor for the parameters.
+        """
+        return cls(get_socket_path(paths, name), **kwargs)
+
+    def request(self, data: bytes) -> bytearray:
+        """ Send a request and return the response.
+
+        Parameters
+        ----------
+        data : bytes
+            The request, which may be any bytes-like object.
+
+        Returns
+        -------
+        bytearray
+            The response.
+        """
+        with self._lock:
+            if self._sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self._timeout)
+                try:
+                    sock.connect(self._path)
+                except:
+                    sock.close()
+                    raise
+                self._sock = sock
+
+            try:
+                _send_frame(self._sock, data)
+                response = _recv_frame(self._sock, self._max_message)
+            except:
+                self._close()
+                raise
+
+            if response is None:
+                self._close()
+                raise ConnectionError("The server closed the connection")
+
+            return response
+
+    def _close(self):
+        """ Close the socket. """
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def close(self):
+        """ Close the connection. """
+        with self._lock:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SharedRingBuffer:
+    """ A ring buffer of messages in shared memory.
+
+    The buffer is meant to have a single writing process and a single reading
+    process, such as a supervisor and one pre-forked worker, and uses no locks.
+    The writer reserves space for a message and fills it in place, and the
+    reader gets a view of the next message in place, so messages are not
+    copied or pickled.  Messages are never split at the end of the buffer, so
+    each reserved space and view is contiguous.
+
+    Views must be released before the buffer is closed.  The process that
+    created the buffer should unlink it once it is no longer needed.
+    """
+
+    # Layout: write position and capacity, read position on a separate cache
+    # line, then the data
+    _POSITION = struct.Struct("<Q")
+    _WRITE_OFFSET = 0
+    _CAPACITY_OFFSET = 8
+    _READ_OFFSET = 64
+    _DATA_OFFSET = 128
+    _ALIGN = 8
+    _PAD = 0xFFFFFFFF
+
+    def __init__(self, size: int = 1024 * 1024, name: Optional[str] = None, create: bool = True):
+        """ Create or attach to a ring buffer.
+
+        Parameters
+        ----------
+        size : int, default=1MiB
+            The data capacity in bytes of a created buffer, rounded up to a
+            multiple of 8.
+        name : Optional[str], default=None
+            The name of the shared memory.  Required when attaching.
+        create : bool, default=True
+            Whether to create the buffer rather than attach to it.
+        """
+        from multiprocessing import shared_memory
+
+        if create:
+            size = -(-size // self._ALIGN) * self._ALIGN
+            self._shm = shared_memory.SharedMemory(name, True, self._DATA_OFFSET + size)
+            self._POSITION.pack_into(self._shm.buf, self._CAPACITY_OFFSET, size)
+        else:
+            self._shm = shared_memory.SharedMemory(name)
+
+        # The mapping may be larger than requested, so the size is stored
+        (self._capacity,) = self._POSITION.unpack_from(self._shm.buf, self._CAPACITY_OFFSET)
+        self._buf = self._shm.buf
+        self._pending = None
+        self._reading = None
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedRingBuffer":
+        """ Attach to an existing buffer by name. """
+        return cls(name=name, create=False)
+
+    @property
+    def name(self) -> str:
+        """ Return the name of the shared memory. """
+        return self._shm.name
+
+    @property
+    def capacity(self) -> int:
+        """ Return the data capacity in bytes. """
+        return self._capacity
+
+    def _get(self, offset):
+        """ Read a position. """
+        return self._POSITION.unpack_from(self._buf, offset)[0]
+
+    def _set(self, offset, value):
+        """ Write a position. """
+        self._POSITION.pack_into(self._buf, offset, value)
+
+    @staticmethod
+    def _wait(deadline, delay):
+        """ Sleep before checking again, returning the next delay or None. """
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+
+        time.sleep(delay)
+        return min(delay * 2, 0.001) if delay else 0.00001
+
+    def reserve(self, size: int, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """ Reserve space for a message.
+
+        The message is filled in through the returned view and is made
+        available to the reader by `commit`.  A message that does not fit
+        before the end of the buffer is placed at its start, once the reader
+        has skipped the rest of the buffer.
+
+        Parameters
+        ----------
+        size : int
+            The size of the message in bytes.
+        timeout : Optional[float], default=None
+            The maximum time in seconds to wait for space, or None to wait
+            until there is space.
+
+        Returns
+        -------
+        memoryview
+            A writable view of the message space.
+        None
+            If there was no space before the timeout.
+        """
+        if self._pending is not None:
+            raise RuntimeError("A reserved message has not been committed")
+
+        frame = -(-(_FRAME.size + size) // self._ALIGN) * self._ALIGN
+        if frame > self._capacity:
+            raise ValueError("Message of {} bytes exceeds the buffer capacity".format(size))
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = 0.0
+        write = self._get(self._WRITE_OFFSET)
+        while True:
+            read = self._get(self._READ_OFFSET)
+            offset = write % self._capacity
+            free = self._capacity - (write - read)
+
+            if offset + frame > self._capacity:
+                pad = self._capacity - offset
+                if free >= pad:
+                    # Skip the rest of the buffer so the message is contiguous.
+                    # The padding is published now, as only the reader
+                    # skipping it frees the space at the start.
+                    _FRAME.pack_into(self._buf, self._DATA_OFFSET + offset, self._PAD)
+                    write += pad
+                    self._set(self._WRITE_OFFSET, write)
+                    continue
+            elif free >= frame:
+                break
+
+            delay = self._wait(deadline, delay)
+            if delay is None:
+                return None
+
+        start = self._DATA_OFFSET + offset
+        _FRAME.pack_into(self._buf, start, size)
+        self._pending = write + frame
+        return self._buf[start + _FRAME.size:start + _FRAME.size + size]
+
+    def commit(self):
+        """ Make the reserved message available to the reader. """
+        if self._pending is None:
+            raise RuntimeError("No message has been reserved")
+
+        self._set(self._WRITE_OFFSET, self._pending)
+        self._pending = None
+
+    def put(self, data: bytes, timeout: Optional[float] = None) -> bool:
+        """ Copy a message into the buffer.
+
+        Parameters
+        ----------
+        data : bytes
+            The message, which may be any bytes-like object.
+        timeout : Optional[float], default=None
+            See `reserve`
+
+        Returns
+        -------
+        bool
+            Whether the message was written before the timeout.
+        """
+        data = memoryview(data).cast("B")
+        view = self.reserve(len(data), timeout)
+        if view is None:
+            return False
+
+        with view:
+            view[:] = data
+        self.commit()
+        return True
+
+    def read(self, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """ Return a view of the next message.
+
+        The message stays in the buffer until `release` is called.
+
+        Parameters
+        ----------
+        timeout : Optional[float], default=None
+            The maximum time in seconds to wait for a message, or None to
+            wait until there is one.
+
+        Returns
+        -------
+        memoryview
+            A read-only view of the message.
+        None
+            If there was no message before the timeout.
+        """
+        if self._reading is not None:
+            raise RuntimeError("The previous message has not been released")
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = 0.0
+        read = self._get(self._READ_OFFSET)
+        while True:
+            write = self._get(self._WRITE_OFFSET)
+            if write != read:
+                offset = read % self._capacity
+                (size,) = _FRAME.unpack_from(self._buf, self._DATA_OFFSET + offset)
+                if size != self._PAD:
+                    break
+
+                # Skip the padding at the end of the buffer
+                read += self._capacity - offset
+                self._set(self._READ_OFFSET, read)
+                continue
+
+            delay = self._wait(deadline, delay)
+            if delay is None:
+                return None
+
+        start = self._DATA_OFFSET + offset + _FRAME.size
+        self._reading = read + -(-(_FRAME.size + size) // self._ALIGN) * self._ALIGN
+        return self._buf[start:start + size].toreadonly()
+
+    def release(self):
+        """ Free the space of the message returned by `read`. """
+        if self._reading is None:
+            raise RuntimeError("No message has been read")
+
+        self._set(self._READ_OFFSET, self._reading)
+        self._reading = None
+
+    def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """ Return a copy of the next message and remove it from the buffer.
+
+        Parameters
+        ----------
+        timeout : Optional[float], default=None
+            See `read`
+
+        Returns
+        -------
+        bytes
+            The message.
+        None
+            If there was no message before the timeout.
+        """
+        view = self.read(timeout)
+        if view is None:
+            return None
+
+        with view:
+            data = bytes(view)
+        self.release()
+        return data
+
+    def close(self):
+        """ Close this process's mapping of the buffer. """
+        if self._buf is not None:
+            self._buf = None
+            self._shm.close()
+
+    def unlink(self):
+        """ Remove the shared memory once all processes close it. """
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -7,25 +7,183 @@ __copyright__   =   "Copyright (C) 2018 Brian Allen Vanderburg II"
 __license__     =   "Apache License 2.0"
 
 
+from contextlib import contextmanager
 import threading
+import time
+import types
 
 
-from ..util.imp import Exporter
+from ..imp import Exporter
 from ..constants import SENTINEL
 
 
 export = Exporter(globals())
 
 
+@export
+class ServicePool(object):
+    """ A bounded pool of reusable service instances.
+
+    Instances are created by the factory as needed, up to max_size instances
+    in total.  When all instances are in use, acquiring waits for one to be
+    released.  Idle instances not used for idle_timeout seconds are discarded,
+    and the destroy callable, if given, is called with each discarded instance.
+    With thread affinity, a thread is given back the instance it released most
+    recently if it is still idle, which keeps per-thread state warm.
+    """
+
+    def __init__(self, factory, max_size=None, idle_timeout=None,
+                 destroy=None, thread_affinity=True):
+        """ Initialize the pool. """
+        if max_size is not None and max_size < 1:
+            raise ValueError("Pool max_size must be at least 1")
+
+        self._factory = factory
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._destroy = destroy
+        self._thread_affinity = thread_affinity
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = [] # (instance, release time, thread ident)
+        self._size = 0
+        self._closed = False
+
+    @property
+    def size(self):
+        """ Return the number of instances, both idle and in use. """
+        return self._size
+
+    @property
+    def idle(self):
+        """ Return the number of idle instances. """
+        return len(self._idle)
+
+    def acquire(self, timeout=None):
+        """ Take an instance from the pool, creating one if needed.
+
+        Raises TimeoutError if no instance became available within timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ident = threading.get_ident()
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Service pool is closed")
+            expired = self._expire()
+
+            while True:
+                if self._idle:
+                    instance = self._take(ident)
+                    break
+
+                if self._max_size is None or self._size < self._max_size:
+                    instance = SENTINEL
+                    self._size += 1
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._discard(expired)
+                    raise TimeoutError("No pooled service instance available")
+                self._cond.wait(remaining)
+
+        self._discard(expired)
+
+        if instance is SENTINEL:
+            try:
+                instance = self._factory()
+            except:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        return instance
+
+    def release(self, instance, discard=False):
+        """ Return an instance to the pool.
+
+        If discard is True, the instance is destroyed instead of reused, such
+        as when it was left in a bad state.
+        """
+        with self._cond:
+            discard = discard or self._closed
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((instance, time.monotonic(), threading.get_ident()))
+            expired = self._expire()
+            self._cond.notify()
+
+        self._discard([instance] if discard else [])
+        self._discard(expired)
+
+    def close(self):
+        """ Discard all idle instances and any instance released later. """
+        with self._cond:
+            self._closed = True
+        self.clear()
+
+    def clear(self):
+        """ Discard all idle instances. """
+        with self._cond:
+            expired = [entry[0] for entry in self._idle]
+            self._size -= len(expired)
+            self._idle = []
+            self._cond.notify_all()
+
+        self._discard(expired)
+
+    def _take(self, ident):
+        """ Remove an idle instance, preferring one released by this thread. """
+        idle = self._idle
+        if self._thread_affinity:
+            for pos in range(len(idle) - 1, -1, -1):
+                if idle[pos][2] == ident:
+                    return idle.pop(pos)[0]
+
+        return idle.pop()[0]
+
+    def _expire(self):
+        """ Remove and return idle instances past the idle timeout. """
+        if self._idle_timeout is None or not self._idle:
+            return []
+
+        cutoff = time.monotonic() - self._idle_timeout
+        expired = [entry[0] for entry in self._idle if entry[1] < cutoff]
+        if expired:
+            self._idle = [entry for entry in self._idle if entry[1] >= cutoff]
+            self._size -= len(expired)
+            self._cond.notify_all()
+
+        return expired
+
+    def _discard(self, instances):
+        """ Destroy discarded instances outside of the lock. """
+        if self._destroy is not None:
+            for instance in instances:
+                self._destroy(instance)
+
+
 @export
 class ServiceContainerMixin(object):
-    """ A mixing object providing configuration-related methods. """
+    """ A mixing object providing configuration-related methods.
+
+    Existing singleton instances are read without locking.  A singleton is
+    constructed while holding a lock for only that service, so constructing
+    one service does not block access to any other service.
+    """
 
     def __init__(self):
         """ Initialize the service container mixin. """
         self._service_factories = {}
         self._service_singletons = {}
+        self._service_depends = {}
+        self._service_teardowns = {}
+        self._service_futures = {}
         self._service_instances = {}
+        self._service_locks = {}
+        self._service_pools = {}
         self._service_lock = threading.RLock()
     
     def register_factory(self, name, factory):
@@ -38,40 +196,163 @@ class ServiceContainerMixin(object):
 
     def call_factory(self, name, *args, **kwargs):
         """ Call a factory. """
-        if not name in self._service_factories:
-            raise KeyError("No such service factory{0}".format(name))
+        factory = self._service_factories.get(name)
+        if factory is None:
+            raise KeyError("No such service factory {0}".format(name))
 
-        with self._service_lock:
-            factory = self._service_factories[name]
-            return factory(*args, **kwargs)
+        return factory(*args, **kwargs)
+
+    def register_pool(self, name, factory, max_size=None, idle_timeout=None,
+                      destroy=None, thread_affinity=True):
+        """ Register a pooled service. This should occur in the main thread.
+
+        See `ServicePool` for the parameters.
+        """
+        self._service_pools[name] = ServicePool(
+            factory,
+            max_size=max_size,
+            idle_timeout=idle_timeout,
+            destroy=destroy,
+            thread_affinity=thread_affinity
+        )
+
+    def unregister_pool(self, name):
+        """ Remove a pooled service. This should occur in the main thread.
+
+        Idle instances are discarded, instances in use are discarded when
+        released.
+        """
+        pool = self._service_pools.pop(name, None)
+        if pool is not None:
+            pool.close()
+
+    def get_pool(self, name):
+        """ Return the pool of a pooled service. """
+        pool = self._service_pools.get(name)
+        if pool is None:
+            raise KeyError("No such service pool {0}".format(name))
+        return pool
+
+    @contextmanager
+    def acquire_service(self, name, timeout=None):
+        """ Use an instance of a pooled service within a with context.
+
+        The instance is returned to the pool at the end of the context.
 
-    def register_singleton(self, name, factory):
-        """ Registry a singleton. This should occur in the main thread. """
+            with app.acquire_service("parser") as parser:
+                parser.parse(data)
+        """
+        pool = self.get_pool(name)
+        instance = pool.acquire(timeout)
+        try:
+            yield instance
+        finally:
+            pool.release(instance)
+
+    def register_singleton(self, name, factory, depends=(), teardown=None):
+        """ Registry a singleton. This should occur in the main thread.
+
+        The depends are the names of singletons the factory uses.  They are
+        used to order construction in `warm_up` and teardown, the factory
+        should still get them itself with `get_singleton`.
+
+        The factory may be a coroutine function, in which case the singleton
+        must be accessed with `aget_singleton`.  The teardown, if given, is
+        called with the instance by `close_singletons` or `aclose_singletons`
+        and may also be a coroutine function when using the latter.
+        """
         self._service_singletons[name] = factory
-    
+        self._service_depends[name] = tuple(depends)
+        if teardown is not None:
+            self._service_teardowns[name] = teardown
+        else:
+            self._service_teardowns.pop(name, None)
+
     def unregister_singleton(self, name):
         """ Remove a registered singleton. This should occur in the main thread. """
         self._service_singletons.pop(name, None)
+        self._service_depends.pop(name, None)
+        self._service_teardowns.pop(name, None)
         self.clear_singleton(name)
 
     def get_singleton(self, name):
         """ Get the service instance. """
-        if not name in self._service_singletons:
+        # Fast path, no locking once the instance exists
+        obj = self._service_instances.get(name, SENTINEL)
+        if obj is not SENTINEL:
+            return obj
+
+        factory = self._service_singletons.get(name)
+        if factory is None:
             raise KeyError("No such service singleton {0}".format(name))
 
-        with self._service_lock:
-            factory = self._service_singletons[name]
+        with self._get_service_lock(name):
+            # check if another thread set while we were waiting on lock
+            obj = self._service_instances.get(name, SENTINEL)
+            if obj is SENTINEL:
+                obj = factory()
+                if isinstance(obj, types.CoroutineType):
+                    obj.close()
+                    raise TypeError(
+                        "Service singleton {0} has an async factory, use aget_singleton".format(name)
+                    )
+                self._service_instances[name] = obj
+            return obj
 
-            if name in self._service_instances:
-                return self._service_instances[name]
+    async def aget_singleton(self, name):
+        """ Get the service instance from a coroutine.
 
-            # Object not set yet:
-            obj = self._service_instances[name] = factory()
+        The factory may be a coroutine function.  Concurrent calls for the same
+        singleton share a single construction, and if the construction fails
+        all of them raise the exception.  The construction runs as its own
+        task, so cancelling a caller does not cancel it for the others.
+        """
+        obj = self._service_instances.get(name, SENTINEL)
+        if obj is not SENTINEL:
             return obj
 
+        factory = self._service_singletons.get(name)
+        if factory is None:
+            raise KeyError("No such service singleton {0}".format(name))
+
+        import asyncio
+
+        task = self._service_futures.get(name)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(
+                self._aconstruct_singleton(name, factory)
+            )
+            # Retrieve the exception in case every waiter was cancelled
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._service_futures[name] = task
+
+        # Shielded so cancelling one waiter doesn't cancel the others
+        return await asyncio.shield(task)
+
+    async def _aconstruct_singleton(self, name, factory):
+        """ Construct a singleton as a task shared by all waiters. """
+        try:
+            obj = factory()
+            if isinstance(obj, types.CoroutineType):
+                obj = await obj
+
+            with self._get_service_lock(name):
+                # a thread may have set the instance in the meantime
+                return self._service_instances.setdefault(name, obj)
+        finally:
+            self._service_futures.pop(name, None)
+
+    def _get_service_lock(self, name):
+        """ Return the construction lock for a single service. """
+        lock = self._service_locks.get(name)
+        if lock is None:
+            with self._service_lock:
+                lock = self._service_locks.setdefault(name, threading.RLock())
+        return lock
+
     def clear_singleton(self, name):
         """ Remove the current service singleton instance if any. """
-        with self._service_lock:
+        with self._get_service_lock(name):
             self._service_instances.pop(name, None)
     
     def clear_singletons(self):
@@ -79,8 +360,134 @@ class ServiceContainerMixin(object):
         with self._service_lock:
             self._service_instances.clear()
 
+    def _teardown_order(self):
+        """ Return the names of existing instances, dependents first. """
+        depends = {
+            name: [
+                depend for depend in self._service_depends.get(name, ())
+                if depend in self._service_instances
+            ]
+            for name in self._service_instances
+        }
+        from ..sort import depends_waves
+        order = [name for wave in depends_waves(depends) for name in wave]
+        order.reverse()
+        return order
+
+    def _pop_instance(self, name):
+        """ Remove an instance and return it with its teardown. """
+        with self._get_service_lock(name):
+            obj = self._service_instances.pop(name, SENTINEL)
+        return (obj, self._service_teardowns.get(name))
+
+    def close_singletons(self):
+        """ Remove all service singleton instances, tearing them down.
+
+        Instances are torn down before the instances they depend on.  If a
+        teardown raises an exception, the remaining instances are still torn
+        down and the first exception is raised.
+        """
+        error = None
+        for name in self._teardown_order():
+            (obj, teardown) = self._pop_instance(name)
+            if obj is SENTINEL or teardown is None:
+                continue
+
+            try:
+                result = teardown(obj)
+                if isinstance(result, types.CoroutineType):
+                    result.close()
+                    raise TypeError(
+                        "Service singleton {0} has an async teardown, use aclose_singletons".format(name)
+                    )
+            except Exception as exc: # pylint: disable=broad-except
+                if error is None:
+                    error = exc
+
+        if error is not None:
+            raise error
+
+    async def aclose_singletons(self):
+        """ Remove all service singleton instances, tearing them down.
+
+        This is the same as `close_singletons` but also awaits teardowns that
+        are coroutine functions.
+        """
+        error = None
+        for name in self._teardown_order():
+            (obj, teardown) = self._pop_instance(name)
+            if obj is SENTINEL or teardown is None:
+                continue
+
+            try:
+                result = teardown(obj)
+                if isinstance(result, types.CoroutineType):
+                    await result
+            except Exception as exc: # pylint: disable=broad-except
+                if error is None:
+                    error = exc
+
+        if error is not None:
+            raise error
+
     def set_service_singleton(self, name, instance):
         """ Manually set the instance. """
-        with self._service_lock:
+        with self._get_service_lock(name):
             self._service_instances[name] = instance
 
+    def warm_up(self, services=None, executor=None, max_workers=None):
+        """ Construct singletons ahead of time.
+
+        The singletons and the singletons they depend on are grouped into waves
+        by their dependencies.  The singletons within a wave are constructed
+        concurrently on the executor, and each wave is finished before the next
+        one starts, so the total time is close to the longest dependency chain
+        instead of the sum of all construction times.
+
+        If an executor is not given, a thread pool with max_workers threads is
+        used for the duration of the call.  If any factory raises an exception,
+        the current wave is finished and the first exception is raised.
+        """
+        if services is None:
+            services = tuple(self._service_singletons)
+
+        # Collect the requested services and their dependencies
+        depends = {}
+        pending = list(services)
+        while pending:
+            name = pending.pop()
+            if name in depends:
+                continue
+            if not name in self._service_singletons:
+                raise KeyError("No such service singleton {0}".format(name))
+
+            depends[name] = self._service_depends.get(name, ())
+            pending.extend(depends[name])
+
+        from ..sort import depends_waves
+        waves = depends_waves(depends)
+
+        if executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                self._warm_up_waves(waves, pool)
+        else:
+            self._warm_up_waves(waves, executor)
+
+    def _warm_up_waves(self, waves, executor):
+        """ Construct each wave of singletons concurrently. """
+        for wave in waves:
+            futures = [
+                executor.submit(self.get_singleton, name)
+                for name in wave
+                if not name in self._service_instances
+            ]
+
+            error = None
+            for future in futures:
+                exc = future.exception()
+                if exc is not None and error is None:
+                    error = exc
+
+            if error is not None:
+                raise error
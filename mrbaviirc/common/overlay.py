@@ -0,0 +1,296 @@
+""" A read-only overlay of several directories. """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+__all__ = ["OverlayFS"]
+
+
+import os
+from typing import Any, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .path import AppPathsBase, DirectoryIndex
+
+
+class OverlayFS:
+    """ Present several directories as a single read-only directory tree.
+
+    The layers are searched in order, so a file in an earlier layer hides the
+    file of the same path in later layers, and a directory lists the merged
+    entries of that directory in all layers.  Each layer is read through a
+    `DirectoryIndex`, and the merged entries of a directory are cached until
+    one of the layers is read again, so finding a file and its metadata
+    normally needs no system calls.  Since the entries are only refreshed when
+    a directory changes, `stat` may return old metadata of a file whose
+    contents were changed in place.
+
+    Paths are relative to the top of the overlay and use "/" as the separator.
+    """
+
+    # Files at least this size are memory mapped by read_bytes
+    MMAP_THRESHOLD = 1024 * 1024
+
+    def __init__(
+            self,
+            dirs: Sequence[Union[str, DirectoryIndex]],
+            ttl: float = 1.0
+    ):
+        """ Initialize the overlay.
+
+        Parameters
+        ----------
+        dirs : Sequence[Union[str, DirectoryIndex]]
+            The layer directories or their indexes, with the highest
+            precedence first.
+        ttl : float, default=1.0
+            The time in seconds before a directory is checked for changes
+            again, for layers given as directory names.
+        """
+        self._layers = tuple(
+            layer if isinstance(layer, DirectoryIndex) else DirectoryIndex(layer, ttl)
+            for layer in dirs
+        )
+        self._merged = {} # reldir: (layer entries, merged entries)
+
+    @classmethod
+    def from_app_paths(
+            cls,
+            paths: AppPathsBase,
+            package: Optional[Any] = None,
+            config: bool = False
+    ) -> "OverlayFS":
+        """ Create an overlay of an application's directories.
+
+        Parameters
+        ----------
+        paths : AppPathsBase
+            The application paths.  The user directory is placed over the
+            system directories.  The directory indexes are shared with paths.
+        package : Optional[Any], default=None
+            If specified, the package whose data directories are placed under
+            the system directories.
+        config : bool, default=False
+            Whether to overlay the configuration directories instead of the
+            data directories.
+
+        Returns
+        -------
+        OverlayFS
+            The overlay of the directories.
+        """
+        if config:
+            dirs = [paths.user_config_dir] + list(paths.sys_config_dirs)
+        else:
+            dirs = [paths.user_data_dir] + list(paths.sys_data_dirs)
+
+        if package is not None:
+            from .platform.commonpath import get_package_data_dir
+            dirs.extend(get_package_data_dir(package))
+
+        return cls([paths.get_index(directory) for directory in dirs])
+
+    @property
+    def layers(self) -> Tuple[str, ...]:
+        """ Return the layer directories, highest precedence first. """
+        return tuple(layer.root for layer in self._layers)
+
+    @staticmethod
+    def _split(relpath):
+        """ Split a relative path into its parts. """
+        parts = [part for part in relpath.split("/") if part and part != "."]
+        if ".." in parts:
+            raise ValueError("Overlay paths may not contain '..': {}".format(relpath))
+
+        return parts
+
+    def _entries(self, reldir):
+        """ Return the merged entries of a directory by name. """
+        layer_entries = tuple(layer.entries(reldir) for layer in self._layers)
+
+        # The indexes return the same dictionaries while nothing has changed
+        cached = self._merged.get(reldir)
+        if cached is not None and len(cached[0]) == len(layer_entries) and all(
+                old is new for (old, new) in zip(cached[0], layer_entries)
+        ):
+            return cached[1]
+
+        merged = {}
+        for entries in reversed(layer_entries):
+            merged.update(entries)
+
+        self._merged[reldir] = (layer_entries, merged)
+        return merged
+
+    def _lookup(self, relpath):
+        """ Return the top-most entry of a path, or None. """
+        parts = self._split(relpath)
+        if not parts:
+            return None
+
+        reldir = ""
+        for part in parts[:-1]:
+            entry = self._entries(reldir).get(part)
+            if entry is None or not entry.is_dir():
+                return None
+            reldir = reldir + "/" + part if reldir else part
+
+        return self._entries(reldir).get(parts[-1])
+
+    def _entry(self, relpath):
+        """ Return the top-most entry of a path, or raise FileNotFoundError. """
+        entry = self._lookup(relpath)
+        if entry is None:
+            raise FileNotFoundError("No such file in overlay: {}".format(relpath))
+
+        return entry
+
+    def exists(self, relpath: str) -> bool:
+        """ Determine if a file or directory exists in any layer. """
+        return not self._split(relpath) or self._lookup(relpath) is not None
+
+    def isdir(self, relpath: str) -> bool:
+        """ Determine if a path is a directory in the overlay. """
+        if not self._split(relpath):
+            return True
+
+        entry = self._lookup(relpath)
+        return entry is not None and entry.is_dir()
+
+    def find(self, relpath: str) -> Optional[str]:
+        """ Return the real path of the top-most file, or None if not found. """
+        entry = self._lookup(relpath)
+        return None if entry is None else entry.path
+
+    def listdir(self, relpath: str = "") -> List[str]:
+        """ Return the sorted names of the merged entries of a directory.
+
+        Parameters
+        ----------
+        relpath : str, default=""
+            The directory to list
+
+        Returns
+        -------
+        List[str]
+            The names of the entries in the directory of all layers.
+        """
+        if not self.isdir(relpath):
+            raise NotADirectoryError("Not a directory in overlay: {}".format(relpath))
+
+        return sorted(self._entries("/".join(self._split(relpath))))
+
+    def stat(self, relpath: str) -> os.stat_result:
+        """ Return the cached stat result of the top-most file.
+
+        Parameters
+        ----------
+        relpath : str
+            The path to stat
+
+        Returns
+        -------
+        os.stat_result
+            The stat result, following symbolic links.
+        """
+        return self._entry(relpath).stat()
+
+    def open(self, relpath: str, mode: str = "rb", **kwargs):
+        """ Open the top-most file for reading.
+
+        Parameters
+        ----------
+        relpath : str
+            The file to open
+        mode : str, default="rb"
+            The mode to open the file with, which must be a read mode.
+        **kwargs
+            Other arguments passed to the builtin open.
+
+        Returns
+        -------
+        The opened file object.
+        """
+        if any(char in mode for char in "wax+"):
+            raise ValueError("The overlay is read-only: {}".format(mode))
+
+        entry = self._entry(relpath)
+        if entry.is_dir():
+            raise IsADirectoryError("Is a directory in overlay: {}".format(relpath))
+
+        return open(entry.path, mode, **kwargs)
+
+    def read_bytes(self, relpath: str) -> Union[bytes, "mmap.mmap"]:
+        """ Read the contents of the top-most file.
+
+        Files smaller than MMAP_THRESHOLD are read into a bytes object.
+        Larger files are memory mapped read-only so their pages are only read
+        when used and are shared with other processes mapping the same file.
+
+        Parameters
+        ----------
+        relpath : str
+            The file to read
+
+        Returns
+        -------
+        bytes
+            The contents of a small file.
+        mmap.mmap
+            A read-only mapping of a large file, which supports the buffer
+            protocol and slicing like bytes.
+        """
+        with self.open(relpath, "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if size < self.MMAP_THRESHOLD:
+                return handle.read()
+
+            import mmap
+            return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def walk(self, relpath: str = "") -> Iterator[Tuple[str, List[str], List[str]]]:
+        """ Walk the merged directory tree top-down.
+
+        Like os.walk, the list of directory names may be modified in place to
+        limit which directories are visited.
+
+        Parameters
+        ----------
+        relpath : str, default=""
+            The directory to start at
+
+        Yields
+        ------
+        Tuple[str, List[str], List[str]]
+            The relative path of each directory and the sorted names of its
+            directories and other files.
+        """
+        if not self.isdir(relpath):
+            return
+
+        pending = ["/".join(self._split(relpath))]
+        while pending:
+            reldir = pending.pop()
+            entries = self._entries(reldir)
+
+            dirnames = []
+            filenames = []
+            for name in sorted(entries):
+                try:
+                    is_dir = entries[name].is_dir()
+                except OSError:
+                    is_dir = False
+                (dirnames if is_dir else filenames).append(name)
+
+            yield (reldir, dirnames, filenames)
+
+            pending.extend(
+                reldir + "/" + name if reldir else name
+                for name in reversed(dirnames)
+            )
+
+    def clear_cache(self):
+        """ Forget all cached directory entries. """
+        for layer in self._layers:
+            layer.invalidate()
+        self._merged = {}
@@ -4,22 +4,147 @@ __author__ = "Brian Allen Vanderburg II"
 __copyright__ = "Copyright (C) 2018-2019 Brian Allen Vanderburg II"
 __license__ = "Apache License 2.0"
 
-__all__ = ["AppPathsBase", "AppPaths"]
+__all__ = ["DirectoryIndex", "AppPathsBase", "AppPaths"]
 
 
 import os
-import tempfile
-from typing import Sequence, Optional
+import time
+from typing import Dict, List, Sequence, Optional
 
 from . import platform
 
 
+class DirectoryIndex:
+    """ An in-memory index of the files below a directory.
+
+    Each directory is read with `os.scandir` the first time it is needed and
+    its entries are kept by name.  A cached directory is checked again for a
+    changed modification time at most once every ttl seconds, and is read
+    again if it has changed, so finding files mostly costs dictionary lookups
+    instead of stat calls.  The cache is only changed by replacing single
+    items, so the index may be shared between threads without locking.  Note
+    that changes to a file's contents do not change the modification time of
+    its directory.
+    """
+
+    def __init__(self, root: str, ttl: float = 1.0):
+        """ Initialize the index.
+
+        Parameters
+        ----------
+        root : str
+            The directory to index.
+        ttl : float, default=1.0
+            The time in seconds before a cached directory is checked for
+            changes again.
+        """
+        self._root = root
+        self._ttl = ttl
+        self._dirs = {} # relative dir: (mtime, checked, entries)
+
+    @property
+    def root(self) -> str:
+        """ Return the indexed directory. """
+        return self._root
+
+    def invalidate(self):
+        """ Forget all cached directories. """
+        self._dirs = {}
+
+    @staticmethod
+    def _scan(path):
+        """ Return the modification time and entries of a directory. """
+        try:
+            # Stat first so a change during the scan is seen by the next check
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as handle:
+                entries = {entry.name: entry for entry in handle}
+        except (FileNotFoundError, NotADirectoryError):
+            return (None, {})
+
+        return (mtime, entries)
+
+    def entries(self, reldir: str = "") -> Dict[str, os.DirEntry]:
+        """ Return the entries of a directory by name.
+
+        Parameters
+        ----------
+        reldir : str, default=""
+            The directory relative to the root, using "/" as the separator.
+
+        Returns
+        -------
+        Dict[str, os.DirEntry]
+            The entries of the directory, empty if it doesn't exist.  The
+            dictionary must not be modified.
+        """
+        reldir = reldir.strip("/")
+        now = time.monotonic()
+        cached = self._dirs.get(reldir)
+        if cached is not None and now - cached[1] < self._ttl:
+            return cached[2]
+
+        path = os.path.join(self._root, *reldir.split("/")) if reldir else self._root
+        if cached is not None:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                mtime = None
+
+            if mtime == cached[0]:
+                self._dirs[reldir] = (mtime, now, cached[2])
+                return cached[2]
+
+        (mtime, entries) = self._scan(path)
+        self._dirs[reldir] = (mtime, now, entries)
+        return entries
+
+    def lookup(self, relpath: str) -> Optional[os.DirEntry]:
+        """ Find the entry of a file or directory.
+
+        Parameters
+        ----------
+        relpath : str
+            The path relative to the root, using "/" as the separator.  Paths
+            containing ".." are not found.
+
+        Returns
+        -------
+        os.DirEntry
+            The entry if found
+        None
+            If the path does not exist
+        """
+        parts = [part for part in relpath.split("/") if part and part != "."]
+        if not parts or ".." in parts:
+            return None
+
+        reldir = ""
+        for part in parts[:-1]:
+            entry = self.entries(reldir).get(part)
+            if entry is None or not entry.is_dir():
+                return None
+            reldir = reldir + "/" + part if reldir else part
+
+        return self.entries(reldir).get(parts[-1])
+
+
 class AppPathsBase:
-    """ An application path base object. """
+    """ An application path base object.
+
+    Files are found in the data and configuration directories through a
+    `DirectoryIndex` of each directory, with the user directory searched
+    before the system directories.
+    """
+
+    # Time in seconds before an indexed directory is checked for changes
+    index_ttl = 1.0
+
     def __init__(self):
         """ Initialize the applications paths object. """
 
         self._temp_dir = None
+        self._indexes = {}
 
     # Many of the paths are just implemented as properties
     @property
@@ -99,16 +224,121 @@ class AppPathsBase:
             A temp directory for storing files.
         """
         if self._temp_dir is None or not os.path.isdir(self._temp_dir):
-            self._temp_dir = tempfile.mkdtemp()
+            from .tempdir import get_temp_area
+            self._temp_dir = get_temp_area().mkdtemp()
 
         return self._temp_dir
 
+    def get_index(self, directory: str) -> DirectoryIndex:
+        """ Return the shared index of a directory.
+
+        Parameters
+        ----------
+        directory : str
+            The directory to index.
+
+        Returns
+        -------
+        DirectoryIndex
+            The index of the directory.
+        """
+        index = self._indexes.get(directory)
+        if index is None:
+            index = self._indexes.setdefault(
+                directory, DirectoryIndex(directory, self.index_ttl)
+            )
+
+        return index
+
+    def _find(self, dirs, relpath, first):
+        """ Return the paths of relpath found in the directories. """
+        found = []
+        for directory in dirs:
+            if self.get_index(directory).lookup(relpath) is not None:
+                found.append(os.path.join(directory, *relpath.strip("/").split("/")))
+                if first:
+                    break
+
+        return found
+
+    def find_data(self, relpath: str) -> Optional[str]:
+        """ Find a data file in the user and system data directories.
+
+        Parameters
+        ----------
+        relpath : str
+            The path of the file relative to the data directories, using "/"
+            as the separator.
+
+        Returns
+        -------
+        str
+            The path of the file from the first directory containing it.
+        None
+            If the file was not found.
+        """
+        found = self._find((self.user_data_dir,) + tuple(self.sys_data_dirs), relpath, True)
+        return found[0] if found else None
+
+    def find_all_data(self, relpath: str) -> List[str]:
+        """ Find a data file in all user and system data directories.
+
+        Parameters
+        ----------
+        relpath : str
+            See `find_data`
+
+        Returns
+        -------
+        List[str]
+            The paths of the file in each directory containing it, in the
+            order the directories are searched.
+        """
+        return self._find((self.user_data_dir,) + tuple(self.sys_data_dirs), relpath, False)
+
+    def find_config(self, relpath: str) -> Optional[str]:
+        """ Find a file in the user and system configuration directories.
+
+        Parameters
+        ----------
+        relpath : str
+            The path of the file relative to the configuration directories,
+            using "/" as the separator.
+
+        Returns
+        -------
+        str
+            The path of the file from the first directory containing it.
+        None
+            If the file was not found.
+        """
+        found = self._find((self.user_config_dir,) + tuple(self.sys_config_dirs), relpath, True)
+        return found[0] if found else None
+
+    def find_all_config(self, relpath: str) -> List[str]:
+        """ Find a file in all user and system configuration directories.
+
+        Parameters
+        ----------
+        relpath : str
+            See `find_config`
+
+        Returns
+        -------
+        List[str]
+            The paths of the file in each directory containing it, in the
+            order the directories are searched.
+        """
+        return self._find((self.user_config_dir,) + tuple(self.sys_config_dirs), relpath, False)
+
 
 class AppPaths(AppPathsBase):
     """ An applications paths object.
 
     This application paths object uses the default platform path to get path
-    names.  It contains the appname, version, and vendor information.
+    names.  It contains the appname, version, and vendor information.  The
+    paths are cached and only computed again when an environment variable
+    they depend on changes.
     """
 
     def __init__(
@@ -139,39 +369,67 @@ class AppPaths(AppPathsBase):
         self._vendor = vendor
         self._prefix = prefix
         self._paths = platform.path
+        self._environment = getattr(self._paths, "ENVIRONMENT", {})
+        self._cache = {}
+
+    def _cached(self, func_name, *args):
+        """ Call a platform path function, caching the result.
+
+        The result is reused until any of the environment variables the
+        platform declares for the function changes.  Lists are returned as
+        tuples so the cached value can't be modified.
+        """
+        environ = os.environ
+        fingerprint = tuple([environ.get(key) for key in self._environment.get(func_name, ())])
+
+        entry = self._cache.get(func_name)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+
+        value = getattr(self._paths, func_name)(*args)
+        if isinstance(value, list):
+            value = tuple(value)
+
+        self._cache[func_name] = (fingerprint, value)
+        return value
+
+    def clear_cache(self):
+        """ Forget all cached paths. """
+        self._cache = {}
 
     @property
     def user_data_dir(self):
-        return self._paths.get_user_data_dir(
-            self._appname, self._version, self._vendor
+        return self._cached(
+            "get_user_data_dir", self._appname, self._version, self._vendor
         )
 
     @property
     def sys_data_dirs(self):
-        return self._paths.get_sys_data_dirs(
+        return self._cached(
+            "get_sys_data_dirs",
             self._appname, self._version, self._vendor, self._prefix
         )
 
     @property
     def user_config_dir(self):
-        return self._paths.get_user_config_dir(
-            self._appname, self._version, self._vendor
+        return self._cached(
+            "get_user_config_dir", self._appname, self._version, self._vendor
         )
 
     @property
     def sys_config_dirs(self):
-        return self._paths.get_sys_config_dirs(
-            self._appname, self._version, self._vendor
+        return self._cached(
+            "get_sys_config_dirs", self._appname, self._version, self._vendor
         )
 
     @property
     def cache_dir(self):
-        return self._paths.get_cache_dir(
-            self._appname, self._version, self._vendor
+        return self._cached(
+            "get_cache_dir", self._appname, self._version, self._vendor
         )
 
     @property
     def runtime_dir(self):
-        return self._paths.get_runtime_dir(
-            self._appname, self._version, self._vendor
+        return self._cached(
+            "get_runtime_dir", self._appname, self._version, self._vendor
         )
@@ -4,17 +4,21 @@ __author__      =   "Brian Allen Vanderburg II"
 __copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
 __license__     =   "Apache License 2.0"
 
-__all__ = []
+__all__ = ["Signal"]
 
 
-from .sigslot import *
-from .sigslot import __all__ as _tmp
-__all__.extend(_tmp)
-del _tmp
+# Names are imported from their submodules when first accessed
+_EXPORTS = {
+    "Signal": ".sigslot"
+}
 
-from .listener import *
-from .listener import __all__ as _tmp
-__all__.extend(_tmp)
-del _tmp
 
+def __getattr__(name):
+    """ Import an exported name when first accessed (PEP 562). """
+    module = _EXPORTS.get(name)
+    if module is not None:
+        import importlib
+        value = globals()[name] = getattr(importlib.import_module(module, __name__), name)
+        return value
 
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
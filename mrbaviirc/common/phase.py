@@ -0,0 +1,165 @@
+""" Ordered, timed execution of application phase steps. """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+__all__ = ["Phase"]
+
+
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from .sort import depends_waves
+from .time import StopWatch
+
+
+class Phase:
+    """ A named set of steps run in dependency order.
+
+    Steps are grouped into waves by their dependencies.  The steps within a
+    wave do not depend on each other and are run concurrently on an executor,
+    and each wave finishes before the next one starts.  The duration of each
+    step is measured and available from `timings` after running.
+    """
+
+    def __init__(self, name: str):
+        """ Initialize the phase.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase, such as "startup"
+        """
+        self._name = name
+        self._lock = threading.RLock()
+        self._steps = {}
+        self._depends = {}
+        self._timings = {}
+        self._elapsed = 0.0
+
+    @property
+    def name(self) -> str:
+        """ Return the name of the phase. """
+        return self._name
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """ Return the duration in seconds of each step of the last run. """
+        return dict(self._timings)
+
+    @property
+    def elapsed(self) -> float:
+        """ Return the total duration in seconds of the last run. """
+        return self._elapsed
+
+    def add_step(
+            self,
+            name: str,
+            func: Callable[[], Any],
+            depends: Sequence[str] = ()
+    ):
+        """ Add a step to the phase.
+
+        Parameters
+        ----------
+        name : str
+            The name of the step
+        func : Callable[[], Any]
+            Called with no arguments to perform the step
+        depends : Sequence[str], default=()
+            The names of the steps which must finish before this step starts
+        """
+        with self._lock:
+            if name in self._steps:
+                raise ValueError("Duplicate {} step: {}".format(self._name, name))
+
+            self._steps[name] = func
+            self._depends[name] = tuple(depends)
+
+    def remove_step(self, name: str):
+        """ Remove a step from the phase.
+
+        Parameters
+        ----------
+        name : str
+            The name of the step
+        """
+        with self._lock:
+            self._steps.pop(name, None)
+            self._depends.pop(name, None)
+
+    def run(self, executor=None, max_workers: Optional[int] = None) -> Dict[str, float]:
+        """ Run the steps of the phase.
+
+        If any step raises an exception, the current wave is finished and the
+        first exception is raised.
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            The executor to run concurrent steps on.  If not specified, a thread
+            pool is created when a wave has more than one step.
+        max_workers : Optional[int], default=None
+            The number of threads of the created thread pool.
+
+        Returns
+        -------
+        Dict[str, float]
+            The duration in seconds of each step that was run.
+        """
+        with self._lock:
+            steps = dict(self._steps)
+            depends = dict(self._depends)
+
+        for (name, step_depends) in depends.items():
+            for depend in step_depends:
+                if not depend in steps:
+                    raise KeyError("{} step {} depends on unknown step {}".format(
+                        self._name, name, depend
+                    ))
+
+        waves = depends_waves(depends)
+        timings = {}
+        pool = None
+
+        try:
+            with StopWatch(True) as total:
+                for wave in waves:
+                    if len(wave) == 1:
+                        self._run_step(wave[0], steps[wave[0]], timings)
+                        continue
+
+                    if executor is None and pool is None:
+                        from concurrent.futures import ThreadPoolExecutor
+                        pool = ThreadPoolExecutor(max_workers=max_workers)
+
+                    futures = [
+                        (executor or pool).submit(self._run_step, name, steps[name], timings)
+                        for name in wave
+                    ]
+
+                    error = None
+                    for future in futures:
+                        exc = future.exception()
+                        if exc is not None and error is None:
+                            error = exc
+
+                    if error is not None:
+                        raise error
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            self._timings = timings
+            self._elapsed = total.time
+
+        return dict(timings)
+
+    @staticmethod
+    def _run_step(name, func, timings):
+        """ Run and time a single step. """
+        watch = StopWatch(True)
+        try:
+            func()
+        finally:
+            timings[name] = watch.stop()
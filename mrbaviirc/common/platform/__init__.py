@@ -1,4 +1,9 @@
-""" Some platform helper functions. """
+""" Some platform helper functions.
+
+The platform path module is imported the first time the path attribute is
+used.  Platforms without a specific path module use the XDG base directory
+layout of linuxpath.
+"""
 
 __author__ = "Brian Allen Vanderburg II"
 __copyright__ = "Copyright (C) 2018-2019 Brian Allen Vanderburg II"
@@ -10,15 +15,38 @@ __all__ = ["path"]
 import sys as _sys
 
 
-# path
-_platform = _sys.platform # pylint: disable=invalid-name
+# Path module by sys.platform prefix
+_PATH_MODULES = (
+    ("linux", "linuxpath"),
+    #("win32", "winpath"),
+    #("darwin", "macpath"),
+)
+
+_DEFAULT_PATH_MODULE = "linuxpath"
+
+
+def _path_module_name(platform=None):
+    """ Return the name of the path module for a platform. """
+    if platform is None:
+        platform = _sys.platform
+
+    for (prefix, name) in _PATH_MODULES:
+        if platform.startswith(prefix):
+            return name
+
+    return _DEFAULT_PATH_MODULE
+
+
+def __getattr__(name):
+    """ Import the platform path module when first used. """
+    if name == "path":
+        from importlib import import_module
+        module = import_module("." + _path_module_name(), __name__)
+        globals()["path"] = module
+        return module
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
 
-if _platform.startswith("linux"):
-    from . import linuxpath as path
-#elif _platform == "win32"
-#    from . import winpath as path
-#elif _platform == "darwin":
-#    from . import macpath as path
-else:
-    # Should be raise an error or use a generic path module
-    raise RuntimeError("Currently unsupported platform for mrbaviirc.common")
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
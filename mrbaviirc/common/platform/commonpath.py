@@ -8,7 +8,6 @@ __all__ = ["get_package_data_dir", "get_temp_dir"]
 
 
 import os
-import tempfile
 
 
 def get_package_data_dir(package, first=False):
@@ -22,5 +21,6 @@ def get_package_data_dir(package, first=False):
 
 
 def get_temp_dir():
-    """ Return a new temporary directory. """
-    return tempfile.mkdtemp()
+    """ Return a new temporary directory in the managed temporary area. """
+    from ..tempdir import get_temp_area
+    return get_temp_area().mkdtemp()
@@ -0,0 +1,168 @@
+""" Minimal Linux inotify binding using ctypes. """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+__all__ = [
+    "Inotify", "available",
+    "IN_MODIFY", "IN_ATTRIB", "IN_CLOSE_WRITE", "IN_MOVED_FROM", "IN_MOVED_TO",
+    "IN_CREATE", "IN_DELETE", "IN_DELETE_SELF", "IN_MOVE_SELF",
+    "IN_Q_OVERFLOW", "IN_IGNORED", "IN_ONLYDIR"
+]
+
+
+import ctypes
+import os
+import struct
+import sys
+from typing import List, Tuple, Optional
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o0004000
+
+_EVENT = struct.Struct("iIII")
+_libc = None # pylint: disable=invalid-name
+
+
+def _get_libc():
+    """ Load the C library functions once. """
+    global _libc # pylint: disable=global-statement,invalid-name
+
+    if _libc is None:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_init1.restype = ctypes.c_int
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32
+        ]
+        libc.inotify_add_watch.restype = ctypes.c_int
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        libc.inotify_rm_watch.restype = ctypes.c_int
+        _libc = libc
+
+    return _libc
+
+
+def _check(result: int) -> int:
+    """ Raise an OSError for a failed libc call. """
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+    return result
+
+
+def available() -> bool:
+    """ Determine if inotify can be used.
+
+    Returns
+    -------
+    bool
+        True if running on Linux and the C library provides inotify.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+
+    try:
+        libc = _get_libc()
+        return hasattr(libc, "inotify_init1")
+    except (OSError, AttributeError):
+        return False
+
+
+class Inotify:
+    """ An inotify instance.
+
+    The file descriptor is non-blocking, so the `fileno` method should be
+    used with select to wait for events before calling `read`.
+    """
+
+    def __init__(self):
+        """ Create the inotify instance. """
+        self._libc = _get_libc()
+        self._fd = _check(self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC))
+
+    def fileno(self) -> int:
+        """ Return the inotify file descriptor. """
+        return self._fd
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """ Add a watch for a path.
+
+        Parameters
+        ----------
+        path : str
+            The file or directory to watch
+        mask : int
+            The events to watch for
+
+        Returns
+        -------
+        int
+            The watch descriptor
+        """
+        return _check(
+            self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        )
+
+    def rm_watch(self, wd: int):
+        """ Remove a previously added watch.
+
+        Parameters
+        ----------
+        wd : int
+            The watch descriptor returned by `add_watch`
+        """
+        _check(self._libc.inotify_rm_watch(self._fd, wd))
+
+    def read(self) -> List[Tuple[int, int, int, Optional[str]]]:
+        """ Read all pending events.
+
+        Returns
+        -------
+        List[Tuple[int, int, int, Optional[str]]]
+            A list of (wd, mask, cookie, name) tuples.  The name is None for
+            events on the watched path itself.
+        """
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            (wd, mask, cookie, length) = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, cookie, os.fsdecode(name) if name else None))
+
+        return events
+
+    def close(self):
+        """ Close the inotify instance. """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
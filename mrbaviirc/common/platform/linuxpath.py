@@ -6,24 +6,34 @@ __license__ = "Apache License 2.0"
 
 __all__ = [
     "get_user_data_dir", "get_sys_data_dirs", "get_user_config_dir",
-    "get_sys_config_dirs", "get_cache_dir", "get_runtime_dir"
+    "get_sys_config_dirs", "get_cache_dir", "get_runtime_dir", "ENVIRONMENT",
+    "get_package_data_dir", "get_temp_dir"
 ]
 
 
 import os
-import tempfile
 
 # bring in common paths
-from .commonpath import * # pylint: disable=wildcard-import
-from . import commonpath as _common
-__all__.extend(_common.__all__)
-del _common
+from .commonpath import get_package_data_dir, get_temp_dir
 
 
+# The environment variables each function's result depends on
+ENVIRONMENT = {
+    "get_user_data_dir": ("XDG_DATA_HOME", "HOME"),
+    "get_sys_data_dirs": ("XDG_DATA_DIRS", "HOME"),
+    "get_user_config_dir": ("XDG_CONFIG_HOME", "HOME"),
+    "get_sys_config_dirs": ("XDG_CONFIG_DIRS",),
+    "get_cache_dir": ("XDG_CACHE_HOME", "HOME"),
+    "get_runtime_dir": ("XDG_RUNTIME_DIR",),
+}
+
 def _uniq(items):
+    """ Remove duplicate items, keeping the first of each. """
+    seen = set()
     copy = []
     for i in items:
-        if not i in copy:
+        if not i in seen:
+            seen.add(i)
             copy.append(i)
     return copy
 
@@ -97,13 +107,16 @@ def get_cache_dir(name=None, version=None, vendor=None):
     return _normalize(base, vendor, name, version)
 
 def get_runtime_dir(name=None, version=None, vendor=None):
-    """ Return base directory for runtime files. """
+    """ Return base directory for runtime files.
+
+    If XDG_RUNTIME_DIR is not set, the runtime directory of the managed
+    temporary area is used instead, which is private to the user and shared
+    by all of its processes.
+    """
     runtimedir = os.environ.get("XDG_RUNTIME_DIR")
 
-    if os.path.isdir(runtimedir):
-        return _normalize(runtimedir, vendor, name, version)
+    if runtimedir is None or not os.path.isdir(runtimedir):
+        from ..tempdir import get_temp_area
+        runtimedir = get_temp_area().runtime_dir
 
-    # log warning once logging module is done
-    # perhaps should return None if no runtime dir and let application
-    # handle it, or add an atexit handler to cleanup the function when done
-    return tempfile.mkdtemp()
+    return _normalize(runtimedir, vendor, name, version)
@@ -0,0 +1,215 @@
+""" Pre-forked worker process supervision. """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+__all__ = ["PreforkSupervisor"]
+
+
+import os
+import signal
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+
+def _exit_code(status: int) -> int:
+    """ Convert a wait status to an exit code, negative for a signal. """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
+
+
+class PreforkSupervisor:
+    """ Fork worker processes and supervise them.
+
+    Everything loaded before `run` is called is shared with the workers as
+    copy-on-write memory.  Threads of the parent are not running in the
+    workers, so any threads should be started by the workers themselves.
+
+    Each worker calls the target with its index and exits with the returned
+    exit code, or 1 if the target raised an exception.  A worker that exits
+    with a non-zero code or is killed is started again if respawn is enabled,
+    waiting at least respawn_delay seconds between starts of the same worker.
+    On SIGTERM or SIGINT, or when `stop` is called, SIGTERM is sent to all
+    workers, and any worker still running after term_timeout seconds is killed.
+    """
+
+    def __init__(
+            self,
+            target: Callable[[int], Optional[int]],
+            workers: int,
+            respawn: bool = True,
+            respawn_delay: float = 1.0,
+            term_timeout: float = 10.0
+    ):
+        """ Initialize the supervisor.
+
+        Parameters
+        ----------
+        target : Callable[[int], Optional[int]]
+            Called in each worker with the worker index.
+        workers : int
+            The number of worker processes.
+        respawn : bool, default=True
+            Whether to restart workers that fail.
+        respawn_delay : float, default=1.0
+            The minimum time in seconds between starts of the same worker.
+        term_timeout : float, default=10.0
+            The time in seconds to wait for workers to exit after SIGTERM.
+        """
+        if workers < 1:
+            raise ValueError("At least one worker is required")
+
+        self._target = target
+        self._workers = workers
+        self._respawn = respawn
+        self._respawn_delay = respawn_delay
+        self._term_timeout = term_timeout
+        self._pids = {} # pid: index
+        self._started = {} # index: start time
+        self._exit_codes = {}
+        self._stopping = False
+
+    @property
+    def exit_codes(self) -> Dict[int, int]:
+        """ Return the last exit code of each worker by index. """
+        return dict(self._exit_codes)
+
+    def stop(self):
+        """ Request the workers to shut down. """
+        if not self._stopping:
+            self._stopping = True
+            self._signal_workers(signal.SIGTERM)
+
+    def run(self) -> int:
+        """ Run the workers until they all exit.
+
+        Returns
+        -------
+        int
+            0 if all workers last exited successfully, otherwise the first
+            non-zero exit code by worker index.  After a shutdown request,
+            workers ended by SIGTERM count as successful.
+        """
+        self._stopping = False
+        handlers = {
+            signum: signal.signal(signum, self._handle_signal)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+
+        try:
+            for index in range(self._workers):
+                self._spawn(index)
+
+            self._supervise()
+        finally:
+            for (signum, handler) in handlers.items():
+                signal.signal(signum, handler)
+
+            # Don't leave workers behind if supervision failed
+            if self._pids:
+                self._signal_workers(signal.SIGKILL)
+                self._reap(block=True)
+
+        # Workers ended by a requested shutdown exited successfully
+        success = (0, -signal.SIGTERM) if self._stopping else (0,)
+        for index in sorted(self._exit_codes):
+            if self._exit_codes[index] not in success:
+                return self._exit_codes[index]
+
+        return 0
+
+    def _handle_signal(self, signum, frame): # pylint: disable=unused-argument
+        """ Begin a graceful shutdown. """
+        self.stop()
+
+    def _signal_workers(self, signum):
+        """ Send a signal to all running workers. """
+        for pid in tuple(self._pids):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _spawn(self, index):
+        """ Fork a worker. """
+        self._started[index] = time.monotonic()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+        if pid == 0:
+            self._worker(index)
+
+        self._pids[pid] = index
+
+    def _worker(self, index):
+        """ Run the target in the worker process and exit. """
+        code = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            result = self._target(index)
+            code = result if isinstance(result, int) else 0
+        except SystemExit as exc:
+            code = exc.code if isinstance(exc.code, int) else (0 if exc.code is None else 1)
+        except BaseException: # pylint: disable=broad-except
+            import traceback
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code) # pylint: disable=protected-access
+
+    def _reap(self, block):
+        """ Collect exited workers and return their (index, exit code). """
+        results = []
+        while self._pids:
+            try:
+                (pid, status) = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                self._pids.clear()
+                break
+
+            if pid == 0:
+                break
+
+            index = self._pids.pop(pid, None)
+            if index is not None:
+                code = self._exit_codes[index] = _exit_code(status)
+                results.append((index, code))
+
+            block = False
+
+        return results
+
+    def _supervise(self):
+        """ Wait for workers, respawning failed ones until shutdown. """
+        while self._pids and not self._stopping:
+            for (index, code) in self._reap(block=True):
+                if self._stopping or not self._respawn or code == 0:
+                    continue
+
+                delay = self._started[index] + self._respawn_delay - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                if not self._stopping:
+                    self._spawn(index)
+
+        # Graceful shutdown, kill workers which don't exit in time
+        deadline = time.monotonic() + self._term_timeout
+        while self._pids:
+            self._reap(block=False)
+            if not self._pids:
+                break
+            if time.monotonic() >= deadline:
+                self._signal_workers(signal.SIGKILL)
+                self._reap(block=True)
+                break
+            time.sleep(0.05)
@@ -12,18 +12,182 @@ __all__ = ["ObjectRegistry"]
 
 
 import threading
-from typing import Optional, Any
+from typing import Optional, Any, Iterable, Tuple
+import weakref
+
+from .constants import SENTINEL
+
+
+class _Reference:
+    """ A registered item that must be resolved to get its value. """
+
+    __slots__ = ()
+
+    def resolve(self) -> Any:
+        """ Return the value, or SENTINEL if it is no longer available. """
+        raise NotImplementedError()
+
+
+class _WeakValue(_Reference):
+    """ A weakly referenced registered value. """
+
+    __slots__ = ("ref",)
+
+    def __init__(self, value, callback):
+        self.ref = weakref.ref(value, lambda ref: callback(self))
+
+    def resolve(self):
+        value = self.ref()
+        return SENTINEL if value is None else value
+
+
+class _LazyValue(_Reference):
+    """ A registered value imported from a reference when first needed. """
+
+    __slots__ = ("reference", "value", "callback")
+
+    def __init__(self, reference, callback):
+        self.reference = reference
+        self.value = SENTINEL
+        self.callback = callback
+
+    def resolve(self):
+        value = self.value
+        if value is SENTINEL:
+            from .imp import import_object
+
+            # Importing twice from different threads is harmless
+            value = self.value = import_object(self.reference)
+            self.callback(self, value)
+
+        return value
+
+
+class _Registry:
+    """ The entries of a single named registry.
+
+    Besides the ordered list of (name, item) entries, the items are indexed by
+    name and the item tuples used by lookups are cached until the registry is
+    changed.  The cache dictionary is replaced rather than cleared when the
+    registry changes, so a lookup may read it without holding the lock.  The
+    cache maps a name, or SENTINEL for all items, to a tuple of (items, plain)
+    where plain is True if none of the items is a reference, in which case the
+    items tuple is also the result of the lookup.
+    """
+
+    __slots__ = ("entries", "index", "cache")
+
+    def __init__(self):
+        self.entries = []
+        self.index = {}
+        self.cache = {}
+
+    def add(self, name, item):
+        """ Add an item to the end of the registry. """
+        self.entries.append((name, item))
+        self.index.setdefault(name, []).append(item)
+        self.cache = {}
+
+    def rebuild(self):
+        """ Rebuild the index after the entries are changed. """
+        index = {}
+        for (name, item) in self.entries:
+            index.setdefault(name, []).append(item)
+
+        self.index = index
+        self.cache = {}
+
+    def lookup(self, name):
+        """ Build the cache tuple for a name, or all items for SENTINEL. """
+        if name is SENTINEL:
+            items = tuple(item for (_, item) in self.entries)
+        else:
+            items = tuple(self.index.get(name, ()))
+
+        plain = not any(isinstance(item, _Reference) for item in items)
+        return (items, plain)
 
 
 class ObjectRegistry:
-    """ Represent a registry of objects grouped by registry names. """
+    """ Represent a registry of objects grouped by registry names.
+
+    Lookups are indexed by name and their results are cached, so repeated
+    calls to `get`, `first` and `last` do not scan the registered objects.
+    Objects may be registered weakly, in which case they are removed from the
+    registry once no other references to them remain.  Objects may also be
+    registered lazily as "module:attribute" references, in which case the
+    module is imported only when a lookup needs the object.
+    """
 
     def __init__(self):
         """ Initialize the registry. """
         self._lock = threading.RLock()
         self._registry = {}
+        self._pending = []
+
+    def _get_registry(self, registry):
+        """ Return the named registry, creating it if needed. """
+        registry_obj = self._registry.get(registry)
+        if registry_obj is None:
+            registry_obj = self._registry[registry] = _Registry()
+
+        return registry_obj
 
-    def register(self, registry: str, value: Any, name: Optional[str] = None):
+    def _make_item(self, registry, value, weak):
+        """ Return the item to store for a value. """
+        if weak:
+            return _WeakValue(
+                value,
+                lambda item: self._pending.append((registry, item, SENTINEL))
+            )
+
+        return value
+
+    def _make_lazy(self, registry, reference):
+        """ Return the item to store for a lazy reference. """
+        def resolved(item, value):
+            self._pending.append((registry, item, value))
+
+            # Drop the cache so the next lookup applies the resolved value
+            registry_obj = self._registry.get(registry)
+            if registry_obj is not None:
+                registry_obj.cache = {}
+
+        return _LazyValue(reference, resolved)
+
+    def _purge(self):
+        """ Apply pending changes from references.
+
+        Entries of weak values that have died are removed, and entries of lazy
+        references that have been resolved are replaced with their values so
+        later lookups of them can use the cached tuples directly.  References
+        only record these changes, since they may happen at any point,
+        including while the lock is held and the registry is being changed.
+        """
+        while self._pending:
+            (registry, item, value) = self._pending.pop()
+            registry_obj = self._registry.get(registry)
+            if registry_obj is None:
+                continue
+
+            if value is SENTINEL:
+                entries = [entry for entry in registry_obj.entries if entry[1] is not item]
+            else:
+                entries = [
+                    (name, value if stored is item else stored)
+                    for (name, stored) in registry_obj.entries
+                ]
+
+            registry_obj.entries[:] = entries
+            registry_obj.rebuild()
+
+    def register(
+            self,
+            registry: str,
+            value: Any,
+            name: Optional[str] = None,
+            weak: bool = False
+    ):
         """ Register an object with the registry.
 
         Parameters
@@ -35,10 +199,262 @@ class ObjectRegistry:
         name : Optional[str], default=None
             The name to identify the object as.  Multiple objects may be given
             the same name.  This is just used for the get method.
+        weak : bool, default=False
+            Whether to store only a weak reference to the object.
+        """
+        with self._lock:
+            self._purge()
+            item = self._make_item(registry, value, weak)
+            self._get_registry(registry).add(name, item)
+
+    def register_many(
+            self,
+            registry: str,
+            values: Iterable[Tuple[Optional[str], Any]],
+            weak: bool = False
+    ):
+        """ Register multiple objects with the registry at once.
+
+        Parameters
+        ----------
+        registry : str
+            The named registry to identify the objects as.
+        values : Iterable[Tuple[Optional[str], Any]]
+            The (name, value) pairs to register in order.
+        weak : bool, default=False
+            Whether to store only weak references to the objects.
         """
         with self._lock:
-            registry_list = self._registry.setdefault(registry, [])
-            registry_list.append((name, value))
+            self._purge()
+            registry_obj = self._get_registry(registry)
+            registry_obj.entries.extend(
+                (name, self._make_item(registry, value, weak))
+                for (name, value) in values
+            )
+            registry_obj.rebuild()
+
+    def register_lazy(
+            self,
+            registry: str,
+            reference: str,
+            name: Optional[str] = None
+    ):
+        """ Register an object to be imported when first needed.
+
+        Parameters
+        ----------
+        registry : str
+            The named registry to identify the object as.
+        reference : str
+            The object's "module:attribute" reference.  The module is imported
+            the first time a lookup returns the object.
+        name : Optional[str], default=None
+            The name to identify the object as.
+        """
+        with self._lock:
+            self._purge()
+            item = self._make_lazy(registry, reference)
+            self._get_registry(registry).add(name, item)
+
+    def load_manifest(self, filename: str) -> int:
+        """ Register lazy references from a manifest file.
+
+        The manifest uses the same format as entry point files, with each
+        section being a registry name and each option being a name and its
+        reference:
+
+            [myapp.plugins]
+            json = myapp.plugins.json:JsonPlugin
+            yaml = myapp.plugins.yaml:YamlPlugin
+
+        Parameters
+        ----------
+        filename : str
+            The manifest file to load
+
+        Returns
+        -------
+        int
+            The number of references registered.
+        """
+        import configparser
+
+        parser = configparser.ConfigParser(
+            delimiters=("=",),
+            interpolation=None,
+            default_section="\0"
+        )
+        parser.optionxform = str
+        with open(filename, "rt", encoding="utf-8") as handle:
+            parser.read_file(handle)
+
+        count = 0
+        with self._lock:
+            self._purge()
+            for registry in parser.sections():
+                registry_obj = self._get_registry(registry)
+                for (name, reference) in parser.items(registry):
+                    registry_obj.entries.append(
+                        (name, self._make_lazy(registry, reference.strip()))
+                    )
+                    count += 1
+                registry_obj.rebuild()
+
+        return count
+
+    def unregister(
+            self,
+            registry: str,
+            value: Any = SENTINEL,
+            name: Optional[str] = SENTINEL
+    ) -> int:
+        """ Remove objects from the registry.
+
+        Parameters
+        ----------
+        registry : str
+            The named registry the objects were registered with
+        value : Any, optional
+            If specified, only remove entries of this object, compared by
+            identity.  Lazy references that have not yet been imported do not
+            match.
+        name : Optional[str], optional
+            If specified, only remove entries registered with this name.  If
+            neither the value nor the name is specified, all objects of the
+            named registry are removed.
+
+        Returns
+        -------
+        int
+            The number of entries removed.
+        """
+        with self._lock:
+            self._purge()
+            registry_obj = self._registry.get(registry)
+            if registry_obj is None:
+                return 0
+
+            entries = registry_obj.entries
+            kept = [
+                entry for entry in entries
+                if not self._matches(entry, value, name)
+            ]
+            count = len(entries) - len(kept)
+
+            if count:
+                if kept:
+                    entries[:] = kept
+                    registry_obj.rebuild()
+                else:
+                    del self._registry[registry]
+                    registry_obj.cache = {}
+
+            return count
+
+    def replace(
+            self,
+            registry: str,
+            value: Any,
+            name: Optional[str] = None,
+            weak: bool = False
+    ) -> int:
+        """ Replace all objects registered with a name by a single object.
+
+        The new object takes the position of the first replaced object, or is
+        added at the end if no object was registered with the name.
+
+        Parameters
+        ----------
+        registry : str
+            The named registry to identify the object as.
+        value : Any
+            The object to store in the registry
+        name : Optional[str], default=None
+            The name of the objects to replace
+        weak : bool, default=False
+            Whether to store only a weak reference to the object.
+
+        Returns
+        -------
+        int
+            The number of entries replaced.
+        """
+        with self._lock:
+            self._purge()
+            registry_obj = self._get_registry(registry)
+            new_entry = (name, self._make_item(registry, value, weak))
+
+            entries = []
+            count = 0
+            for entry in registry_obj.entries:
+                if entry[0] != name:
+                    entries.append(entry)
+                    continue
+
+                if count == 0:
+                    entries.append(new_entry)
+                count += 1
+
+            if count == 0:
+                entries.append(new_entry)
+
+            registry_obj.entries[:] = entries
+            registry_obj.rebuild()
+
+            return count
+
+    @staticmethod
+    def _matches(entry, value, name):
+        """ Determine if an entry matches the value and name to unregister. """
+        (stored_name, item) = entry
+        if name is not SENTINEL and stored_name != name:
+            return False
+
+        if value is not SENTINEL:
+            if isinstance(item, _WeakValue):
+                item = item.resolve()
+            elif isinstance(item, _LazyValue):
+                item = item.value
+            if item is not value:
+                return False
+
+        return True
+
+    def _items(self, registry, name):
+        """ Return the cached (items, plain) tuple for a lookup. """
+        key = SENTINEL if name is None else name
+
+        # Fast path, the cache is replaced instead of modified on changes
+        registry_obj = self._registry.get(registry)
+        if registry_obj is None:
+            return ((), True)
+
+        found = registry_obj.cache.get(key)
+        if found is not None:
+            return found
+
+        with self._lock:
+            self._purge()
+            registry_obj = self._registry.get(registry)
+            if registry_obj is None:
+                return ((), True)
+
+            cache = registry_obj.cache
+            found = cache.get(key)
+            if found is None:
+                found = cache[key] = registry_obj.lookup(key)
+
+            return found
+
+    @staticmethod
+    def _resolve(items):
+        """ Yield the live values of the items. """
+        for item in items:
+            if isinstance(item, _Reference):
+                item = item.resolve()
+                if item is SENTINEL:
+                    continue
+            yield item
 
     def get(self, registry: str, name: Optional[str] = None) -> Any:
         """ Returns a sequence of the registered values.
@@ -56,13 +472,11 @@ class ObjectRegistry:
         -------
         A tuple of the found registered items.
         """
-        with self._lock:
-            results = tuple(
-                value
-                for (stored_name, value) in self._registry.get(registry, [])
-                if name is None or name == stored_name
-            )
-            return results
+        (items, plain) = self._items(registry, name)
+        if plain:
+            return items
+
+        return tuple(self._resolve(items))
 
     def first(self, registry: str, name: Optional[str] = None) -> Optional[Any]:
         """ Returns the first matching object.
@@ -78,9 +492,12 @@ class ObjectRegistry:
         None
             If the value was not found
         """
-        results = self.get(registry, name)
-        if results:
-            return results[0]
+        (items, plain) = self._items(registry, name)
+        if plain:
+            return items[0] if items else None
+
+        for value in self._resolve(items):
+            return value
 
         return None
 
@@ -98,9 +515,11 @@ class ObjectRegistry:
         None
             If the value was not found
         """
+        (items, plain) = self._items(registry, name)
+        if plain:
+            return items[-1] if items else None
 
-        results = self.get(registry, name)
-        if results:
-            return results[-1]
+        for value in self._resolve(reversed(items)):
+            return value
 
         return None
@@ -4,10 +4,10 @@ __author__ = "Brian Allen Vanderburg II"
 __copyright__ = "Copyright (C) 2018 Brian Allen Vanderburg II"
 __license__ = "Apache License 2.0"
 
-__all__ = ["depends_sort"]
+__all__ = ["depends_sort", "depends_waves"]
 
 
-from typing import Dict, Sequence
+from typing import Dict, Sequence, List
 
 
 def depends_sort(data: Dict[str, Sequence[str]]) -> Sequence[str]:
@@ -40,6 +40,51 @@ def depends_sort(data: Dict[str, Sequence[str]]) -> Sequence[str]:
 
     return _depends_sort_helper(tuple(data.keys()), data, [], [])
 
+def depends_waves(data: Dict[str, Sequence[str]]) -> List[List[str]]:
+    """
+    Group a set of dependencies into waves.
+
+    Parameters
+    ----------
+    data : Dict[str, Sequence[str]]
+        A dictionary of name : [depends names] mappings.
+
+    Returns
+    -------
+    List[List[str]]
+        Returns a list of waves, each a list of names whose dependencies all
+        occur in earlier waves.  The names within a wave do not depend on each
+        other and keep the order produced by `depends_sort`.
+
+    Example
+    -------
+    An input of:
+        {
+            "libpng": ["libz"],
+            "libz": [],
+            "libjpeg": [],
+            "app": ["libpng", "libjpeg"]
+        }
+
+    Will produce an result of [["libz", "libjpeg"], ["libpng"], ["app"]]
+
+    """
+
+    levels = {}
+    waves = []
+    for name in depends_sort(data):
+        level = max(
+            (levels[depend] + 1 for depend in data.get(name) or ()),
+            default=0
+        )
+        levels[name] = level
+
+        if level == len(waves):
+            waves.append([])
+        waves[level].append(name)
+
+    return waves
+
 def _depends_sort_helper(names, data, _stack, _results):
     """ Sort all names by dependency. """
 
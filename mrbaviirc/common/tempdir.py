@@ -0,0 +1,356 @@
+""" A managed area for temporary files of the process. """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+__all__ = ["TempArea", "QuotaExceededError", "get_temp_area"]
+
+
+import errno
+import fcntl
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+
+class QuotaExceededError(OSError):
+    """ The temporary files of the process exceed the quota. """
+
+    def __init__(self, usage, quota):
+        OSError.__init__(
+            self, errno.EDQUOT,
+            "Temporary area quota exceeded: {} of {} bytes".format(usage, quota)
+        )
+        self.usage = usage
+        self.quota = quota
+
+
+def _writable_dir(path):
+    """ Determine if a path is a writable directory. """
+    return path is not None and os.path.isdir(path) and os.access(path, os.W_OK | os.X_OK)
+
+
+class TempArea:
+    """ A per-process directory for temporary files that is cleaned up.
+
+    The directory of the process is created below a shared root directory on
+    first use, preferring memory backed file systems: XDG_RUNTIME_DIR if set,
+    then /dev/shm, then the system temporary directory.  It is removed when
+    the process exits normally.  The directory of a process that crashed is
+    removed by the next process to create its directory in the same root.
+    Each process directory holds an fcntl lock on a file within it for the
+    life of the process, so a directory whose lock can be taken belongs to a
+    process that is gone, even if its process id has been reused.
+
+    A process directory is prepared under a name starting with a dot and
+    renamed into place once its lock is held, so it is never seen unlocked
+    under its final name.  Prepared directories left by a process that
+    crashed are removed once older than STAGING_AGE seconds.
+
+    A forked child process that uses the area gets its own directory.
+
+    The root also holds a stable directory for runtime files, which is shared
+    by all processes of the user and not removed at exit.
+
+    If a quota is set, `mkdtemp`, `mkstemp` and `write_bytes` raise a
+    QuotaExceededError once the files in the directory use at least that many
+    bytes.  Note that files may still grow beyond the quota after they are
+    created.
+    """
+
+    LOCK_NAME = ".lock"
+    RUNTIME_NAME = "run"
+    STAGING_PREFIX = ".new-"
+    STAGING_AGE = 3600
+
+    def __init__(
+            self,
+            base: Optional[str] = None,
+            prefix: str = "mrbaviirc",
+            quota: Optional[int] = None
+    ):
+        """ Initialize the area.
+
+        Parameters
+        ----------
+        base : Optional[str], default=None
+            The directory to create the root directory in.  If not specified,
+            the first writable of XDG_RUNTIME_DIR, /dev/shm and the system
+            temporary directory is used.
+        prefix : str, default="mrbaviirc"
+            The name of the root directory, which is followed by the user id.
+        quota : Optional[int], default=None
+            The maximum number of bytes used by the files of the process.
+        """
+        self._base = base
+        self._prefix = prefix
+        self._quota = quota
+        self._lock = threading.RLock()
+        self._directory = None
+        self._pid = None
+        self._lock_handle = None
+        self._registered = False
+
+    @property
+    def quota(self) -> Optional[int]:
+        """ Return the quota in bytes, or None for no quota. """
+        return self._quota
+
+    @quota.setter
+    def quota(self, quota: Optional[int]):
+        """ Set the quota in bytes, or None for no quota. """
+        self._quota = quota
+
+    @property
+    def root(self) -> str:
+        """ Return the root directory containing the process directories. """
+        base = self._base
+        if base is None:
+            for candidate in (os.environ.get("XDG_RUNTIME_DIR"), "/dev/shm"):
+                if _writable_dir(candidate):
+                    base = candidate
+                    break
+            else:
+                base = tempfile.gettempdir()
+
+        return os.path.join(base, "{}-{}".format(self._prefix, os.getuid()))
+
+    @property
+    def runtime_dir(self) -> str:
+        """ Return the runtime directory shared by the processes of the user.
+
+        The directory is created with mode 0700 if needed.  An OSError is
+        raised if the root or runtime directory is not a directory owned by
+        the user and private to it.
+        """
+        root = self.root
+        runtime = os.path.join(root, self.RUNTIME_NAME)
+        for path in (root, runtime):
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            info = os.lstat(path)
+            if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or
+                    info.st_mode & 0o077):
+                raise OSError(errno.EPERM, "Unsafe runtime directory", path)
+
+        return runtime
+
+    @property
+    def directory(self) -> str:
+        """ Return the directory of the process, creating it if needed. """
+        directory = self._directory
+        if directory is not None and self._pid == os.getpid():
+            return directory
+
+        with self._lock:
+            if self._directory is None or self._pid != os.getpid():
+                self._create()
+
+            return self._directory
+
+    def _create(self):
+        """ Create the directory of the process. """
+        if self._pid != os.getpid():
+            # Forked, the directory and lock belong to the parent
+            if self._lock_handle is not None:
+                os.close(self._lock_handle)
+            self._directory = None
+            self._lock_handle = None
+
+        root = self.root
+        os.makedirs(root, mode=0o700, exist_ok=True)
+        self.reap(root)
+
+        staging = tempfile.mkdtemp(
+            prefix="{}{}-".format(self.STAGING_PREFIX, os.getpid()), dir=root
+        )
+        handle = os.open(
+            os.path.join(staging, self.LOCK_NAME),
+            os.O_RDWR | os.O_CREAT, 0o600
+        )
+        try:
+            fcntl.lockf(handle, fcntl.LOCK_EX)
+            directory = os.path.join(root, os.path.basename(staging)[len(self.STAGING_PREFIX):])
+            os.rename(staging, directory)
+        except:
+            os.close(handle)
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        self._directory = directory
+        self._lock_handle = handle
+        self._pid = os.getpid()
+
+        if not self._registered:
+            import atexit
+            atexit.register(self.cleanup)
+            self._registered = True
+
+    def reap(self, root: Optional[str] = None) -> List[str]:
+        """ Remove the directories of processes that no longer exist.
+
+        Parameters
+        ----------
+        root : Optional[str], default=None
+            The root directory to reap, by default the root of this area.
+
+        Returns
+        -------
+        List[str]
+            The removed directories.
+        """
+        if root is None:
+            root = self.root
+
+        removed = []
+        try:
+            entries = list(os.scandir(root))
+        except FileNotFoundError:
+            return removed
+
+        # Locks are per process, so the directories of this process would
+        # appear to be unlocked
+        own = "{}-".format(os.getpid())
+        staging = "{}{}".format(self.STAGING_PREFIX, own)
+        expired = time.time() - self.STAGING_AGE
+
+        for entry in entries:
+            name = entry.name
+            if not entry.is_dir(follow_symlinks=False) or name.startswith((own, staging)):
+                continue
+
+            if name.startswith(self.STAGING_PREFIX):
+                # May not be locked yet, so only removed once left long ago
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime < expired:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        removed.append(entry.path)
+                except OSError:
+                    pass
+                continue
+
+            if not name.split("-", 1)[0].isdigit():
+                continue # Such as the runtime directory
+
+            try:
+                handle = os.open(os.path.join(entry.path, self.LOCK_NAME), os.O_RDWR)
+            except OSError:
+                continue # Being created or removed
+
+            try:
+                try:
+                    fcntl.lockf(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue # The owning process is alive
+
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed.append(entry.path)
+            finally:
+                os.close(handle)
+
+        return removed
+
+    def usage(self) -> int:
+        """ Return the number of bytes used by the files of the process. """
+        with self._lock:
+            directory = self._directory
+            if directory is None or self._pid != os.getpid():
+                return 0
+
+        total = 0
+        pending = [directory]
+        while pending:
+            try:
+                entries = list(os.scandir(pending.pop()))
+            except OSError:
+                continue
+
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
+
+        return total
+
+    def check_quota(self, size: int = 0):
+        """ Raise QuotaExceededError if adding size bytes exceeds the quota.
+
+        Parameters
+        ----------
+        size : int, default=0
+            The number of bytes about to be added.
+        """
+        quota = self._quota
+        if quota is None:
+            return
+
+        usage = self.usage() + size
+        if usage > quota or (size == 0 and usage >= quota):
+            raise QuotaExceededError(usage, quota)
+
+    def mkdir(self, name: str) -> str:
+        """ Return a named subdirectory of the process directory.
+
+        Parameters
+        ----------
+        name : str
+            The name of the subdirectory, which is created if needed.
+        """
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        return path
+
+    def mkdtemp(self, suffix: str = "", prefix: str = "tmp") -> str:
+        """ Create a new temporary directory in the process directory. """
+        self.check_quota()
+        return tempfile.mkdtemp(suffix, prefix, self.directory)
+
+    def mkstemp(self, suffix: str = "", prefix: str = "tmp") -> Tuple[int, str]:
+        """ Create a new temporary file and return its handle and name. """
+        self.check_quota()
+        return tempfile.mkstemp(suffix, prefix, self.directory)
+
+    def write_bytes(self, data: bytes, suffix: str = "", prefix: str = "tmp") -> str:
+        """ Write data to a new temporary file and return its name. """
+        self.check_quota(len(data))
+        (handle, filename) = tempfile.mkstemp(suffix, prefix, self.directory)
+        with open(handle, "wb") as output:
+            output.write(data)
+
+        return filename
+
+    def cleanup(self):
+        """ Remove the directory of the process. """
+        with self._lock:
+            directory = self._directory
+            if directory is None or self._pid != os.getpid():
+                return
+
+            self._directory = None
+            shutil.rmtree(directory, ignore_errors=True)
+            os.close(self._lock_handle)
+            self._lock_handle = None
+
+
+_temp_area = None # pylint: disable=invalid-name
+_temp_area_lock = threading.Lock() # pylint: disable=invalid-name
+
+
+def get_temp_area() -> TempArea:
+    """ Return the shared temporary area of the process. """
+    global _temp_area # pylint: disable=global-statement,invalid-name
+
+    if _temp_area is None:
+        with _temp_area_lock:
+            if _temp_area is None:
+                _temp_area = TempArea()
+
+    return _temp_area
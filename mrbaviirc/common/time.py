@@ -4,21 +4,24 @@ __author__ = "Brian Allen Vanderburg II"
 __copyright__ = "Copyright (C) 2018-2019 Brian Allen Vanderburg II"
 __license__ = "Apache License 2.0"
 
-__all__ = ["StopWatch"]
+__all__ = [
+    "StopWatch", "LapStopWatch", "Histogram", "ConcurrentHistogram", "timed",
+    "Profiler", "profile", "enable_profiling", "get_profiler"
+]
 
 
-try:
-    # pylint: disable=invalid-name
-    from time import monotonic
-    timenow = monotonic
-    timedelta = lambda a, b: a - b
-    timesecs = lambda a: a
-except ImportError:
-    # pylint: disable=invalid-name
-    from datetime import datetime
-    timenow = datetime.now
-    timedelta = lambda a, b: a - b
-    timesecs = lambda a: a.total_seconds()
+from array import array
+import functools
+import threading
+from time import monotonic, perf_counter_ns
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
+
+
+def _nearest_rank(ordered: Sequence[int], percent: float) -> int:
+    """ Return a percentile of sorted values using the nearest rank. """
+    count = len(ordered)
+    rank = int(-(-percent * count // 100))
+    return ordered[min(max(rank, 1), count) - 1]
 
 
 class StopWatch:
@@ -44,7 +47,7 @@ class StopWatch:
         """ Start the stopwatch. """
 
         if self._timer is None:
-            self._timer = timenow()
+            self._timer = monotonic()
 
     def stop(self) -> float:
         """ Stop the stopwatch.
@@ -56,12 +59,9 @@ class StopWatch:
 
         """
         if self._timer is not None:
-            now = timenow()
-            delta = timedelta(now, self._timer)
+            self._elapsed += monotonic() - self._timer
             self._timer = None
 
-            self._elapsed += timesecs(delta)
-
         return self._elapsed
 
     def reset(self) -> float:
@@ -88,11 +88,8 @@ class StopWatch:
         float
             The current elapsed time
         """
-        if self._timer:
-            now = timenow()
-            delta = timedelta(now, self._timer)
-
-            return self._elapsed + timesecs(delta)
+        if self._timer is not None:
+            return self._elapsed + (monotonic() - self._timer)
 
         return self._elapsed
 
@@ -154,3 +151,728 @@ class StopWatch:
             bool(self),
             float(self)
         )
+
+
+class LapStopWatch(StopWatch):
+    """ A stopwatch with nanosecond resolution that records laps.
+
+    The time is measured with `time.perf_counter_ns` and each lap is stored
+    as an integer number of nanoseconds in an array, so timing a hot loop
+    does not create a float object per measurement.  A lap ends when `lap`
+    or `stop` is called, so using the stopwatch as a context manager records
+    one lap for each block.  Laps may also be recorded into a histogram,
+    which keeps statistics over any number of laps in constant memory.
+    """
+
+    def __init__(
+            self,
+            start: bool = False,
+            elapsed: float = 0.0,
+            histogram: Optional["Histogram"] = None,
+            keep_laps: bool = True
+    ):
+        """ Initialize the stopwatch.
+
+        Parameters
+        ----------
+        start : bool, default=False
+            Whether to start the stopwatch after creating it
+        elapsed : float, default=0.0
+            The initial elapsed value of the stopwatch in seconds.  This is
+            not recorded as a lap.
+        histogram : Optional[Histogram], default=None
+            If specified, each lap is also recorded in the histogram.
+        keep_laps : bool, default=True
+            Whether to store the laps in the stopwatch.
+        """
+        self._elapsed_ns = int(elapsed * 1e9)
+        self._laps = array("q")
+        self._histogram = histogram
+        self._keep_laps = keep_laps
+        StopWatch.__init__(self, start)
+
+    def start(self):
+        """ Start the stopwatch. """
+        if self._timer is None:
+            self._timer = perf_counter_ns()
+
+    def lap(self) -> int:
+        """ End the current lap and start the next one.
+
+        Returns
+        -------
+        int
+            The duration of the lap in nanoseconds, or 0 if not running.
+        """
+        timer = self._timer
+        if timer is None:
+            return 0
+
+        now = self._timer = perf_counter_ns()
+        delta = now - timer
+        if self._keep_laps:
+            self._laps.append(delta)
+        if self._histogram is not None:
+            self._histogram.record(delta)
+        self._elapsed_ns += delta
+        return delta
+
+    def stop(self) -> float:
+        """ Stop the stopwatch, ending the current lap.
+
+        Returns
+        -------
+        float
+            The current elapsed time in seconds.
+        """
+        if self._timer is not None:
+            self.lap()
+            self._timer = None
+
+        return self._elapsed_ns / 1e9
+
+    def reset(self) -> float:
+        """ Reset the timer and clear the laps.
+
+        Returns
+        -------
+        float
+            The elapsed time in seconds before the reset.
+        """
+        current = self.stop()
+        self._elapsed_ns = 0
+        self._laps = array("q")
+
+        return current
+
+    @property
+    def time_ns(self) -> int:
+        """ Return the elapsed stopwatch time in nanoseconds. """
+        if self._timer is not None:
+            return self._elapsed_ns + (perf_counter_ns() - self._timer)
+
+        return self._elapsed_ns
+
+    @property
+    def time(self) -> float:
+        """ Return the elapsed stopwatch time in seconds. """
+        return self.time_ns / 1e9
+
+    @property
+    def laps(self) -> array:
+        """ Return a copy of the recorded laps in nanoseconds. """
+        return array("q", self._laps)
+
+    def percentile(self, percent: float) -> int:
+        """ Return a percentile of the lap durations.
+
+        Parameters
+        ----------
+        percent : float
+            The percentile from 0 to 100, using the nearest rank.
+
+        Returns
+        -------
+        int
+            The lap duration in nanoseconds, or 0 if there are no laps.
+        """
+        laps = self._laps
+        if not laps:
+            return 0
+
+        return _nearest_rank(sorted(laps), percent)
+
+    def stats(self) -> Dict[str, float]:
+        """ Return statistics of the lap durations in nanoseconds.
+
+        Returns
+        -------
+        Dict[str, float]
+            The count, total, min, max, mean, p50, p90 and p99 of the laps.
+            All values are 0 if there are no laps.
+        """
+        laps = self._laps
+        count = len(laps)
+        if not count:
+            return dict.fromkeys(
+                ("count", "total", "min", "max", "mean", "p50", "p90", "p99"), 0
+            )
+
+        ordered = sorted(laps)
+        total = sum(ordered)
+
+        return {
+            "count": count,
+            "total": total,
+            "min": ordered[0],
+            "max": ordered[-1],
+            "mean": total / count,
+            "p50": _nearest_rank(ordered, 50),
+            "p90": _nearest_rank(ordered, 90),
+            "p99": _nearest_rank(ordered, 99),
+        }
+
+
+class Histogram:
+    """ A fixed-size histogram of non-negative integer values.
+
+    Values are counted in log-linear buckets like an HDR histogram: values
+    below 2**precision each have their own bucket, and above that every power
+    of two range is split into 2**(precision - 1) buckets, so a value is
+    known within a relative error of 2**(1 - precision).  Values of
+    2**max_bits or more are counted in the last bucket.  The counts are kept
+    in an array, so the memory used does not depend on the number of values
+    recorded.  Histograms with the same layout can be merged.
+
+    The histogram is not thread safe, see `ConcurrentHistogram`.
+    """
+
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self, precision: int = 7, max_bits: int = 48):
+        """ Initialize the histogram.
+
+        Parameters
+        ----------
+        precision : int, default=7
+            The number of significant bits of recorded values.
+        max_bits : int, default=48
+            The number of bits of the largest value counted exactly.  The
+            default covers about three days in nanoseconds.
+        """
+        if not 1 <= precision <= max_bits:
+            raise ValueError("Invalid histogram precision: {}".format(precision))
+
+        self._precision = precision
+        self._max_bits = max_bits
+        self._linear = 1 << precision
+        self._half = self._linear >> 1
+        self._max_value = (1 << max_bits) - 1
+        self._counts = array("Q", bytes(8 * self._index(self._max_value) + 8))
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+
+    def _index(self, value):
+        """ Return the bucket index of a value. """
+        if value < self._linear:
+            return value
+
+        # Equal to linear + (shift - 1) * half + (value >> shift) - half
+        shift = value.bit_length() - self._precision
+        return shift * self._half + (value >> shift)
+
+    def _bounds(self, index):
+        """ Return the lowest and highest value of a bucket. """
+        if index < self._linear:
+            return (index, index)
+
+        (group, offset) = divmod(index - self._linear, self._half)
+        shift = group + 1
+        low = (offset + self._half) << shift
+        return (low, low + (1 << shift) - 1)
+
+    @property
+    def layout(self):
+        """ Return the (precision, max_bits) of the histogram. """
+        return (self._precision, self._max_bits)
+
+    @property
+    def count(self) -> int:
+        """ Return the number of recorded values. """
+        return self._count
+
+    @property
+    def total(self) -> int:
+        """ Return the sum of the recorded values. """
+        return self._total
+
+    @property
+    def min(self) -> int:
+        """ Return the smallest recorded value, or 0 if empty. """
+        return 0 if self._min is None else self._min
+
+    @property
+    def max(self) -> int:
+        """ Return the largest recorded value, or 0 if empty. """
+        return 0 if self._max is None else self._max
+
+    @property
+    def mean(self) -> float:
+        """ Return the mean of the recorded values, or 0.0 if empty. """
+        return self._total / self._count if self._count else 0.0
+
+    def record(self, value: int, count: int = 1):
+        """ Record a value.
+
+        Parameters
+        ----------
+        value : int
+            The value, such as a duration in nanoseconds.  Negative values
+            are recorded as 0.
+        count : int, default=1
+            The number of times to record the value.
+        """
+        if value < self._linear:
+            if value < 0:
+                value = 0
+            index = value
+        else:
+            bucket_value = value if value <= self._max_value else self._max_value
+            shift = bucket_value.bit_length() - self._precision
+            index = shift * self._half + (bucket_value >> shift)
+
+        # The bounds are set first so a concurrent merge of a histogram with
+        # a count always sees them
+        if self._max is None:
+            self._min = self._max = value
+        elif value > self._max:
+            self._max = value
+        elif value < self._min:
+            self._min = value
+
+        self._counts[index] += count
+        self._count += count
+        self._total += value * count
+
+    def merge(self, other: "Histogram"):
+        """ Add the values recorded in another histogram.
+
+        Parameters
+        ----------
+        other : Histogram
+            A histogram with the same precision and max_bits.
+        """
+        if other.layout != self.layout:
+            raise ValueError("Can't merge histograms of different layouts")
+
+        if not other._count: # pylint: disable=protected-access
+            return
+
+        counts = self._counts
+        for (index, count) in enumerate(other._counts): # pylint: disable=protected-access
+            if count:
+                counts[index] += count
+
+        self._count += other._count # pylint: disable=protected-access
+        self._total += other._total # pylint: disable=protected-access
+        for value in (other._min, other._max): # pylint: disable=protected-access
+            if value is None:
+                continue # Cleared while merging
+            if self._min is None or value < self._min:
+                self._min = value
+            if self._max is None or value > self._max:
+                self._max = value
+
+    def copy(self) -> "Histogram":
+        """ Return a copy of the histogram. """
+        result = Histogram(self._precision, self._max_bits)
+        result.merge(self)
+        return result
+
+    def clear(self):
+        """ Remove all recorded values. """
+        self._counts = array("Q", bytes(8 * len(self._counts)))
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+
+    def percentile(self, percent: float) -> int:
+        """ Return a percentile of the recorded values.
+
+        Parameters
+        ----------
+        percent : float
+            The percentile from 0 to 100.
+
+        Returns
+        -------
+        int
+            The highest value of the bucket containing the percentile, limited
+            to the largest recorded value, or 0 if empty.
+        """
+        if not self._count:
+            return 0
+
+        target = max(int(-(-percent * self._count // 100)), 1)
+        seen = 0
+        for (index, count) in enumerate(self._counts):
+            seen += count
+            if seen >= target:
+                return max(min(self._bounds(index)[1], self._max), self._min)
+
+        return self._max
+
+    def snapshot(self, percentiles: Sequence[float] = PERCENTILES) -> Dict[str, Any]:
+        """ Return the statistics and non-empty buckets of the histogram.
+
+        Parameters
+        ----------
+        percentiles : Sequence[float]
+            The percentiles to include, as "p" followed by the percentile
+            with the decimal point removed, such as "p999" for 99.9.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The count, total, min, max, mean, percentiles, and a "buckets"
+            list of [lowest value, highest value, count] of each non-empty
+            bucket.
+        """
+        result = {
+            "count": self._count,
+            "total": self._total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+        }
+        for percent in percentiles:
+            result["p" + "{:g}".format(percent).replace(".", "")] = self.percentile(percent)
+
+        result["buckets"] = [
+            list(self._bounds(index)) + [count]
+            for (index, count) in enumerate(self._counts) if count
+        ]
+        return result
+
+    def to_json(self, **kwargs) -> str:
+        """ Return the snapshot as JSON, passing kwargs to json.dumps. """
+        import json
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_text(self, scale: float = 1.0, unit: str = "") -> str:
+        """ Return a one line summary of the statistics.
+
+        Parameters
+        ----------
+        scale : float, default=1.0
+            The value to divide the values by, such as 1e6 for nanoseconds
+            shown as milliseconds.
+        unit : str, default=""
+            The unit to show after each value.
+        """
+        snapshot = self.snapshot()
+        parts = ["count={}".format(snapshot.pop("count"))]
+        snapshot.pop("total")
+        snapshot.pop("buckets")
+        for (name, value) in snapshot.items():
+            parts.append("{}={:.6g}{}".format(name, value / scale, unit))
+
+        return " ".join(parts)
+
+    def __len__(self):
+        return self._count
+
+
+class ConcurrentHistogram:
+    """ A histogram that may be recorded to from many threads.
+
+    Each thread records to its own `Histogram` shard without locking, and the
+    shards are merged when the histogram is read.  The shards of threads that
+    have exited are kept so their values are not lost.
+    """
+
+    def __init__(self, precision: int = 7, max_bits: int = 48):
+        """ Initialize the histogram.
+
+        Parameters
+        ----------
+        See `Histogram`
+        """
+        self._precision = precision
+        self._max_bits = max_bits
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def _shard(self):
+        """ Return the histogram of the current thread. """
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = Histogram(self._precision, self._max_bits)
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def record(self, value: int, count: int = 1):
+        """ Record a value from the current thread, see `Histogram.record`. """
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+
+        shard.record(value, count)
+
+    def merged(self) -> Histogram:
+        """ Return a histogram of the values recorded by all threads. """
+        result = Histogram(self._precision, self._max_bits)
+        with self._lock:
+            shards = list(self._shards)
+
+        for shard in shards:
+            result.merge(shard)
+
+        return result
+
+    def clear(self):
+        """ Remove the values recorded by all threads. """
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+    def percentile(self, percent: float) -> int:
+        """ Return a percentile of all values, see `Histogram.percentile`. """
+        return self.merged().percentile(percent)
+
+    def snapshot(self, percentiles: Sequence[float] = Histogram.PERCENTILES) -> Dict[str, Any]:
+        """ Return a snapshot of all values, see `Histogram.snapshot`. """
+        return self.merged().snapshot(percentiles)
+
+    def to_json(self, **kwargs) -> str:
+        """ Return a snapshot of all values as JSON. """
+        return self.merged().to_json(**kwargs)
+
+    def to_text(self, scale: float = 1.0, unit: str = "") -> str:
+        """ Return a summary of all values, see `Histogram.to_text`. """
+        return self.merged().to_text(scale, unit)
+
+
+def timed(histogram: Union[Histogram, ConcurrentHistogram]) -> Callable:
+    """ A decorator recording the duration of each call in nanoseconds.
+
+    Parameters
+    ----------
+    histogram : Union[Histogram, ConcurrentHistogram]
+        The histogram to record to.  Use a ConcurrentHistogram if the
+        function is called from multiple threads.
+    """
+    def decorator(func):
+        record = histogram.record
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(perf_counter_ns() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class _ProfilerLocal(threading.local):
+    """ The thread-local state of a profiler, None until first used.
+
+    The number of spans entered while disabled and not yet exited is kept in
+    skipped, so their exits do not pop the frame of an enclosing span.
+    """
+
+    stack = None
+    totals = None
+    skipped = 0
+
+
+class _Span:
+    """ A named profiling point used as a context manager or decorator.
+
+    The span keeps no state of its own, the active frames are kept on the
+    stack of the profiling thread, so a span may be shared by any number of
+    threads and nested calls.
+    """
+
+    __slots__ = ("name", "profiler")
+
+    def __init__(self, name, profiler):
+        self.name = name
+        self.profiler = profiler
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.enabled:
+            profiler._enter(self) # pylint: disable=protected-access
+        else:
+            profiler._local.skipped += 1 # pylint: disable=protected-access
+        return self
+
+    def __exit__(self, *args):
+        profiler = self.profiler
+        local = profiler._local # pylint: disable=protected-access
+        stack = local.stack
+
+        # Spans exit in reverse order, so the top frame belongs to this span
+        # unless spans were skipped since it was pushed
+        if stack and stack[-1][0] == local.skipped:
+            profiler._exit(stack) # pylint: disable=protected-access
+        elif local.skipped:
+            local.skipped -= 1
+
+    def __call__(self, func):
+        profiler = self.profiler
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+
+            with self:
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+class Profiler:
+    """ Record nested timing spans per thread and aggregate them by path.
+
+    Each thread keeps its own stack of active spans and its own totals in
+    thread-local storage, so recording takes no lock.  The totals are kept by
+    call path, the names of the enclosing spans and the span itself, with the
+    number of calls, the total time and the self time, which excludes the
+    time of nested spans.
+
+    Recording only happens while the profiler is enabled.  While disabled,
+    entering a span only counts the entry, so the profiler may be enabled or
+    disabled while spans are active.
+    """
+
+    def __init__(self, enabled: bool = False):
+        """ Initialize the profiler.
+
+        Parameters
+        ----------
+        enabled : bool, default=False
+            Whether to record spans.
+        """
+        self.enabled = enabled
+        self._local = _ProfilerLocal()
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._all_totals = []
+
+    def span(self, name: str) -> _Span:
+        """ Return the span of a name, usable as a context manager or decorator. """
+        span = self._spans.get(name)
+        if span is None:
+            with self._lock:
+                span = self._spans.setdefault(name, _Span(name, self))
+
+        return span
+
+    def _enter(self, span):
+        """ Push a frame of [skipped, path, start, child time] for the thread. """
+        local = self._local
+        stack = local.stack
+        if stack is None:
+            stack = local.stack = []
+            totals = local.totals = {}
+            with self._lock:
+                self._all_totals.append(totals)
+
+        path = (stack[-1][1] + (span.name,)) if stack else (span.name,)
+        stack.append([local.skipped, path, perf_counter_ns(), 0])
+
+    def _exit(self, stack):
+        """ Pop the top frame of the thread and add it to the totals. """
+        (_, path, start, child) = stack.pop()
+        elapsed = perf_counter_ns() - start
+        if stack:
+            stack[-1][3] += elapsed
+
+        totals = self._local.totals
+        record = totals.get(path)
+        if record is None:
+            totals[path] = [1, elapsed, elapsed - child]
+        else:
+            record[0] += 1
+            record[1] += elapsed
+            record[2] += elapsed - child
+
+    def results(self) -> Dict[Tuple[str, ...], Tuple[int, int, int]]:
+        """ Return the totals of all threads.
+
+        Returns
+        -------
+        Dict[Tuple[str, ...], Tuple[int, int, int]]
+            The (count, total nanoseconds, self nanoseconds) of each path.
+        """
+        with self._lock:
+            all_totals = list(self._all_totals)
+
+        merged = {}
+        for totals in all_totals:
+            for (path, record) in list(totals.items()):
+                found = merged.get(path)
+                if found is None:
+                    merged[path] = list(record)
+                else:
+                    for index in range(3):
+                        found[index] += record[index]
+
+        return {path: tuple(record) for (path, record) in merged.items()}
+
+    def collapsed(self) -> str:
+        """ Return the self times in collapsed stack format.
+
+        Each line holds a path of span names joined with ";" and its self time
+        in microseconds, the input format of flame graph tools.
+        """
+        lines = []
+        for (path, (_, _, self_ns)) in sorted(self.results().items()):
+            lines.append("{} {}\n".format(";".join(path), self_ns // 1000))
+
+        return "".join(lines)
+
+    def dump_collapsed(self, filename: str):
+        """ Write the self times in collapsed stack format to a file. """
+        with open(filename, "wt", encoding="utf-8") as handle:
+            handle.write(self.collapsed())
+
+    def clear(self):
+        """ Remove the recorded totals of all threads. """
+        with self._lock:
+            for totals in self._all_totals:
+                totals.clear()
+
+
+_profiler = Profiler() # pylint: disable=invalid-name
+
+
+def get_profiler() -> Profiler:
+    """ Return the global profiler used by `profile`. """
+    return _profiler
+
+
+def enable_profiling(enabled: bool = True):
+    """ Turn recording of the global profiler on or off. """
+    _profiler.enabled = enabled
+
+
+def profile(name: Union[str, Callable, None] = None):
+    """ Profile a block or function with the global profiler.
+
+    Use as a context manager with a name, or as a decorator with or without
+    a name, the function's qualified name being used by default:
+
+        with profile("load"):
+            ...
+
+        @profile
+        def handler():
+            ...
+
+    Nothing is recorded unless profiling is turned on by `enable_profiling`.
+    """
+    if callable(name):
+        func = name
+        return _profiler.span("{}.{}".format(func.__module__, func.__qualname__))(func)
+
+    if name is None:
+        def decorator(func):
+            return profile(func)
+        return decorator
+
+    return _profiler.span(name)
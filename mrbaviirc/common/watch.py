@@ -0,0 +1,316 @@
+""" File change watching. """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+__all__ = ["FileWatcher"]
+
+
+import os
+import select
+import threading
+from typing import Callable, Iterable, Optional, FrozenSet
+
+
+class _PollBackend:
+    """ Detect changes by comparing file stat results. """
+
+    def __init__(self, filenames, interval):
+        """ Record the initial state of the files. """
+        self._filenames = tuple(filenames)
+        self._interval = interval
+        self._event = threading.Event()
+        self._state = {name: self._signature(name) for name in self._filenames}
+
+    @staticmethod
+    def _signature(filename):
+        """ Return a value which changes when the file changes. """
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def wait(self, timeout):
+        """ Wait up to the timeout or poll interval and return changed files. """
+        if timeout is None or timeout > self._interval:
+            timeout = self._interval
+
+        self._event.wait(timeout)
+        return self.check()
+
+    def check(self):
+        """ Return the files changed since the last check. """
+        changed = set()
+        for name in self._filenames:
+            signature = self._signature(name)
+            if signature != self._state[name]:
+                self._state[name] = signature
+                changed.add(name)
+
+        return changed
+
+    def wake(self):
+        """ Wake a thread blocked in wait. """
+        self._event.set()
+
+    def close(self):
+        """ Release resources. """
+
+
+class _InotifyBackend:
+    """ Detect changes with inotify watches on the parent directories.
+
+    Files whose directory does not exist are polled until the directory is
+    created, and then watched with inotify.
+    """
+
+    def __init__(self, filenames, interval):
+        """ Add a watch for each existing parent directory. """
+        from .platform import inotify
+
+        self._inotify_mod = inotify
+        self._filenames = frozenset(filenames)
+        self._interval = interval
+        self._inotify = inotify.Inotify()
+        self._dirs = {}
+        self._polled = {} # dirname: poll backend of its files
+        (self._wake_r, self._wake_w) = os.pipe()
+
+        self._mask = (
+            inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO |
+            inotify.IN_MOVED_FROM | inotify.IN_CREATE | inotify.IN_DELETE |
+            inotify.IN_ONLYDIR
+        )
+
+        try:
+            by_dir = {}
+            for name in self._filenames:
+                by_dir.setdefault(os.path.dirname(name), []).append(name)
+
+            for (dirname, names) in by_dir.items():
+                if not self._add_watch(dirname):
+                    self._polled[dirname] = _PollBackend(names, interval)
+        except:
+            self.close()
+            raise
+
+    def _add_watch(self, dirname):
+        """ Watch a directory, returning False if it can't be watched. """
+        try:
+            wd = self._inotify.add_watch(dirname, self._mask)
+        except OSError:
+            return False # Directory doesn't exist or can't be watched
+
+        self._dirs[wd] = dirname
+        return True
+
+    def _check_polled(self):
+        """ Return changes of polled files, watching directories that appeared. """
+        changed = set()
+        for (dirname, backend) in list(self._polled.items()):
+            changed.update(backend.check())
+            if os.path.isdir(dirname) and self._add_watch(dirname):
+                del self._polled[dirname]
+                # Catch changes between the check and the watch
+                changed.update(backend.check())
+
+        return changed
+
+    def wait(self, timeout):
+        """ Wait for events up to the timeout and return changed files. """
+        if self._polled and (timeout is None or timeout > self._interval):
+            timeout = self._interval
+
+        (ready, _, _) = select.select(
+            [self._inotify.fileno(), self._wake_r], [], [], timeout
+        )
+
+        if self._wake_r in ready:
+            os.read(self._wake_r, 512)
+
+        changed = set()
+        if self._inotify.fileno() in ready:
+            for (wd, mask, _, name) in self._inotify.read():
+                if mask & self._inotify_mod.IN_Q_OVERFLOW:
+                    changed.update(self._filenames)
+                    continue
+
+                dirname = self._dirs.get(wd)
+                if dirname is None or name is None:
+                    continue
+
+                filename = os.path.join(dirname, name)
+                if filename in self._filenames:
+                    changed.add(filename)
+
+        if self._polled:
+            changed.update(self._check_polled())
+
+        return changed
+
+    def wake(self):
+        """ Wake a thread blocked in wait. """
+        os.write(self._wake_w, b"\0")
+
+    def close(self):
+        """ Release the inotify instance and wake pipe. """
+        self._inotify.close()
+        for handle in (self._wake_r, self._wake_w):
+            try:
+                os.close(handle)
+            except OSError:
+                pass
+
+
+class FileWatcher:
+    """ Watch a set of files and report changes from a background thread.
+
+    On Linux, inotify is used to watch the directories containing the files so
+    no work is performed while nothing changes.  Elsewhere, or if inotify is
+    not available, the files are polled with stat.  Bursts of changes are
+    debounced: the callback is called only once no further changes have been
+    seen for the debounce period, with the set of all files changed during
+    the burst.
+
+    With inotify, files whose directory does not exist when the watcher is
+    started are polled until the directory is created.
+
+    An exception raised by the callback is passed to the error callback, or
+    printed if there is none, and the watcher keeps running.
+    """
+
+    def __init__(
+            self,
+            filenames: Iterable[str],
+            callback: Callable[[FrozenSet[str]], None],
+            debounce: float = 0.25,
+            interval: float = 1.0,
+            use_inotify: bool = True,
+            error_callback: Optional[Callable[[Exception], None]] = None
+    ):
+        """ Initialize the file watcher.
+
+        Parameters
+        ----------
+        filenames : Iterable[str]
+            The files to watch.
+        callback : Callable[[FrozenSet[str]], None]
+            Called from the watcher thread with the set of changed files.
+        debounce : float, default=0.25
+            The time in seconds with no changes before the callback is called.
+        interval : float, default=1.0
+            The time in seconds between checks when polling.
+        use_inotify : bool, default=True
+            Whether to use inotify if it is available.
+        error_callback : Optional[Callable[[Exception], None]], default=None
+            Called from the watcher thread with any exception raised by the
+            callback.
+        """
+        self._filenames = tuple(os.path.abspath(name) for name in filenames)
+        self._callback = callback
+        self._debounce = debounce
+        self._interval = interval
+        self._use_inotify = use_inotify
+        self._error_callback = error_callback
+        self._lock = threading.Lock()
+        self._thread = None
+        self._backend = None
+        self._stopped = False
+
+    @property
+    def running(self) -> bool:
+        """ Return whether the watcher thread is running. """
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def _create_backend(self):
+        """ Create the inotify backend if possible, else the poll backend. """
+        if self._use_inotify:
+            from .platform import inotify
+            if inotify.available():
+                try:
+                    return _InotifyBackend(self._filenames, self._interval)
+                except OSError:
+                    pass
+
+        return _PollBackend(self._filenames, self._interval)
+
+    def start(self):
+        """ Start watching the files. """
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._stopped = False
+            self._backend = self._create_backend()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="FileWatcher",
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """ Stop watching the files and wait for the watcher thread.
+
+        Parameters
+        ----------
+        timeout : Optional[float], default=None
+            The maximum time to wait for the thread to finish.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+
+            self._stopped = True
+            self._backend.wake()
+
+        if thread is not threading.current_thread():
+            thread.join(timeout)
+
+        with self._lock:
+            self._backend.close()
+            self._backend = None
+            self._thread = None
+
+    def _run(self):
+        """ Wait for changes and call the callback once they settle. """
+        backend = self._backend
+        pending = set()
+
+        while not self._stopped:
+            changed = backend.wait(self._debounce if pending else None)
+            if self._stopped:
+                break
+
+            if changed:
+                pending.update(changed)
+            elif pending:
+                (changes, pending) = (frozenset(pending), set())
+                try:
+                    self._callback(changes)
+                except Exception as ex: # pylint: disable=broad-except
+                    self._report(ex)
+
+    def _report(self, ex):
+        """ Report an exception from the callback without stopping. """
+        if self._error_callback is not None:
+            try:
+                self._error_callback(ex)
+                return
+            except Exception: # pylint: disable=broad-except
+                pass
+
+        import traceback
+        traceback.print_exception(type(ex), ex, ex.__traceback__)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,298 @@
+""" Tests for mrbaviirc.common.app """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import threading
+
+import pytest
+
+from mrbaviirc.common.app import BaseApp, App
+
+
+class DerivedApp(BaseApp):
+
+    @property
+    def appname(self):
+        return "Test"
+
+
+def test_phases():
+    """ Test startup steps run in dependency order and are timed. """
+    app = DerivedApp()
+
+    lock = threading.Lock()
+    order = []
+    def step(name):
+        def run():
+            with lock:
+                order.append(name)
+        return run
+
+    app.add_startup_step("config", step("config"))
+    app.add_startup_step("db", step("db"), depends=["config"])
+    app.add_startup_step("cache", step("cache"), depends=["config"])
+    app.add_startup_step("web", step("web"), depends=["db", "cache"])
+    app.add_shutdown_step("web", step("web-stop"))
+
+    reports = []
+    app.hooks.register(app.HOOK_PHASE, lambda app, phase, timings: reports.append((phase, timings)))
+
+    app.startup()
+    assert order[0] == "config"
+    assert set(order[1:3]) == {"db", "cache"}
+    assert order[3] == "web"
+
+    assert reports[0][0] == "startup"
+    assert set(reports[0][1]) == {"config", "db", "cache", "web"}
+    assert app.startup_phase.elapsed >= 0.0
+
+    app.shutdown()
+    assert order[4] == "web-stop"
+    assert reports[1][0] == "shutdown"
+
+    with pytest.raises(ValueError):
+        app.add_startup_step("web", step("web"))
+
+
+def test_phase_errors():
+    """ Test errors from steps are raised and still reported. """
+    app = DerivedApp()
+
+    def broken():
+        raise RuntimeError("broken")
+
+    app.add_startup_step("broken", broken)
+    app.add_startup_step("other", lambda: None)
+    app.add_startup_step("after", lambda: None, depends=["broken"])
+
+    reports = []
+    app.hooks.register(app.HOOK_PHASE, lambda app, phase, timings: reports.append(timings))
+
+    with pytest.raises(RuntimeError):
+        app.startup()
+    assert set(reports[0]) == {"broken", "other"}
+
+    app.add_shutdown_step("stop", lambda: None, depends=["missing"])
+    with pytest.raises(KeyError):
+        app.shutdown()
+
+
+def test_commands(tmp_path, capsys):
+    """ Test subcommand modules are only imported when selected. """
+    import sys
+
+    package = tmp_path / "lazycommands"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "fast.py").write_text(
+        "def add_arguments(parser):\n"
+        "    parser.add_argument('--count', type=int, default=1)\n"
+        "def main(app, args):\n"
+        "    return args.count * 2\n"
+    )
+    (package / "slow.py").write_text("raise ImportError('slow imported')\n")
+
+    class CommandApp(App):
+        appname = "Test"
+
+        def __init__(self):
+            App.__init__(self)
+            self.register_command("fast", "lazycommands.fast", "A fast command")
+            self.register_command("slow", ".slow", "A slow command", "lazycommands")
+
+        def create_arg_parser(self):
+            parser = App.create_arg_parser(self)
+            parser.add_argument("--verbose", action="store_true")
+            return parser
+
+    sys.path.insert(0, str(tmp_path))
+    try:
+        app = CommandApp()
+        args = app.args = app.parse_args(app.create_arg_parser(), ["--verbose", "fast", "--count", "5"])
+        assert args.verbose
+        assert args.count == 5
+        assert app.command == "fast"
+        assert app.main() == 10
+        assert "lazycommands.slow" not in sys.modules
+
+        app = CommandApp()
+        with pytest.raises(SystemExit):
+            app.parse_args(app.create_arg_parser(), ["--help"])
+        assert "A slow command" in capsys.readouterr().out
+
+        app = CommandApp()
+        with pytest.raises(SystemExit):
+            app.parse_args(app.create_arg_parser(), ["fast", "--help"])
+        assert "--count" in capsys.readouterr().out
+        assert "lazycommands.slow" not in sys.modules
+
+        app = CommandApp()
+        with pytest.raises(SystemExit):
+            app.parse_args(app.create_arg_parser(), [])
+
+        app = CommandApp()
+        with pytest.raises(ImportError):
+            app.parse_args(app.create_arg_parser(), ["slow"])
+    finally:
+        sys.path.remove(str(tmp_path))
+        for name in ("lazycommands", "lazycommands.fast"):
+            sys.modules.pop(name, None)
+
+
+def test_prefork(tmp_path):
+    """ Test running main in supervised worker processes. """
+    import os
+
+    marker = tmp_path / "failed"
+    results = tmp_path / "results"
+    results.mkdir()
+
+    class WorkerApp(App):
+        appname = "Test"
+
+        def create_arg_parser(self):
+            return None
+
+        def startup(self):
+            App.startup(self)
+            self.preloaded = "shared"
+
+        def main(self):
+            # Worker 1 fails the first time and is restarted
+            if self.worker_index == 1 and not marker.exists():
+                marker.write_text("")
+                return 3
+            (results / str(self.worker_index)).write_text(
+                "{} {}".format(self.preloaded, os.getpid())
+            )
+            return 0
+
+        def shutdown(self):
+            App.shutdown(self)
+            self.shutdown_pid = os.getpid()
+
+    app = WorkerApp()
+    assert app.execute_prefork(workers=3, respawn_delay=0) == 0
+    assert app.shutdown_pid == os.getpid()
+    assert sorted(os.listdir(str(results))) == ["0", "1", "2"]
+    assert all((results / name).read_text().startswith("shared ") for name in "012")
+
+    # Without respawn the failure is reported
+    marker.unlink()
+    app = WorkerApp()
+    assert app.execute_prefork(workers=2, respawn=False) == 3
+
+
+def test_prefork_async(tmp_path):
+    """ Test coroutine methods of pre-forked workers are run. """
+    import asyncio
+    import os
+
+    results = tmp_path / "results"
+    results.mkdir()
+
+    class AsyncWorkerApp(App):
+        appname = "Test"
+
+        def create_arg_parser(self):
+            return None
+
+        async def startup(self):
+            App.startup(self)
+            self.preloaded = "shared"
+
+        async def main(self):
+            await asyncio.sleep(0)
+            (results / str(self.worker_index)).write_text(
+                "{} {}".format(self.preloaded, os.getpid())
+            )
+            return 4 if self.worker_index else 0
+
+    app = AsyncWorkerApp()
+    assert app.execute_prefork(workers=2, respawn=False) == 4
+    assert sorted(os.listdir(str(results))) == ["0", "1"]
+    assert (results / "0").read_text().startswith("shared ")
+
+
+def test_prefork_stop():
+    """ Test workers are terminated on SIGTERM. """
+    import os
+    import signal
+    import time
+
+    from mrbaviirc.common.prefork import PreforkSupervisor
+
+    supervisor = PreforkSupervisor(lambda index: time.sleep(30), 2)
+    timer = threading.Timer(0.2, lambda: os.kill(os.getpid(), signal.SIGTERM))
+    timer.start()
+    try:
+        assert supervisor.run() == 0
+    finally:
+        timer.cancel()
+    assert supervisor.exit_codes == {0: -signal.SIGTERM, 1: -signal.SIGTERM}
+
+
+def test_async_main():
+    """ Test coroutine main methods run on a managed event loop. """
+    import asyncio
+
+    events = []
+
+    class AsyncApp(App):
+        appname = "Test"
+        executor_workers = 2
+
+        def create_arg_parser(self):
+            return None
+
+        async def main(self):
+            loop = asyncio.get_event_loop()
+            events.append(await loop.run_in_executor(None, lambda: "executor"))
+            await asyncio.sleep(0)
+            events.append("main")
+
+        async def shutdown(self):
+            App.shutdown(self)
+            events.append("shutdown")
+
+    app = AsyncApp()
+    app.add_startup_step("step", lambda: events.append("startup"))
+
+    app.execute()
+    assert events == ["startup", "executor", "main", "shutdown"]
+
+
+def test_async_stop():
+    """ Test stopping an async main still shuts down. """
+    import asyncio
+
+    events = []
+
+    class AsyncApp(App):
+        appname = "Test"
+
+        def create_arg_parser(self):
+            return None
+
+        async def main(self):
+            await self.aget_singleton("pool")
+            self.stop()
+            await asyncio.sleep(30)
+            events.append("not reached")
+
+        def shutdown(self):
+            events.append("shutdown")
+
+    app = AsyncApp()
+
+    async def pool():
+        return "pool"
+    async def close_pool(obj):
+        events.append("closed")
+    app.register_singleton("pool", pool, teardown=close_pool)
+
+    app.execute()
+    assert events == ["shutdown", "closed"]
@@ -0,0 +1,247 @@
+""" Tests for mrbaviirc.common.mixin.service """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import threading
+import time
+
+import pytest
+
+from mrbaviirc.common.mixin.service import ServiceContainerMixin, ServicePool
+
+
+def test_register_singleton():
+    container = ServiceContainerMixin()
+
+    called = [0]
+    def db():
+        called[0] += 1
+        return object()
+    container.register_singleton("db", db)
+
+    assert called[0] == 0
+    obj = container.get_singleton("db")
+    assert called[0] == 1
+    assert container.get_singleton("db") is obj
+    assert called[0] == 1
+
+    container.clear_singleton("db")
+    assert container.get_singleton("db") is not obj
+    assert called[0] == 2
+
+    with pytest.raises(KeyError):
+        container.get_singleton("missing")
+
+
+def test_register_factory():
+    container = ServiceContainerMixin()
+
+    called = [0]
+    def db(value):
+        called[0] += 1
+        return value
+    container.register_factory("db", db)
+
+    assert container.call_factory("db", 100) == 100
+    assert container.call_factory("db", 200) == 200
+    assert called[0] == 2
+
+    with pytest.raises(KeyError):
+        container.call_factory("missing")
+
+
+def test_singleton_threads():
+    """ Test a slow singleton builds once and does not block other services. """
+    container = ServiceContainerMixin()
+
+    started = threading.Event()
+    release = threading.Event()
+    called = [0]
+
+    def slow():
+        called[0] += 1
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    container.register_singleton("slow", slow)
+    container.register_singleton("fast", lambda: "fast")
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(container.get_singleton("slow")))
+        for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+
+    assert started.wait(5)
+    assert container.get_singleton("fast") == "fast"
+
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["slow"] * 5
+    assert called[0] == 1
+
+
+def test_warm_up():
+    """ Test constructing singletons in dependency order. """
+    container = ServiceContainerMixin()
+
+    lock = threading.Lock()
+    order = []
+
+    def factory(name, *depends):
+        def create():
+            for depend in depends:
+                assert container.get_singleton(depend) == depend
+            with lock:
+                order.append(name)
+            return name
+        return create
+
+    container.register_singleton("config", factory("config"))
+    container.register_singleton("db", factory("db", "config"), depends=["config"])
+    container.register_singleton("cache", factory("cache", "config"), depends=["config"])
+    container.register_singleton("web", factory("web", "db", "cache"), depends=["db", "cache"])
+    container.register_singleton("unused", factory("unused"))
+
+    container.warm_up(["web"], max_workers=2)
+
+    assert order[0] == "config"
+    assert set(order[1:3]) == {"db", "cache"}
+    assert order[3] == "web"
+    assert len(order) == 4
+
+    def broken():
+        raise ValueError("broken")
+    container.register_singleton("broken", broken, depends=["unused"])
+    with pytest.raises(ValueError):
+        container.warm_up()
+
+    with pytest.raises(KeyError):
+        container.warm_up(["missing"])
+
+
+def test_pool():
+    """ Test pooled services. """
+    container = ServiceContainerMixin()
+
+    created = []
+    destroyed = []
+    def parser():
+        created.append(object())
+        return created[-1]
+
+    container.register_pool("parser", parser, max_size=2, idle_timeout=60,
+                            destroy=destroyed.append)
+    pool = container.get_pool("parser")
+
+    with container.acquire_service("parser") as parser1:
+        with container.acquire_service("parser") as parser2:
+            assert parser1 is not parser2
+            assert pool.size == 2
+            with pytest.raises(TimeoutError):
+                pool.acquire(timeout=0.01)
+        assert pool.idle == 1
+
+    # Instances are reused, the most recently released first
+    with container.acquire_service("parser") as parser3:
+        assert parser3 is parser1
+    assert len(created) == 2
+
+    # A waiting thread gets the next released instance
+    instance1 = pool.acquire()
+    instance2 = pool.acquire()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(pool.acquire(timeout=5)))
+    thread.start()
+    pool.release(instance1)
+    thread.join()
+    assert results == [instance1]
+    pool.release(instance1)
+    pool.release(instance2, discard=True)
+    assert destroyed == [instance2]
+    assert pool.size == 1
+
+    pool.clear()
+    assert pool.size == 0
+    assert destroyed == [instance2, instance1]
+
+    # Idle instances are evicted
+    short_pool = ServicePool(object, idle_timeout=0.01, destroy=destroyed.append)
+    instance = short_pool.acquire()
+    short_pool.release(instance)
+    time.sleep(0.05)
+    assert short_pool.acquire() is not instance
+    assert destroyed[-1] is instance
+
+    container.unregister_pool("parser")
+    with pytest.raises(KeyError):
+        with container.acquire_service("parser"):
+            pass
+
+
+def test_async_singleton():
+    """ Test async singleton factories and teardown. """
+    import asyncio
+
+    container = ServiceContainerMixin()
+    called = []
+    closed = []
+
+    async def pool():
+        called.append("pool")
+        await asyncio.sleep(0.01)
+        return "pool"
+
+    async def close_pool(obj):
+        await asyncio.sleep(0)
+        closed.append(obj)
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise ValueError("broken")
+
+    container.register_singleton("pool", pool, teardown=close_pool)
+    container.register_singleton("cache", lambda: "cache", depends=["pool"],
+                                 teardown=closed.append)
+    container.register_singleton("broken", broken)
+
+    async def run():
+        results = await asyncio.gather(*[container.aget_singleton("pool") for i in range(5)])
+        assert results == ["pool"] * 5
+        assert called == ["pool"]
+        assert await container.aget_singleton("cache") == "cache"
+
+        results = await asyncio.gather(
+            *[container.aget_singleton("broken") for i in range(3)],
+            return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+
+        # Cancelling the first caller doesn't cancel the others
+        container.register_singleton("slow", pool)
+        first = asyncio.ensure_future(container.aget_singleton("slow"))
+        second = asyncio.ensure_future(container.aget_singleton("slow"))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "pool"
+        assert first.cancelled()
+        assert called == ["pool", "pool"]
+
+        await container.aclose_singletons()
+
+    asyncio.run(run())
+    assert closed == ["cache", "pool"]
+
+    with pytest.raises(TypeError):
+        container.get_singleton("pool")
+    with pytest.raises(TypeError):
+        container.set_service_singleton("pool", "pool")
+        container.close_singletons()
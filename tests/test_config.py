@@ -5,7 +5,11 @@ __copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
 __license__ = "Apache License 2.0"
 
 
-from mrbaviirc.common.config import Config
+import pytest
+
+from mrbaviirc.common.config import Config, ConfigFiles, ConfigSchema, ConfigError
+from mrbaviirc.common.watch import FileWatcher
+from mrbaviirc.common.constants import SENTINEL
 
 
 def _cb():
@@ -77,3 +81,222 @@ def test_nested():
     assert c.get("nestkey1") == [
         "one", "two", ("three", "value", {"key": 5, "key2": ["1", "2", "value"]})
     ]
+
+
+def test_changes():
+    """ Test change notifications and batching. """
+
+    c = Config()
+    events = []
+    c.hooks.register(Config.HOOK_CHANGED, lambda config, changes: events.append(changes))
+
+    c.set("key1", "value1")
+    assert events == [{("config", "key1"): (SENTINEL, "value1")}]
+
+    # Setting the same value is not a change
+    c.set("key1", "value1")
+    assert len(events) == 1
+
+    del events[:]
+    with c.batch():
+        c.set("key1", "value2")
+        c.set("key1", "value3")
+        c.update({"key2": 2, "key3": 3}, "extra")
+        c.set("key3", "temp", "extra")
+        c.set("key3", 3, "extra")
+        assert events == []
+
+    assert events == [{
+        ("config", "key1"): ("value1", "value3"),
+        ("extra", "key2"): (SENTINEL, 2),
+        ("extra", "key3"): (SENTINEL, 3)
+    }]
+
+    # Reverting a value within a batch produces no event
+    del events[:]
+    with c.batch():
+        c.set("key1", "value4")
+        c.set("key1", "value3")
+    assert events == []
+
+
+def _write_json(filename, data):
+    import json
+    with open(filename, "wt") as handle:
+        json.dump(data, handle)
+
+
+def _wait_for(func, timeout=5.0):
+    import time
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if func():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_files(tmp_path):
+    """ Test loading and reloading configuration files. """
+
+    sys_file = str(tmp_path / "sys.json")
+    user_file = str(tmp_path / "user.json")
+    _write_json(sys_file, {"key1": "sys1", "key2": "sys2"})
+
+    c = Config()
+    files = ConfigFiles(c)
+    files.add(sys_file)
+    files.add(user_file)
+    files.load()
+
+    assert c.get("key1") == "sys1"
+    assert c.get("key2") == "sys2"
+
+    events = []
+    c.hooks.register(Config.HOOK_CHANGED, lambda config, changes: events.append(changes))
+
+    _write_json(user_file, {"key1": "user1"})
+    files.reload([user_file])
+    assert c.get("key1") == "user1"
+    assert events == [{("config", "key1"): ("sys1", "user1")}]
+
+    # Parse errors keep the previous values
+    errors = []
+    c.hooks.register(ConfigFiles.HOOK_ERROR, lambda filename, ex: errors.append(filename))
+    with open(user_file, "wt") as handle:
+        handle.write("{")
+    files.reload()
+    assert errors == [user_file]
+    assert c.get("key1") == "user1"
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watch(tmp_path, use_inotify):
+    """ Test watching files for changes. """
+
+    filename = str(tmp_path / "config.json")
+    _write_json(filename, {"key1": 1})
+
+    changes = []
+    watcher = FileWatcher([filename], changes.append, debounce=0.05,
+                          interval=0.02, use_inotify=use_inotify)
+    with watcher:
+        assert watcher.running
+        for i in range(5):
+            _write_json(filename, {"key1": i})
+        assert _wait_for(lambda: changes)
+
+    assert not watcher.running
+    assert changes[0] == frozenset([filename])
+
+    c = Config()
+    files = ConfigFiles(c)
+    files.add(filename)
+    files.load()
+    files.watch(debounce=0.05, interval=0.02)
+    try:
+        _write_json(filename, {"key1": "changed"})
+        assert _wait_for(lambda: c.get("key1") == "changed")
+    finally:
+        files.unwatch()
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watch_errors(tmp_path, use_inotify):
+    """ Test the watcher survives callback errors and missing directories. """
+
+    filename = str(tmp_path / "missing" / "config.json")
+    calls = []
+    errors = []
+
+    def callback(changed):
+        calls.append(changed)
+        if len(calls) == 1:
+            raise RuntimeError("callback failed")
+
+    watcher = FileWatcher([filename], callback, debounce=0.05, interval=0.02,
+                          use_inotify=use_inotify, error_callback=errors.append)
+    with watcher:
+        (tmp_path / "missing").mkdir()
+        _write_json(filename, {"key1": 1})
+        assert _wait_for(lambda: errors)
+        assert watcher.running
+
+        _write_json(filename, {"key1": 2})
+        assert _wait_for(lambda: len(calls) == 2)
+
+    assert isinstance(errors[0], RuntimeError)
+
+    # Errors from change hooks during reload are reported, not raised
+    c = Config()
+    files = ConfigFiles(c)
+    files.add(filename)
+    files.load()
+
+    def failing_hook(config, changes):
+        raise RuntimeError("hook failed")
+
+    reported = []
+    c.hooks.register(Config.HOOK_CHANGED, failing_hook)
+    c.hooks.register(ConfigFiles.HOOK_ERROR, lambda name, ex: reported.append((name, ex)))
+    _write_json(filename, {"key1": 3})
+    files.reload()
+    assert c.get("key1") == 3
+    assert reported[0][0] is None
+    assert isinstance(reported[0][1], RuntimeError)
+
+
+def test_schema():
+    """ Test compiled schema accessors. """
+
+    c = Config()
+    c.set("worker.count", "8")
+
+    schema = ConfigSchema()
+    schema.add("worker_count", int, default=4, key="worker.count", validator=lambda v: v > 0)
+    schema.add("debug", bool, default=False, section="extra")
+    schema.add("name")
+
+    assert schema.compile() is schema.compile()
+
+    cfg = schema.bind(c)
+    assert cfg.worker_count == 8
+    assert cfg.debug is False
+    assert cfg.name is None
+
+    with pytest.raises(AttributeError):
+        cfg.other = 5
+
+    # Accessors reload on changes
+    with c.batch():
+        c.set("debug", "yes", "extra")
+        c.set("name", "test")
+    assert cfg.debug is True
+    assert cfg.name == "test"
+
+    # Invalid values are reported and keep the previous values
+    errors = []
+    later = []
+    c.hooks.register(ConfigSchema.HOOK_ERROR, lambda accessor, ex: errors.append((accessor, ex)))
+    c.hooks.register(Config.HOOK_CHANGED, lambda config, changes: later.append(changes))
+
+    c.set("worker.count", "0")
+    assert cfg.worker_count == 8
+    assert c.get("worker.count") == "0"
+    assert errors[0][0] is cfg
+    assert isinstance(errors[0][1], ConfigError)
+    assert later == [{("config", "worker.count"): ("8", "0")}]
+
+    c.set("worker.count", "none")
+    assert len(errors) == 2
+    assert len(later) == 2
+
+    # Binding raises for invalid values
+    with pytest.raises(ConfigError):
+        schema.bind(c)
+
+    c.set("worker.count", "3")
+    assert cfg.worker_count == 3
+
+    with pytest.raises(ValueError):
+        schema.add("name")
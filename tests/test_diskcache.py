@@ -0,0 +1,170 @@
+""" Tests for mrbaviirc.common.diskcache """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import hashlib
+import os
+
+from mrbaviirc.common.diskcache import DiskCache
+
+
+def test_get_set(tmp_path):
+    """ Test storing and reading values. """
+
+    cache = DiskCache(str(tmp_path / "cache"))
+    assert cache.get("missing") is None
+    assert cache.get("missing", b"default") == b"default"
+
+    cache.set("key", b"value")
+    cache.set(b"other", bytearray(b"other value"))
+    assert cache.get("key") == b"value"
+    assert cache.get(b"key") == b"value"
+    assert cache.get("other") == b"other value"
+    assert "key" in cache
+    assert cache.size == len(b"value") + len(b"other value") + 2
+
+    # Another instance sees the same values
+    other = DiskCache(str(tmp_path / "cache"))
+    assert other.get("key") == b"value"
+    assert other.size == cache.size
+
+    assert cache.delete("key")
+    assert not cache.delete("key")
+    assert "key" not in cache
+    assert other.get("key") is None
+
+    cache.clear()
+    assert cache.get("other") is None
+    assert cache.size == 0
+
+    # Files are sharded by the first byte of the key digest
+    cache.set("key", b"value")
+    digest = hashlib.sha1(b"key").hexdigest()
+    assert os.path.isfile(str(tmp_path / "cache" / digest[:2] / digest[2:]))
+
+
+def test_compress(tmp_path):
+    """ Test compressed values. """
+
+    cache = DiskCache(str(tmp_path), compress=True)
+    value = b"abc" * 1000
+    cache.set("key", value)
+    cache.set("short", b"x")
+
+    assert cache.get("key") == value
+    assert cache.get("short") == b"x"
+    assert cache.size < len(value)
+
+
+def test_evict(tmp_path):
+    """ Test least recently used values are evicted. """
+
+    cache = DiskCache(str(tmp_path), max_size=35)
+    cache.set("a", b"a" * 10)
+    cache.set("b", b"b" * 10)
+    cache.set("c", b"c" * 10)
+
+    # Reading a makes b the least recently used
+    assert cache.get("a") is not None
+    cache.set("d", b"d" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" * 10
+    assert cache.get("c") == b"c" * 10
+    assert cache.get("d") == b"d" * 10
+    assert cache.size <= 35
+
+    # The index is shared, another instance evicts with it
+    other = DiskCache(str(tmp_path), max_size=35)
+    other.set("e", b"e" * 10)
+    assert len([key for key in "abcde" if key in cache]) == 3
+
+
+def test_rebuild_index(tmp_path):
+    """ Test an unreadable index is rebuilt from the value files. """
+
+    directory = tmp_path / "cache"
+    cache = DiskCache(str(directory))
+    cache.set("a", b"a" * 10)
+    cache.set("b", b"b" * 20)
+
+    for corrupt in (None, b"", b"MDC", b"XXXX" + bytes(8), None):
+        index = directory / DiskCache.INDEX_NAME
+        if corrupt is None:
+            index.unlink()
+        else:
+            index.write_bytes(corrupt)
+
+        other = DiskCache(str(directory), max_size=35)
+        assert other.size == 32
+        assert other.get("a") == b"a" * 10
+
+    # Rebuilt values are evicted
+    other.set("c", b"c" * 5)
+    assert "b" not in other
+    assert other.size == 17
+
+    # A partially appended record
+    with open(str(directory / DiskCache.INDEX_NAME), "ab") as handle:
+        handle.write(b"partial")
+    assert DiskCache(str(directory)).size == 17
+
+
+def test_compact(tmp_path):
+    """ Test the index is compacted and stale temporary files removed. """
+
+    cache = DiskCache(str(tmp_path))
+    cache.COMPACT_MIN = 4
+    other = DiskCache(str(tmp_path))
+
+    for count in range(20):
+        cache.set("key", b"value %d" % count)
+        assert other.get("key") == b"value %d" % count
+        assert other.size == cache.size == 8 + (count >= 10)
+
+    index = tmp_path / DiskCache.INDEX_NAME
+    assert index.stat().st_size <= 12 + 32 * 7
+
+    digest = hashlib.sha1(b"key").hexdigest()
+    stale = tmp_path / digest[:2] / ".{}.1.1.tmp".format(digest[2:])
+    fresh = tmp_path / digest[:2] / ".{}.2.2.tmp".format(digest[2:])
+    stale_index = tmp_path / "index.1.tmp"
+    for path in (stale, stale_index, fresh):
+        path.write_bytes(b"partial")
+    os.utime(str(stale), (0, 0))
+    os.utime(str(stale_index), (0, 0))
+
+    for count in range(10):
+        cache.set("key", b"value")
+
+    assert not stale.exists()
+    assert not stale_index.exists()
+    assert fresh.exists()
+    assert other.size == cache.size == 6
+
+
+def test_instances_threads(tmp_path):
+    """ Test instances of one directory used from different threads. """
+    import threading
+
+    def run(name):
+        cache = DiskCache(str(tmp_path), max_size=3000)
+        for count in range(500):
+            cache.set("{}{}".format(name, count), b"x" * 99)
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in "abcd"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cache = DiskCache(str(tmp_path))
+    stored = sum(
+        entry.stat().st_size
+        for shard in os.scandir(str(tmp_path)) if shard.is_dir()
+        for entry in os.scandir(shard.path)
+    )
+    assert stored == cache.size <= 3000
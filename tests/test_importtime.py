@@ -0,0 +1,82 @@
+""" Tests that importing the package stays cheap for short-lived tools. """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _imported(statement):
+    """ Return the modules imported by a statement in a new interpreter. """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT
+    output = subprocess.check_output(
+        [
+            sys.executable, "-c",
+            statement + "\nimport sys\nprint('\\n'.join(sys.modules))"
+        ],
+        env=env,
+        universal_newlines=True
+    )
+    return set(output.split())
+
+
+def test_app_import():
+    """ Test importing and creating an app does not import heavy modules. """
+    modules = _imported(
+        "from mrbaviirc.common.app import App\n"
+        "class Tool(App):\n"
+        "    appname = 'tool'\n"
+        "Tool()"
+    )
+
+    for name in (
+            "argparse", "tempfile", "random", "shutil", "pkgutil",
+            "mrbaviirc.common.config", "mrbaviirc.common.hooks",
+            "mrbaviirc.common.registry", "mrbaviirc.common.path",
+            "mrbaviirc.common.platform"):
+        assert name not in modules
+
+
+def test_lazy_submodules():
+    """ Test submodules are imported when accessed from the package. """
+    import mrbaviirc.common
+    from mrbaviirc.common import pattern
+
+    assert mrbaviirc.common.text.dedent("  a ") == "a"
+    assert pattern.Signal is not None
+
+
+def test_path_import():
+    """ Test the platform path module is imported when first used. """
+    modules = _imported("import mrbaviirc.common.path")
+
+    for name in (
+            "tempfile", "threading", "shutil",
+            "mrbaviirc.common.platform.linuxpath",
+            "mrbaviirc.common.platform.commonpath"):
+        assert name not in modules
+
+    modules = _imported(
+        "from mrbaviirc.common.path import AppPaths\n"
+        "AppPaths('tool').user_data_dir"
+    )
+    assert "mrbaviirc.common.platform.linuxpath" in modules
+    assert "tempfile" not in modules
+
+
+def test_platform_fallback():
+    """ Test unknown platforms use the XDG path module. """
+    from mrbaviirc.common import platform
+
+    assert platform._path_module_name("linux") == "linuxpath" # pylint: disable=protected-access
+    assert platform._path_module_name("sunos5") == "linuxpath" # pylint: disable=protected-access
+    assert platform.path.get_user_data_dir is not None
+    assert "path" in dir(platform)
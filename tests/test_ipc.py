@@ -0,0 +1,147 @@
+""" Tests for mrbaviirc.common.ipc """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import os
+
+import pytest
+
+from mrbaviirc.common.ipc import IpcServer, IpcClient, SharedRingBuffer
+
+
+def test_server_client(tmp_path):
+    """ Test requests and responses over a socket. """
+
+    path = str(tmp_path / "test.sock")
+
+    with IpcServer(path, lambda request: bytes(request).upper()) as server:
+        assert server.running
+
+        with IpcClient(path, timeout=5.0) as client:
+            assert client.request(b"hello") == b"HELLO"
+            assert client.request(b"") == b""
+            assert client.request(b"x" * 100000) == b"X" * 100000
+
+        # A second server can't use the same socket
+        with pytest.raises(OSError):
+            IpcServer(path, lambda request: request).start()
+
+    assert not os.path.exists(path)
+
+    # A stale socket file is replaced
+    import socket
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    with IpcServer(path, lambda request: request):
+        with IpcClient(path, timeout=5.0) as client:
+            assert client.request(b"again") == b"again"
+
+
+def test_max_message(tmp_path):
+    """ Test connections sending too large a message are closed. """
+
+    path = str(tmp_path / "test.sock")
+
+    with IpcServer(path, lambda request: bytes(request) * 2, max_message=100):
+        with IpcClient(path, timeout=5.0, max_message=150) as client:
+            assert client.request(b"x" * 50) == b"x" * 100
+
+            # The server closes the connection on a large request
+            with pytest.raises(ConnectionError):
+                client.request(b"x" * 101)
+
+            # The client closes the connection on a large response
+            with pytest.raises(ConnectionError):
+                client.request(b"x" * 80)
+
+            assert client.request(b"y") == b"yy"
+
+
+def test_ring_buffer():
+    """ Test writing and reading messages in a ring buffer. """
+
+    ring = SharedRingBuffer(64)
+    try:
+        assert ring.capacity == 64
+        assert ring.get(timeout=0) is None
+
+        assert ring.put(b"a" * 20)
+        assert ring.put(b"b" * 20)
+        assert not ring.put(b"c" * 20, timeout=0.01)
+
+        assert ring.get() == b"a" * 20
+
+        # The next message doesn't fit before the end and wraps around
+        assert ring.put(b"c" * 20)
+        assert ring.get() == b"b" * 20
+        assert ring.get() == b"c" * 20
+
+        view = ring.reserve(5)
+        view[:] = b"hello"
+        view.release()
+        ring.commit()
+
+        view = ring.read()
+        assert view == b"hello"
+        assert view.readonly
+        view.release()
+        ring.release()
+
+        with pytest.raises(ValueError):
+            ring.put(b"x" * 64)
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_ring_buffer_large():
+    """ Test wrapping messages larger than half the capacity. """
+    import threading
+
+    ring = SharedRingBuffer(1024)
+    try:
+        assert ring.put(b"x" * 500)
+        assert ring.get() == b"x" * 500
+
+        # The reader frees the start of the buffer by skipping the padding
+        for size in (600, 700, 1000):
+            received = []
+            reader = threading.Thread(target=lambda: received.append(ring.get(timeout=5.0)))
+            reader.start()
+            try:
+                assert ring.put(b"y" * size, timeout=5.0)
+            finally:
+                reader.join()
+            assert received == [b"y" * size]
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_ring_buffer_fork():
+    """ Test passing messages between processes. """
+
+    ring = SharedRingBuffer(256)
+    try:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                with SharedRingBuffer.attach(ring.name) as child:
+                    for index in range(100):
+                        child.put(str(index).encode("ascii") * 10)
+                code = 0
+            finally:
+                os._exit(code) # pylint: disable=protected-access
+
+        messages = [ring.get(timeout=5.0) for _ in range(100)]
+        assert os.waitpid(pid, 0)[1] == 0
+        assert messages == [str(index).encode("ascii") * 10 for index in range(100)]
+    finally:
+        ring.close()
+        ring.unlink()
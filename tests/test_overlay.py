@@ -0,0 +1,113 @@
+""" Tests for mrbaviirc.common.overlay """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import mmap
+
+import pytest
+
+from mrbaviirc.common.overlay import OverlayFS
+from mrbaviirc.common.path import AppPaths
+
+
+@pytest.fixture
+def overlay(tmp_path):
+    """ Create an overlay of two layers. """
+
+    upper = tmp_path / "upper"
+    lower = tmp_path / "lower"
+    (upper / "sub").mkdir(parents=True)
+    (lower / "sub" / "deep").mkdir(parents=True)
+
+    (upper / "both.txt").write_text("upper")
+    (lower / "both.txt").write_text("lower")
+    (lower / "lower.txt").write_text("lower")
+    (upper / "sub" / "a.txt").write_text("a")
+    (lower / "sub" / "b.txt").write_text("b")
+    (lower / "sub" / "deep" / "c.txt").write_text("c")
+
+    return OverlayFS([str(upper), str(lower)], ttl=0.0)
+
+
+def test_lookup(overlay, tmp_path):
+    """ Test finding files through the layers. """
+
+    assert overlay.find("both.txt") == str(tmp_path / "upper" / "both.txt")
+    assert overlay.find("lower.txt") == str(tmp_path / "lower" / "lower.txt")
+    assert overlay.find("sub/deep/c.txt") == str(tmp_path / "lower" / "sub" / "deep" / "c.txt")
+    assert overlay.find("missing.txt") is None
+
+    assert overlay.exists("sub/b.txt")
+    assert overlay.isdir("sub/deep")
+    assert overlay.isdir("")
+    assert not overlay.isdir("both.txt")
+
+    with pytest.raises(ValueError):
+        overlay.find("../upper/both.txt")
+
+
+def test_listdir_walk(overlay):
+    """ Test listing merged directories. """
+
+    assert overlay.listdir() == ["both.txt", "lower.txt", "sub"]
+    assert overlay.listdir("sub") == ["a.txt", "b.txt", "deep"]
+
+    with pytest.raises(NotADirectoryError):
+        overlay.listdir("both.txt")
+
+    assert list(overlay.walk()) == [
+        ("", ["sub"], ["both.txt", "lower.txt"]),
+        ("sub", ["deep"], ["a.txt", "b.txt"]),
+        ("sub/deep", [], ["c.txt"])
+    ]
+
+    pruned = []
+    for (reldir, dirnames, _) in overlay.walk():
+        pruned.append(reldir)
+        dirnames[:] = [name for name in dirnames if name != "deep"]
+    assert pruned == ["", "sub"]
+
+
+def test_read(overlay, tmp_path):
+    """ Test reading files. """
+
+    with overlay.open("both.txt", "rt") as handle:
+        assert handle.read() == "upper"
+
+    assert overlay.read_bytes("sub/b.txt") == b"b"
+    assert overlay.stat("lower.txt").st_size == 5
+
+    with pytest.raises(ValueError):
+        overlay.open("both.txt", "wb")
+    with pytest.raises(FileNotFoundError):
+        overlay.read_bytes("missing.txt")
+    with pytest.raises(IsADirectoryError):
+        overlay.open("sub")
+
+    data = b"x" * OverlayFS.MMAP_THRESHOLD
+    (tmp_path / "lower" / "large.bin").write_bytes(data)
+    overlay.clear_cache()
+
+    mapped = overlay.read_bytes("large.bin")
+    assert isinstance(mapped, mmap.mmap)
+    assert mapped[:] == data
+    mapped.close()
+
+
+def test_from_app_paths(monkeypatch, tmp_path):
+    """ Test creating an overlay of application directories. """
+
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "user"))
+    monkeypatch.setenv("XDG_DATA_DIRS", str(tmp_path / "sys"))
+    (tmp_path / "user" / "app").mkdir(parents=True)
+    (tmp_path / "sys" / "app").mkdir(parents=True)
+    (tmp_path / "sys" / "app" / "file.txt").write_text("sys")
+
+    paths = AppPaths("app")
+    overlay = OverlayFS.from_app_paths(paths)
+
+    assert overlay.layers == (str(tmp_path / "user" / "app"), str(tmp_path / "sys" / "app"))
+    assert overlay.read_bytes("file.txt") == b"sys"
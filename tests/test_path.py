@@ -0,0 +1,108 @@
+""" Tests for mrbaviirc.common.path """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import os
+
+from mrbaviirc.common.path import AppPaths, DirectoryIndex
+
+
+def test_cached_paths(monkeypatch, tmp_path):
+    """ Test paths are cached until their environment changes. """
+
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "one"))
+    monkeypatch.setenv("XDG_DATA_DIRS", "/a:/b:/a")
+    paths = AppPaths("app", None, "vendor")
+
+    first = paths.user_data_dir
+    assert first == str(tmp_path / "one" / "vendor" / "app")
+    assert paths.user_data_dir is first
+
+    dirs = paths.sys_data_dirs
+    assert isinstance(dirs, tuple)
+    assert dirs == ("/a/vendor/app", "/b/vendor/app")
+    assert paths.sys_data_dirs is dirs
+
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "two"))
+    assert paths.user_data_dir == str(tmp_path / "two" / "vendor" / "app")
+    assert paths.sys_data_dirs is dirs
+
+    monkeypatch.setenv("XDG_DATA_DIRS", "/c")
+    assert paths.sys_data_dirs == ("/c/vendor/app",)
+
+    second = paths.user_data_dir
+    paths.clear_cache()
+    assert paths.user_data_dir == second
+    assert paths.user_data_dir is not second
+
+
+def test_directory_index(tmp_path):
+    """ Test finding files through a directory index. """
+
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "file.txt").write_text("data")
+    (tmp_path / "top.txt").write_text("data")
+
+    index = DirectoryIndex(str(tmp_path), ttl=0.0)
+    assert index.lookup("top.txt").name == "top.txt"
+    assert index.lookup("sub").is_dir()
+    assert index.lookup("sub/file.txt").path == str(tmp_path / "sub" / "file.txt")
+    assert index.lookup("sub/missing.txt") is None
+    assert index.lookup("top.txt/file.txt") is None
+    assert index.lookup("../top.txt") is None
+    assert sorted(index.entries()) == ["sub", "top.txt"]
+
+    (tmp_path / "sub" / "new.txt").write_text("data")
+    os.utime(str(tmp_path / "sub"), ns=(0, 0))
+    assert index.lookup("sub/new.txt") is not None
+
+    missing = DirectoryIndex(str(tmp_path / "missing"))
+    assert missing.entries() == {}
+    assert missing.lookup("file.txt") is None
+
+
+def test_directory_index_ttl(tmp_path):
+    """ Test changes are not seen until the ttl expires. """
+
+    index = DirectoryIndex(str(tmp_path), ttl=3600.0)
+    assert index.lookup("file.txt") is None
+
+    (tmp_path / "file.txt").write_text("data")
+    assert index.lookup("file.txt") is None
+
+    index.invalidate()
+    assert index.lookup("file.txt") is not None
+
+
+def test_find(monkeypatch, tmp_path):
+    """ Test finding files in the data and config directories. """
+
+    for name in ("user", "sys1", "sys2"):
+        (tmp_path / name / "app").mkdir(parents=True)
+
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "user"))
+    monkeypatch.setenv("XDG_DATA_DIRS", "{0}/sys1:{0}/sys2".format(tmp_path))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "user"))
+    monkeypatch.setenv("XDG_CONFIG_DIRS", "{0}/sys2".format(tmp_path))
+
+    (tmp_path / "sys1" / "app" / "both.txt").write_text("data")
+    (tmp_path / "sys2" / "app" / "both.txt").write_text("data")
+    (tmp_path / "user" / "app" / "user.txt").write_text("data")
+
+    paths = AppPaths("app")
+    paths.index_ttl = 0.0
+
+    assert paths.find_data("both.txt") == str(tmp_path / "sys1" / "app" / "both.txt")
+    assert paths.find_all_data("both.txt") == [
+        str(tmp_path / "sys1" / "app" / "both.txt"),
+        str(tmp_path / "sys2" / "app" / "both.txt")
+    ]
+    assert paths.find_data("user.txt") == str(tmp_path / "user" / "app" / "user.txt")
+    assert paths.find_data("missing.txt") is None
+    assert paths.find_all_data("missing.txt") == []
+
+    assert paths.find_config("both.txt") == str(tmp_path / "sys2" / "app" / "both.txt")
+    assert paths.find_all_config("user.txt") == [str(tmp_path / "user" / "app" / "user.txt")]
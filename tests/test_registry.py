@@ -0,0 +1,143 @@
+""" Tests for mrbaviirc.common.registry """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+from mrbaviirc.common.registry import ObjectRegistry
+
+
+def test_register_get():
+    """ Test registering and looking up objects. """
+
+    r = ObjectRegistry()
+    r.register("plugins", 1, "one")
+    r.register("plugins", 2)
+    r.register("plugins", 3, "one")
+    r.register("other", 4, "one")
+
+    assert r.get("plugins") == (1, 2, 3)
+    assert r.get("plugins", "one") == (1, 3)
+    assert r.get("plugins", "two") == ()
+    assert r.get("missing") == ()
+    assert r.get("other", "one") == (4,)
+
+    assert r.first("plugins") == 1
+    assert r.last("plugins") == 3
+    assert r.first("plugins", "one") == 1
+    assert r.last("plugins", "one") == 3
+    assert r.first("plugins", "two") is None
+    assert r.last("missing") is None
+
+
+def test_cache():
+    """ Test cached results are reused and invalidated on register. """
+
+    r = ObjectRegistry()
+    r.register("plugins", 1, "one")
+
+    results = r.get("plugins", "one")
+    assert r.get("plugins", "one") is results
+
+    r.register("plugins", 2, "one")
+    assert r.get("plugins", "one") == (1, 2)
+    assert r.get("plugins") == (1, 2)
+
+
+class _Plugin:
+    pass
+
+
+def test_unregister_replace():
+    """ Test removing and replacing objects. """
+
+    r = ObjectRegistry()
+    r.register_many("plugins", [("one", 1), (None, 2), ("one", 3), ("two", 4)])
+    assert r.get("plugins") == (1, 2, 3, 4)
+    assert r.get("plugins", "one") == (1, 3)
+
+    assert r.unregister("plugins", 3) == 1
+    assert r.get("plugins", "one") == (1,)
+
+    assert r.replace("plugins", 5, "two") == 1
+    assert r.replace("plugins", 6, "three") == 0
+    assert r.get("plugins") == (1, 2, 5, 6)
+
+    r.register("plugins", 7, "one")
+    assert r.replace("plugins", 8, "one") == 2
+    assert r.get("plugins") == (8, 2, 5, 6)
+
+    assert r.unregister("plugins", name="missing") == 0
+    assert r.unregister("plugins", name="two") == 1
+    assert r.unregister("plugins") == 3
+    assert r.get("plugins") == ()
+    assert r.first("plugins") is None
+
+
+def test_weak():
+    """ Test weakly registered objects are removed. """
+
+    r = ObjectRegistry()
+    plugin1 = _Plugin()
+    plugin2 = _Plugin()
+    r.register("plugins", plugin1, "one", weak=True)
+    r.register_many("plugins", [("one", plugin2)], weak=True)
+
+    assert r.get("plugins", "one") == (plugin1, plugin2)
+    assert r.first("plugins") is plugin1
+    assert r.unregister("plugins", plugin2) == 1
+
+    r.register("plugins", plugin2, "one", weak=True)
+    plugin1 = None
+    assert r.get("plugins", "one") == (plugin2,)
+    assert r.first("plugins", "one") is plugin2
+
+    plugin2 = None
+    assert r.get("plugins") == ()
+    assert r.last("plugins") is None
+
+    r.register("plugins", 1)
+    assert r._registry["plugins"].entries == [(None, 1)]
+
+
+def test_lazy(tmp_path):
+    """ Test lazily imported references. """
+
+    import sys
+
+    package = tmp_path / "lazyplugins"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "one.py").write_text("class Plugin:\n    pass\n")
+    (package / "two.py").write_text("class Plugin:\n    pass\n")
+    (package / "broken.py").write_text("raise ImportError('broken')\n")
+
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(
+        "[plugins]\n"
+        "two = lazyplugins.two:Plugin\n"
+        "broken = lazyplugins.broken:Plugin\n"
+    )
+
+    sys.path.insert(0, str(tmp_path))
+    try:
+        r = ObjectRegistry()
+        r.register_lazy("plugins", "lazyplugins.one:Plugin", "one")
+        assert r.load_manifest(str(manifest)) == 2
+
+        plugin = r.first("plugins", "one")
+        assert plugin.__name__ == "Plugin"
+        assert plugin.__module__ == "lazyplugins.one"
+        assert "lazyplugins.two" not in sys.modules
+
+        assert r.get("plugins", "one") == (plugin,)
+        assert r.get("plugins", "one") is r.get("plugins", "one")
+
+        assert r.last("plugins", "two").__module__ == "lazyplugins.two"
+        assert r.unregister("plugins", name="broken") == 1
+        assert len(r.get("plugins")) == 2
+    finally:
+        sys.path.remove(str(tmp_path))
+        for name in ("lazyplugins", "lazyplugins.one", "lazyplugins.two"):
+            sys.modules.pop(name, None)
@@ -0,0 +1,122 @@
+""" Tests for mrbaviirc.common.tempdir """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+import os
+
+import pytest
+
+from mrbaviirc.common.tempdir import TempArea, QuotaExceededError, get_temp_area
+from mrbaviirc.common.platform import linuxpath
+
+
+def test_area(tmp_path):
+    """ Test creating and cleaning up the process directory. """
+
+    area = TempArea(str(tmp_path), prefix="test")
+    assert area.root == str(tmp_path / "test-{}".format(os.getuid()))
+
+    directory = area.directory
+    assert os.path.isdir(directory)
+    assert os.path.dirname(directory) == area.root
+    assert area.directory == directory
+
+    sub = area.mkdtemp()
+    assert os.path.dirname(sub) == directory
+    assert area.mkdir("run") == os.path.join(directory, "run")
+
+    filename = area.write_bytes(b"data")
+    with open(filename, "rb") as handle:
+        assert handle.read() == b"data"
+
+    area.cleanup()
+    assert not os.path.exists(directory)
+
+
+def test_reap(tmp_path):
+    """ Test directories of exited processes are removed. """
+
+    area = TempArea(str(tmp_path), prefix="test")
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            area.mkdir("child")
+        finally:
+            os._exit(0) # pylint: disable=protected-access
+    os.waitpid(pid, 0)
+
+    children = os.listdir(area.root)
+    assert len(children) == 1
+    assert children[0].startswith("{}-".format(pid))
+
+    # A live directory is not reaped
+    directory = area.directory
+    other = TempArea(str(tmp_path), prefix="test")
+    assert other.reap() == []
+    assert os.listdir(area.root) == [os.path.basename(directory)]
+
+    area.cleanup()
+
+
+def test_quota(tmp_path):
+    """ Test the quota is enforced. """
+
+    area = TempArea(str(tmp_path), quota=10)
+    area.write_bytes(b"x" * 6)
+    assert area.usage() == 6
+
+    with pytest.raises(QuotaExceededError):
+        area.write_bytes(b"x" * 6)
+
+    area.write_bytes(b"x" * 4)
+    with pytest.raises(QuotaExceededError):
+        area.mkdtemp()
+
+    area.quota = None
+    area.mkdtemp()
+    area.cleanup()
+
+
+def test_staging(tmp_path):
+    """ Test directories being created are only reaped once old. """
+
+    area = TempArea(str(tmp_path), prefix="test")
+    os.makedirs(area.root)
+    fresh = os.path.join(area.root, ".new-1-fresh")
+    stale = os.path.join(area.root, ".new-1-stale")
+    os.mkdir(fresh)
+    os.mkdir(stale)
+    os.utime(stale, (0, 0))
+
+    directory = area.directory
+    assert sorted(os.listdir(area.root)) == sorted([".new-1-fresh", os.path.basename(directory)])
+    assert os.path.basename(directory).startswith("{}-".format(os.getpid()))
+    area.cleanup()
+
+
+def test_runtime_dir(tmp_path, monkeypatch):
+    """ Test the runtime directory falls back to the temporary area. """
+
+    area = TempArea(str(tmp_path), prefix="test")
+    runtime = area.runtime_dir
+    assert runtime == os.path.join(area.root, "run")
+    assert os.stat(runtime).st_mode & 0o777 == 0o700
+
+    # It is shared by processes and not reaped
+    area.directory # pylint: disable=pointless-statement
+    area.cleanup()
+    assert TempArea(str(tmp_path), prefix="test").reap() == []
+    assert os.path.isdir(runtime)
+
+    os.chmod(runtime, 0o755)
+    with pytest.raises(OSError):
+        area.runtime_dir # pylint: disable=pointless-statement
+
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    runtime = linuxpath.get_runtime_dir("app")
+    assert os.path.dirname(runtime) == get_temp_area().runtime_dir
+    assert os.path.basename(runtime) == "app"
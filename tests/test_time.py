@@ -0,0 +1,332 @@
+""" Tests for mrbaviirc.common.time """
+
+__author__ = "Brian Allen Vanderburg II"
+__copyright__ = "Copyright (C) 2019 Brian Allen Vanderburg II"
+__license__ = "Apache License 2.0"
+
+
+from array import array
+import json
+import threading
+
+import pytest
+
+from mrbaviirc.common.time import (
+    StopWatch, LapStopWatch, Histogram, ConcurrentHistogram, timed,
+    Profiler, profile, enable_profiling, get_profiler
+)
+
+
+def test_stopwatch():
+    """ Test the elapsed time of a stopwatch. """
+
+    watch = StopWatch(elapsed=1.0)
+    assert not watch
+    assert watch.time == 1.0
+
+    with watch:
+        assert watch
+    assert watch.time > 1.0
+    assert watch.reset() > 1.0
+    assert watch.time == 0.0
+
+
+def test_lap_stopwatch():
+    """ Test recording laps. """
+
+    watch = LapStopWatch()
+    assert watch.lap() == 0
+    assert watch.stats()["count"] == 0
+    assert watch.percentile(50) == 0
+
+    for _ in range(10):
+        with watch:
+            pass
+
+    watch.start()
+    assert watch.lap() > 0
+    watch.stop()
+
+    laps = watch.laps
+    assert isinstance(laps, array)
+    assert len(laps) == 12
+    assert watch.time_ns == sum(laps)
+    assert watch.time == sum(laps) / 1e9
+
+    stats = watch.stats()
+    assert stats["count"] == 12
+    assert stats["total"] == sum(laps)
+    assert stats["min"] == min(laps)
+    assert stats["max"] == max(laps)
+    assert stats["min"] <= stats["p50"] <= stats["p90"] <= stats["p99"] <= stats["max"]
+    assert watch.percentile(100) == max(laps)
+    assert watch.percentile(0) == min(laps)
+
+    watch.reset()
+    assert len(watch.laps) == 0
+    assert watch.time_ns == 0
+
+
+def test_histogram():
+    """ Test recording values and percentiles of a histogram. """
+
+    hist = Histogram(precision=7)
+    assert hist.percentile(50) == 0
+    assert hist.mean == 0.0
+
+    for value in range(1, 10001):
+        hist.record(value)
+
+    assert hist.count == len(hist) == 10000
+    assert hist.total == sum(range(1, 10001))
+    assert (hist.min, hist.max) == (1, 10000)
+
+    # Within the relative error of the precision
+    for percent in (50, 90, 99, 99.9):
+        expected = percent * 100
+        assert abs(hist.percentile(percent) - expected) <= expected / 64
+    assert hist.percentile(100) == 10000
+    assert hist.percentile(0) == 1
+
+    # Small values are exact, large values are clamped
+    small = Histogram()
+    small.record(-5)
+    small.record(3, count=4)
+    assert small.percentile(10) == 0
+    assert small.percentile(90) == 3
+    assert small.count == 5
+
+    large = Histogram(precision=4, max_bits=10)
+    large.record(5000)
+    assert large.max == 5000
+    assert large.percentile(50) == 5000
+
+
+def test_histogram_merge():
+    """ Test merging and exporting histograms. """
+
+    first = Histogram()
+    second = Histogram()
+    first.record(10)
+    second.record(1000)
+    second.record(5)
+
+    merged = first.copy()
+    merged.merge(second)
+    assert merged.count == 3
+    assert (merged.min, merged.max) == (5, 1000)
+    assert first.count == 1
+
+    with pytest.raises(ValueError):
+        merged.merge(Histogram(precision=5))
+
+    snapshot = json.loads(merged.to_json())
+    assert snapshot["count"] == 3
+    assert snapshot["p50"] == 10
+    assert "p999" in snapshot
+    assert sum(bucket[2] for bucket in snapshot["buckets"]) == 3
+    assert merged.to_text().startswith("count=3 min=5 max=1000")
+
+    merged.clear()
+    assert merged.count == 0
+    assert merged.snapshot()["buckets"] == []
+
+
+def test_concurrent_histogram():
+    """ Test recording from multiple threads. """
+
+    hist = ConcurrentHistogram()
+
+    @timed(hist)
+    def work(value):
+        return value * 2
+
+    def run():
+        for value in range(1000):
+            hist.record(value)
+            work(value)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert work(2) == 4
+    merged = hist.merged()
+    assert merged.count == 8001
+    assert hist.snapshot()["count"] == 8001
+
+    hist.clear()
+    assert hist.merged().count == 0
+
+    # Merging while another thread records and clears
+    stop = threading.Event()
+
+    def churn():
+        while not stop.is_set():
+            hist.record(5)
+            hist.clear()
+
+    thread = threading.Thread(target=churn)
+    thread.start()
+    try:
+        for _ in range(2000):
+            merged = hist.merged()
+            assert merged.min in (0, 5)
+    finally:
+        stop.set()
+        thread.join()
+
+    # A histogram cleared during a merge adds no bounds
+    cleared = Histogram()
+    cleared.record(5)
+    cleared._min = cleared._max = None # pylint: disable=protected-access
+    merged = Histogram()
+    merged.merge(cleared)
+    assert merged.count == 1
+    assert merged.min == 0
+
+
+def test_lap_stopwatch_histogram():
+    """ Test recording laps to a histogram. """
+
+    hist = Histogram()
+    watch = LapStopWatch(histogram=hist, keep_laps=False)
+    for _ in range(5):
+        with watch:
+            pass
+
+    assert hist.count == 5
+    assert len(watch.laps) == 0
+    assert hist.total == watch.time_ns
+
+
+def test_profiler():
+    """ Test recording nested spans. """
+
+    profiler = Profiler()
+    outer = profiler.span("outer")
+    inner = profiler.span("inner")
+    assert profiler.span("outer") is outer
+
+    @inner
+    def work():
+        with StopWatch(True) as watch:
+            while watch.time < 0.001:
+                pass
+
+    # Nothing is recorded while disabled
+    with outer:
+        work()
+    assert profiler.results() == {}
+
+    profiler.enabled = True
+    for _ in range(2):
+        with outer:
+            work()
+            work()
+    with inner:
+        pass
+
+    results = profiler.results()
+    assert set(results) == {("outer",), ("outer", "inner"), ("inner",)}
+    assert results[("outer",)][0] == 2
+    assert results[("outer", "inner")][0] == 4
+    assert results[("inner",)][0] == 1
+
+    (_, outer_total, outer_self) = results[("outer",)]
+    (_, inner_total, inner_self) = results[("outer", "inner")]
+    assert inner_total == inner_self >= 4000000
+    assert outer_self == outer_total - inner_total
+
+    lines = profiler.collapsed().splitlines()
+    assert [line.split()[0] for line in lines] == ["inner", "outer", "outer;inner"]
+    assert int(lines[2].split()[1]) == inner_self // 1000
+
+    profiler.clear()
+    assert profiler.results() == {}
+
+
+def test_profiler_toggle():
+    """ Test enabling and disabling while the same span is active. """
+
+    profiler = Profiler()
+    span = profiler.span("span")
+
+    def recurse(depth):
+        profiler.enabled = depth % 2 == 0
+        with span:
+            if depth:
+                recurse(depth - 1)
+        profiler.enabled = True
+
+    for depth in range(6):
+        profiler.enabled = False
+        recurse(depth)
+        with span:
+            pass
+        assert not profiler._local.stack # pylint: disable=protected-access
+        assert profiler._local.skipped == 0 # pylint: disable=protected-access
+
+    results = profiler.results()
+    paths = {("span",) * depth: results[("span",) * depth][0] for depth in range(1, 4)}
+    assert paths == {("span",): 12, ("span", "span"): 4, ("span", "span", "span"): 2}
+
+
+def test_profiler_threads(tmp_path):
+    """ Test spans of different threads are merged by path. """
+
+    profiler = Profiler(True)
+    span = profiler.span("task")
+
+    def run():
+        for _ in range(100):
+            with span:
+                pass
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert profiler.results()[("task",)][0] == 400
+
+    filename = str(tmp_path / "profile.folded")
+    profiler.dump_collapsed(filename)
+    with open(filename, "rt") as handle:
+        assert handle.read().startswith("task ")
+
+
+def test_profile():
+    """ Test the global profile decorator and context manager. """
+
+    @profile
+    def first():
+        return 1
+
+    @profile("custom")
+    def second():
+        with profile("block"):
+            return 2
+
+    profiler = get_profiler()
+    profiler.clear()
+    try:
+        assert first() == 1
+        assert profiler.results() == {}
+
+        enable_profiling()
+        assert first() == 1
+        assert second() == 2
+    finally:
+        enable_profiling(False)
+
+    results = profiler.results()
+    profiler.clear()
+    assert set(results) == {
+        (__name__ + ".test_profile.<locals>.first",),
+        ("custom",),
+        ("custom", "block")
+    }